@@ -0,0 +1,41 @@
+"""Add composite index for keyset pagination of tasks
+
+Revision ID: b3c1d2e4f5a6
+Revises: 9092f826314a
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3c1d2e4f5a6'
+down_revision: Union[str, None] = '9092f826314a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Build without locking writes on large tables
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_Tasks_user_id_id',
+            'Tasks',
+            ['user_id', 'id'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_Tasks_user_id_id',
+            table_name='Tasks',
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,78 @@
+"""Add full-text and trigram search over tasks
+
+Revision ID: c4d5e6f7a8b9
+Revises: b3c1d2e4f5a6
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d5e6f7a8b9'
+down_revision: Union[str, None] = 'b3c1d2e4f5a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # pg_trgm for typo-tolerant title matches, btree_gin so user_id can lead
+    # the GIN indexes and a search only walks the user's own entries
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    # Stored generated column, kept in step with title and description by
+    # Postgres itself. Adding it rewrites the table under an exclusive lock.
+    op.add_column(
+        'Tasks',
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed(SEARCH_VECTOR, persisted=True),
+            nullable=True,
+        ),
+    )
+    # Build without locking writes on large tables
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_Tasks_user_id_search_vector',
+            'Tasks',
+            ['user_id', 'search_vector'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_Tasks_user_id_title_trgm',
+            'Tasks',
+            ['user_id', 'title'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={'title': 'gin_trgm_ops'},
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_Tasks_user_id_title_trgm',
+            table_name='Tasks',
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'ix_Tasks_user_id_search_vector',
+            table_name='Tasks',
+            postgresql_concurrently=True,
+        )
+    op.drop_column('Tasks', 'search_vector')
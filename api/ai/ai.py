@@ -1,16 +1,143 @@
-from fastapi import APIRouter, Form
+import json
+import os
+import time
+import uuid
+
+from fastapi import APIRouter, Depends, Form, HTTPException, Request
+from fastapi.responses import StreamingResponse
 
 from dotenv import load_dotenv
 
 from redis_cache.redis_client import redis_client
 from redis_cache.ai_tasks import ask_ai_task
+from celery_worker.celery_worker import (
+    RAG_WORKER_HEALTH_MAX_AGE,
+    RAG_WORKERS_HEALTH_KEY,
+)
+from redis_cache.ai_stream import get_task_meta, sse_events, streams_full
+from services.answer_cache import AnswerCacheService, question_hash
+from services.rate_limit import (
+    RateLimitPolicy,
+    admit_ai_task,
+    ai_saturated,
+    rate_limit,
+    release_ai_task,
+)
 
 load_dotenv()
 
 router = APIRouter(prefix="/ai", tags=["AI"])
 
+# Per client, and for everyone together, on top of the in-flight cap
+AI_ASK_RATE_LIMIT = RateLimitPolicy(
+    "ai_ask", os.getenv("RATE_LIMIT_AI_ASK", "20/60"), "ip"
+)
+AI_ASK_ROUTE_RATE_LIMIT = RateLimitPolicy(
+    "ai_ask_all", os.getenv("RATE_LIMIT_AI_ASK_ALL", "300/60"), "route"
+)
+
 
-@router.post("/ask-background")
+@router.post(
+    "/ask-background",
+    dependencies=[
+        Depends(rate_limit(AI_ASK_RATE_LIMIT)),
+        Depends(rate_limit(AI_ASK_ROUTE_RATE_LIMIT)),
+    ],
+)
 async def ask_ai_bg(question: str = Form(...)):
-    task = ask_ai_task.delay(question)
-    return {"task_id": task.id}
+    version = AnswerCacheService.index_version()
+    qhash = question_hash(question)
+
+    # Same question answered before, or a close enough one
+    cached = await AnswerCacheService.get_exact(version, qhash)
+    if cached is None:
+        cached = await AnswerCacheService.get_semantic(version, question)
+    if cached:
+        # No task_id: answers outlive their run's result (CELERY_RESULT_EXPIRES),
+        # so polling or streaming that id could find nothing
+        return {
+            "task_id": None,
+            "status": "SUCCESS",
+            "answer": cached["answer"],
+            "cached": True,
+        }
+
+    # Same question already queued or running, share its task
+    task_id = str(uuid.uuid4())
+    existing_task_id = await AnswerCacheService.claim_inflight(version, qhash, task_id)
+    if existing_task_id:
+        return {"task_id": existing_task_id, "deduplicated": True}
+
+    # New work only while the workers and their queue have room
+    if not await admit_ai_task(task_id):
+        await AnswerCacheService.release_inflight(version, qhash)
+        raise ai_saturated()
+
+    try:
+        ask_ai_task.apply_async(
+            args=[question], kwargs={"index_version": version}, task_id=task_id
+        )
+    except Exception:
+        await release_ai_task(task_id)
+        await AnswerCacheService.release_inflight(version, qhash)
+        raise
+    return {"task_id": task_id}
+
+
+@router.get("/cache/stats")
+async def answer_cache_stats():
+    """Answer cache hit/miss counters for this process"""
+    return AnswerCacheService.stats()
+
+
+@router.get("/workers/health")
+async def ai_workers_health():
+    """Last health report of every live warm RAG worker process
+
+    Reports that stopped being refreshed were left by processes that died
+    without cleaning up, and are dropped.
+    """
+    reports = await redis_client.client.hgetall(RAG_WORKERS_HEALTH_KEY)
+    cutoff = time.time() - RAG_WORKER_HEALTH_MAX_AGE
+    workers, stale = [], []
+    for field, report in reports.items():
+        health = json.loads(report)
+        if health.get("reported_at", 0) < cutoff:
+            stale.append(field)
+        else:
+            workers.append(health)
+    if stale:
+        await redis_client.client.hdel(RAG_WORKERS_HEALTH_KEY, *stale)
+    return {"workers": workers}
+
+
+@router.get("/tasks/{task_id}")
+async def get_ai_task(task_id: str):
+    """Status and result of an AI task, read straight from the result backend"""
+    meta = await get_task_meta(task_id)
+    if meta is None:
+        return {"task_id": task_id, "status": "PENDING"}
+
+    response = {"task_id": task_id, "status": meta.get("status")}
+    if meta.get("status") == "SUCCESS":
+        response["answer"] = meta.get("result")
+    elif meta.get("status") == "FAILURE":
+        response["error"] = str(meta.get("result"))
+    return response
+
+
+@router.get("/tasks/{task_id}/stream")
+async def stream_ai_task(task_id: str, request: Request):
+    """Server-Sent Events stream of the answer tokens as the worker produces them"""
+    if streams_full():
+        raise HTTPException(
+            status_code=503,
+            detail="Too many open streams, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    last_id = request.headers.get("last-event-id") or "0-0"
+    return StreamingResponse(
+        sse_events(task_id, request, last_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,137 +1,499 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import base64
+import binascii
+import os
+import re
+
+import orjson
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import Integer, String, bindparam, delete, insert, select, update
+from sqlalchemy import any_, column, func, literal_column, or_, values
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+from sqlalchemy.ext.asyncio import AsyncSession
 from db.models import Tasks
+from db.database import AsyncSessionLocal
 from db.dependencies import get_db
-from schemas.task_schemas import TaskCreate, TaskUpdate, TaskOut
-from api.users.users import get_current_user
-from db.models import Users
-from typing import List
-from services.task_cache import TaskCacheService
+from schemas.task_schemas import (
+    TaskCreate,
+    TaskUpdate,
+    TaskOut,
+    TaskFields,
+    TaskBatchCreate,
+    TaskBatchUpdate,
+    TaskBatchDelete,
+    TaskBatchResult,
+)
+from api.users.users import current_user_key, get_current_user
+from schemas.user_schemas import Principal
+from typing import List, Optional
+from services.rate_limit import RateLimitPolicy, rate_limit
+from services.task_cache import TaskCacheService, body_etag
+
+TASKS_RATE_LIMIT = RateLimitPolicy(
+    "tasks", os.getenv("RATE_LIMIT_TASKS", "1200/60"), "user"
+)
+
+router = APIRouter(
+    prefix="/tasks",
+    tags=["Tasks"],
+    dependencies=[Depends(rate_limit(TASKS_RATE_LIMIT, current_user_key))],
+)
+
+TASKS_PAGE_DEFAULT = int(os.getenv("TASKS_PAGE_DEFAULT", "50"))
+TASKS_PAGE_MAX = int(os.getenv("TASKS_PAGE_MAX", "500"))
+TASK_FIELDS = ("id", "title", "description")
+TASKS_SEARCH_PAGE_MAX = int(os.getenv("TASKS_SEARCH_PAGE_MAX", "100"))
+# OFFSET paging re-ranks every skipped match, so deep pages are refused
+TASKS_SEARCH_MAX_OFFSET = int(os.getenv("TASKS_SEARCH_MAX_OFFSET", "1000"))
+TASKS_SEARCH_MAX_TERMS = 8
+
+# Generated column added by migration c4d5e6f7a8b9, Postgres only
+SEARCH_VECTOR = literal_column('"Tasks".search_vector', TSVECTOR)
+
+
+def encode_cursor(task_id: int) -> str:
+    return base64.urlsafe_b64encode(str(task_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = set(requested) - set(TASK_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    return requested
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as If-None-Match requires
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag.removeprefix("W/") in candidates
+
+
+async def get_user_task(db: AsyncSession, task_id: int, user_id: int):
+    result = await db.execute(
+        select(Tasks).where(Tasks.id == task_id, Tasks.user_id == user_id)
+    )
+    return result.scalars().first()
+
+
+async def load_task_collection(user_id: int, max_tasks: int) -> List[dict]:
+    """All of user's tasks in id order, at most max_tasks + 1, in a session of its own"""
+    query = (
+        select(Tasks.id, Tasks.title, Tasks.description)
+        .where(Tasks.user_id == user_id)
+        .order_by(Tasks.id)
+        .limit(max_tasks + 1)
+    )
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(query)
+        return [dict(row) for row in result.mappings()]
+
+
+def _is_postgres(db: AsyncSession) -> bool:
+    return db.bind.dialect.name == "postgresql"
+
+
+def search_terms(q: str) -> List[str]:
+    """Lowercased words of a search query, the part of it that is matched and cached"""
+    terms = re.findall(r"\w+", q.lower())[:TASKS_SEARCH_MAX_TERMS]
+    if not terms:
+        raise HTTPException(status_code=400, detail="Search query has no words")
+    return terms
+
+
+def search_tasks_query(
+    user_id: int, terms: List[str], offset: int, limit: int, postgres: bool
+):
+    """Select one page of user's tasks matching every term, best matches first
+
+    On Postgres the last term matches as a prefix, so results follow typing,
+    and titles within trigram distance of the query match too, ranked by
+    ts_rank_cd plus trigram similarity. Elsewhere every term must be a
+    substring of the title or description and results are in id order.
+    """
+    query = select(Tasks.id, Tasks.title, Tasks.description).where(
+        Tasks.user_id == user_id
+    )
+    if postgres:
+        # Terms are plain words, so the tsquery syntax cannot be injected
+        tsquery = func.to_tsquery(
+            "english", " & ".join(terms[:-1] + [terms[-1] + ":*"])
+        )
+        phrase = " ".join(terms)
+        rank = func.ts_rank_cd(SEARCH_VECTOR, tsquery) + func.similarity(
+            Tasks.title, phrase
+        )
+        query = query.where(
+            or_(SEARCH_VECTOR.op("@@")(tsquery), Tasks.title.op("%")(phrase))
+        ).order_by(rank.desc(), Tasks.id)
+    else:
+        for term in terms:
+            query = query.where(
+                or_(
+                    Tasks.title.icontains(term, autoescape=True),
+                    Tasks.description.icontains(term, autoescape=True),
+                )
+            )
+        query = query.order_by(Tasks.id)
+    return query.offset(offset).limit(limit)
+
+
+def _task_row(row, user_id: int) -> dict:
+    return {
+        "id": row.id,
+        "title": row.title,
+        "description": row.description,
+        "user_id": user_id,
+    }
 
-router = APIRouter(prefix="/tasks", tags=["Tasks"])
+
+@router.post("/batch", response_model=List[TaskBatchResult])
+async def create_tasks_batch(
+    batch: TaskBatchCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Create many tasks with one multi-row INSERT ... RETURNING"""
+    rows = [{**task.dict(), "user_id": current_user.id} for task in batch.tasks]
+    result = await db.execute(
+        insert(Tasks).returning(
+            Tasks.id, Tasks.title, Tasks.description, sort_by_parameter_order=True
+        ),
+        rows,
+    )
+    created = [_task_row(row, current_user.id) for row in result]
+    await db.commit()
+
+    await TaskCacheService.apply_task_batch(current_user.id, created, [])
+    return [{"id": task["id"], "status": "created", "task": task} for task in created]
+
+
+@router.put("/batch", response_model=List[TaskBatchResult])
+async def update_tasks_batch(
+    batch: TaskBatchUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Update many of the user's tasks in one transaction"""
+    ids = [task.id for task in batch.tasks]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="Duplicate task ids in batch")
+
+    if _is_postgres(db):
+        # UPDATE ... FROM (VALUES ...) touches every row in one statement
+        new_values = values(
+            column("id", Integer),
+            column("title", String),
+            column("description", String),
+            name="new_values",
+        ).data([(task.id, task.title, task.description) for task in batch.tasks])
+        result = await db.execute(
+            update(Tasks)
+            .where(Tasks.id == new_values.c.id, Tasks.user_id == current_user.id)
+            .values(title=new_values.c.title, description=new_values.c.description)
+            .returning(Tasks.id, Tasks.title, Tasks.description)
+            .execution_options(synchronize_session=False)
+        )
+        updated = {row.id: _task_row(row, current_user.id) for row in result}
+    else:
+        owned = await db.execute(
+            select(Tasks.id).where(Tasks.user_id == current_user.id, Tasks.id.in_(ids))
+        )
+        owned_ids = set(owned.scalars())
+        items = [task for task in batch.tasks if task.id in owned_ids]
+        if items:
+            # Core executemany; the ORM would switch to bulk-by-primary-key mode
+            tasks_table = Tasks.__table__
+            await db.execute(
+                update(tasks_table)
+                .where(tasks_table.c.id == bindparam("task_id"))
+                .values(
+                    title=bindparam("new_title"),
+                    description=bindparam("new_description"),
+                ),
+                [
+                    {
+                        "task_id": task.id,
+                        "new_title": task.title,
+                        "new_description": task.description,
+                    }
+                    for task in items
+                ],
+            )
+        updated = {
+            task.id: {**task.dict(), "user_id": current_user.id} for task in items
+        }
+    await db.commit()
+
+    await TaskCacheService.apply_task_batch(
+        current_user.id, list(updated.values()), []
+    )
+    return [
+        {"id": task_id, "status": "updated", "task": updated[task_id]}
+        if task_id in updated
+        else {"id": task_id, "status": "not_found"}
+        for task_id in ids
+    ]
+
+
+@router.delete("/batch", response_model=List[TaskBatchResult])
+async def delete_tasks_batch(
+    batch: TaskBatchDelete,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Delete many of the user's tasks with one DELETE ... RETURNING"""
+    if _is_postgres(db):
+        id_match = Tasks.id == any_(bindparam("ids", batch.ids, type_=ARRAY(Integer)))
+    else:
+        id_match = Tasks.id.in_(batch.ids)
+    result = await db.execute(
+        delete(Tasks)
+        .where(Tasks.user_id == current_user.id, id_match)
+        .returning(Tasks.id)
+        .execution_options(synchronize_session=False)
+    )
+    deleted = set(result.scalars())
+    await db.commit()
+
+    await TaskCacheService.apply_task_batch(current_user.id, [], list(deleted))
+    return [
+        {"id": task_id, "status": "deleted" if task_id in deleted else "not_found"}
+        for task_id in batch.ids
+    ]
+
+
+@router.get("/search", response_model=List[TaskOut])
+async def search_user_tasks(
+    q: str = Query(..., min_length=1, max_length=200),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=TASKS_SEARCH_PAGE_MAX),
+    if_none_match: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Search user's tasks by title and description, best matches first
+
+    The next page cursor is in X-Next-Cursor. Result pages are cached like
+    listing pages, so repeated queries are served from Redis until the
+    user's tasks change.
+    """
+    terms = search_terms(q)
+    offset = decode_cursor(cursor) if cursor else 0
+    if offset > TASKS_SEARCH_MAX_OFFSET:
+        raise HTTPException(status_code=400, detail="Search results end here")
+
+    # Own session: a coalesced or background refill can outlive this request
+    async def load_page():
+        async with AsyncSessionLocal() as session:
+            query = search_tasks_query(
+                current_user.id, terms, offset, limit + 1, _is_postgres(session)
+            )
+            result = await session.execute(query)
+            rows = [dict(row) for row in result.mappings()]
+        next_offset = offset + limit
+        more = len(rows) > limit and next_offset <= TASKS_SEARCH_MAX_OFFSET
+        return rows[:limit], next_offset if more else None
+
+    page = await TaskCacheService.get_or_load_page(
+        current_user.id, offset, limit, None, load_page, query=" ".join(terms)
+    )
+
+    headers = {"ETag": page["etag"]}
+    if page["next_cursor"] is not None:
+        headers["X-Next-Cursor"] = encode_cursor(page["next_cursor"])
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=page["body"], media_type="application/json", headers=headers)
 
 
 @router.post("/", response_model=TaskOut)
 async def create_task(
     task: TaskCreate,
-    db: Session = Depends(get_db),
-    current_user: Users = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    # Create task in database
-    db_task = Tasks(**task.dict(), user_id=current_user.id)
-    db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
+    # Create task in database, RETURNING saves the refresh SELECT
+    result = await db.execute(
+        insert(Tasks)
+        .values(**task.dict(), user_id=current_user.id)
+        .returning(Tasks.id, Tasks.title, Tasks.description)
+    )
+    created = _task_row(result.one(), current_user.id)
+    await db.commit()
 
-    # Cache the new task and invalidate user's tasks list cache
-    await TaskCacheService.cache_task(db_task)
-    await TaskCacheService.invalidate_user_cache(current_user.id)
+    # Cache the new task and invalidate or patch user's cached listings
+    await TaskCacheService.apply_task_batch(current_user.id, [created], [])
 
-    return db_task
+    return created
 
 
 @router.get("/{task_id}", response_model=TaskOut)
 async def read_task(
     task_id: int,
-    db: Session = Depends(get_db),
-    current_user: Users = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
-    # Try cache first
-    cached_task = await TaskCacheService.get_task_from_cache(task_id, current_user.id)
-    if cached_task:
-        return TaskOut(**cached_task)
-
-    # If not in cache, get from database
-    task = (
-        db.query(Tasks)
-        .filter(Tasks.id == task_id, Tasks.user_id == current_user.id)
-        .first()
+    # Own session: a coalesced or background refill can outlive this request
+    async def load_task():
+        async with AsyncSessionLocal() as session:
+            return await get_user_task(session, task_id, current_user.id)
+
+    async def load_collection(max_tasks: int):
+        return await load_task_collection(current_user.id, max_tasks)
+
+    # Cache first, concurrent misses share a single database read
+    task = await TaskCacheService.get_or_load_task(
+        task_id, current_user.id, load_task, load_collection
     )
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-
-    # Cache the task for future requests
-    await TaskCacheService.cache_task(task)
-
-    return task
+    # Already the shape of TaskOut, no need to validate it again
+    return ORJSONResponse(
+        {"title": task["title"], "description": task["description"], "id": task["id"]}
+    )
 
 
 @router.put("/{task_id}", response_model=TaskOut)
 async def update_task(
     task_id: int,
     task_data: TaskUpdate,
-    db: Session = Depends(get_db),
-    current_user: Users = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    task = (
-        db.query(Tasks)
-        .filter(Tasks.id == task_id, Tasks.user_id == current_user.id)
-        .first()
+    # Update task in database, RETURNING saves the refresh SELECT
+    result = await db.execute(
+        update(Tasks)
+        .where(Tasks.id == task_id, Tasks.user_id == current_user.id)
+        .values(**task_data.dict(exclude_unset=True))
+        .returning(Tasks.id, Tasks.title, Tasks.description)
     )
-    if not task:
+    row = result.one_or_none()
+    if row is None:
         raise HTTPException(status_code=404, detail="Task not found")
-
-    # Update task in database
-    for key, value in task_data.dict(exclude_unset=True).items():
-        setattr(task, key, value)
-    db.commit()
-    db.refresh(task)
+    updated = _task_row(row, current_user.id)
+    await db.commit()
 
     # Update cache
-    await TaskCacheService.cache_task(task)
-    await TaskCacheService.invalidate_user_cache(current_user.id)
+    await TaskCacheService.apply_task_batch(current_user.id, [updated], [])
 
-    return task
+    return updated
 
 
 @router.delete("/{task_id}")
 async def delete_task(
     task_id: int,
-    db: Session = Depends(get_db),
-    current_user: Users = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    task = (
-        db.query(Tasks)
-        .filter(Tasks.id == task_id, Tasks.user_id == current_user.id)
-        .first()
+    # Delete from database
+    result = await db.execute(
+        delete(Tasks)
+        .where(Tasks.id == task_id, Tasks.user_id == current_user.id)
+        .returning(Tasks.id)
     )
-    if not task:
+    if result.one_or_none() is None:
         raise HTTPException(status_code=404, detail="Task not found")
-
-    # Delete from database
-    db.delete(task)
-    db.commit()
+    await db.commit()
 
     # Invalidate caches
-    await TaskCacheService.invalidate_task_cache(task_id)
-    await TaskCacheService.invalidate_user_cache(current_user.id)
+    await TaskCacheService.apply_task_batch(current_user.id, [], [task_id])
 
     return {"detail": "Task deleted successfully"}
 
 
-@router.get("/", response_model=List[TaskOut])
+@router.get(
+    "/", response_model=List[TaskFields], response_model_exclude_unset=True
+)
 async def list_user_tasks(
-    db: Session = Depends(get_db),
-    current_user: Users = Depends(get_current_user),
+    cursor: Optional[str] = None,
+    limit: int = Query(TASKS_PAGE_DEFAULT, ge=1, le=TASKS_PAGE_MAX),
+    title_prefix: Optional[str] = None,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_user),
 ):
-    # Try cache first
-    cached_tasks = await TaskCacheService.get_user_tasks_from_cache(current_user.id)
-    if cached_tasks:
-        return [TaskOut(**task) for task in cached_tasks]
+    """Page through user's tasks by id; the next page cursor is in X-Next-Cursor
+
+    The cached page is sent as its pre-rendered body with an ETag, and a
+    matching If-None-Match gets 304 Not Modified.
+    """
+    after_id = decode_cursor(cursor) if cursor else None
+    selected = parse_fields(fields)
 
-    # If not in cache, get from database
-    tasks = db.query(Tasks).filter(Tasks.user_id == current_user.id).all()
+    # Own session: a coalesced or background refill can outlive this request
+    async def load_page():
+        # Keyset query on (user_id, id), one extra row tells if a next page exists
+        query = select(Tasks.id, Tasks.title, Tasks.description).where(
+            Tasks.user_id == current_user.id
+        )
+        if after_id is not None:
+            query = query.where(Tasks.id > after_id)
+        if title_prefix:
+            query = query.where(Tasks.title.startswith(title_prefix, autoescape=True))
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(query.order_by(Tasks.id).limit(limit + 1))
+            rows = [dict(row) for row in result.mappings()]
+        next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+        return rows[:limit], next_cursor
 
-    # Cache the results
-    await TaskCacheService.cache_user_tasks(current_user.id, tasks)
+    async def load_collection(max_tasks: int):
+        return await load_task_collection(current_user.id, max_tasks)
 
-    return tasks
+    # Cache first, concurrent misses share a single database read; unfiltered
+    # pages come from the user's collection unless it is too large to keep
+    page = None
+    if not title_prefix:
+        page = await TaskCacheService.get_or_load_collection_page(
+            current_user.id, after_id, limit, load_collection
+        )
+    if page is None:
+        page = await TaskCacheService.get_or_load_page(
+            current_user.id, after_id, limit, title_prefix, load_page
+        )
+
+    headers = {"ETag": page["etag"]}
+    if selected:
+        headers["ETag"] = body_etag(page["etag"], *selected)
+    if page["next_cursor"] is not None:
+        headers["X-Next-Cursor"] = encode_cursor(page["next_cursor"])
+
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if not selected:
+        return Response(
+            content=page["body"], media_type="application/json", headers=headers
+        )
+    items = [
+        {field: item[field] for field in selected} for item in orjson.loads(page["body"])
+    ]
+    return ORJSONResponse(items, headers=headers)
 
 
 # Cache management endpoints for debugging
+@router.get("/cache/stats")
+async def task_cache_stats(current_user: Principal = Depends(get_current_user)):
+    """Hit ratios of the local and Redis task cache tiers in this worker"""
+    return TaskCacheService.stats()
+
+
 @router.delete("/cache/clear")
 async def clear_user_task_cache(
-    current_user: Users = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     """Clear all cached data for the current user"""
     await TaskCacheService.invalidate_all_user_caches(current_user.id)
@@ -141,7 +503,7 @@ async def clear_user_task_cache(
 @router.delete("/cache/task/{task_id}")
 async def clear_task_cache(
     task_id: int,
-    current_user: Users = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     """Clear cache for a specific task"""
     await TaskCacheService.invalidate_task_cache(task_id)
@@ -1,44 +1,88 @@
+import os
+
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from auth import auth
 from db.models import Users
 from db.dependencies import get_db
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from schemas.user_schemas import UserCreate, User, Token
+from schemas.user_schemas import UserCreate, User, Token, Principal
+from services.principal_cache import PrincipalCacheService
+from services.rate_limit import RateLimitPolicy, rate_limit
 
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+PASSWORD_BUSY_RETRY_AFTER = "1"
+
+# Both run bcrypt, so a flood of either pins the password hashing pool
+LOGIN_RATE_LIMIT = RateLimitPolicy(
+    "login", os.getenv("RATE_LIMIT_LOGIN", "10/60"), "ip"
+)
+REGISTER_RATE_LIMIT = RateLimitPolicy(
+    "register", os.getenv("RATE_LIMIT_REGISTER", "5/60"), "ip"
+)
+
 
-def get_user_by_username(db: Session, username: str):
-    return db.query(Users).filter(Users.username == username).first()
+def password_hasher_busy():
+    return HTTPException(
+        status_code=503,
+        detail="Too many password checks in progress, retry shortly",
+        headers={"Retry-After": PASSWORD_BUSY_RETRY_AFTER},
+    )
 
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user_by_username(db, username)
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(Users).where(Users.username == username))
+    return result.scalars().first()
+
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await get_user_by_username(db, username)
     if not user:
         return None
-    if not auth.verify_password(password, user.hashed_password):
+    # bcrypt is CPU bound, keep it off the event loop
+    try:
+        verified, new_hash = await auth.verify_password_async(
+            password, user.hashed_password
+        )
+    except auth.PasswordHasherBusy:
+        raise password_hasher_busy()
+    if not verified:
         return None
+
+    # Stored hash uses an outdated cost, upgrade it transparently
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+        await PrincipalCacheService.invalidate_principal(user.id)
     return user
 
 
-@router.post("/token", response_model=Token)
-def login(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+@router.post(
+    "/token",
+    response_model=Token,
+    dependencies=[Depends(rate_limit(LOGIN_RATE_LIMIT))],
+)
+async def login(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
-    access_token = auth.create_access_token(data={"sub": user.username})
+    access_token = auth.create_access_token(
+        data={"sub": user.username, "uid": user.id}
+    )
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 async def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
+    db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)
 ):
     payload = auth.decode_access_token(token)
     if payload is None:
@@ -48,37 +92,58 @@ async def get_current_user(
     if username is None:
         raise HTTPException(status_code=401, detail="Token missing subject")
 
-    user = get_user_by_username(db, username)
+    # Tokens carry the user id, so a cached principal needs no DB lookup
+    user_id = payload.get("uid")
+    if user_id is not None:
+        principal = await PrincipalCacheService.get_principal(user_id)
+        if principal is not None:
+            return principal
+        user = await db.get(Users, user_id)
+    else:
+        user = await get_user_by_username(db, username)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    return user
+    principal = Principal(id=user.id, username=user.username)
+    await PrincipalCacheService.cache_principal(principal)
+    return principal
+
+
+async def current_user_key(current_user: Principal = Depends(get_current_user)) -> str:
+    """Rate limit identity of per-user policies"""
+    return str(current_user.id)
 
 
 @router.get("/me")
-def read_users_me(current_user: User = Depends(get_current_user)):
+def read_users_me(current_user: Principal = Depends(get_current_user)):
     return current_user
 
 
-@router.post("/register", response_model=User)
-def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(Users).filter(Users.username == user_data.username).first()
+@router.post(
+    "/register",
+    response_model=User,
+    dependencies=[Depends(rate_limit(REGISTER_RATE_LIMIT))],
+)
+async def register_user(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
+    existing_user = await get_user_by_username(db, user_data.username)
 
     if existing_user:
         raise HTTPException(
             status_code=400, detail="Username or email already registered"
         )
 
-    hashed_pw = auth.get_password_hash(user_data.password)
+    try:
+        hashed_pw = await auth.get_password_hash_async(user_data.password)
+    except auth.PasswordHasherBusy:
+        raise password_hasher_busy()
 
     new_user = Users(username=user_data.username, hashed_password=hashed_pw)
 
     db.add(new_user)
     try:
-        db.commit()
+        await db.commit()
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Username or email must be unique")
 
-    db.refresh(new_user)
     return new_user
@@ -0,0 +1,68 @@
+"""In-process app environment for benchmarks.
+
+Runs the FastAPI app against a throwaway SQLite database (or DATABASE_URL
+when BENCH_USE_ENV_DB=true) and an in-memory fakeredis server, so the
+benchmarks need neither Postgres nor Redis. Import this module before
+anything from the app. Needs the dev-only packages aiosqlite, fakeredis
+(with lupa for Lua scripts) and httpx.
+"""
+
+import logging
+import os
+import tempfile
+from contextlib import asynccontextmanager
+
+if os.getenv("BENCH_USE_ENV_DB", "false").lower() != "true":
+    _db_path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("RAG_EMBEDDING_BACKEND", "local")
+os.environ.setdefault("RAG_LLM_BACKEND", "fake")
+# Every virtual client shares one address; bench_rate_limit turns it back on
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import fakeredis  # noqa: E402
+import httpx  # noqa: E402
+
+import redis_cache.redis_client as redis_module  # noqa: E402
+from db.database import Base, engine, async_engine  # noqa: E402
+from db import models  # noqa: E402,F401
+
+fake_server = fakeredis.FakeServer()
+redis_module.redis_client.client = fakeredis.FakeAsyncRedis(
+    server=fake_server,
+    decode_responses=redis_module.redis_client.pool.connection_kwargs.get(
+        "decode_responses", False
+    ),
+)
+redis_module._sync_client = fakeredis.FakeRedis(server=fake_server)
+redis_module._stream_client = fakeredis.FakeAsyncRedis(server=fake_server)
+
+Base.metadata.create_all(bind=engine)
+
+from main import app  # noqa: E402
+
+# The benchmark client's own per-request log lines are noise here
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+@asynccontextmanager
+async def client():
+    """HTTP client bound to the app; disposes the DB pool on exit"""
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench"
+    ) as http:
+        yield http
+    await async_engine.dispose()
+
+
+async def login(http: httpx.AsyncClient, username: str, password: str = "bench"):
+    """Register (if needed) and log in, returning auth headers"""
+    await http.post("/users/register", json={"username": username, "password": password})
+    response = await http.post(
+        "/users/token", data={"username": username, "password": password}
+    )
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
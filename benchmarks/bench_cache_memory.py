@@ -0,0 +1,146 @@
+"""Redis memory of a user's cached tasks per cache layout.
+
+Layouts:
+  blob        one JSON list of all tasks per user plus a JSON copy per task
+              (the original user_tasks:{id} / task:{id} layout)
+  pages       rendered 50-task pages plus a codec entry and tag per task
+  collection  hash of id -> listing JSON plus a sorted id index (current)
+
+With --redis-url the layouts are written to that server under a bench_mem:
+prefix, measured with MEMORY USAGE and deleted again. Without it only the
+key and value bytes are counted, which leaves out Redis' per-key and
+per-field overhead.
+
+Usage: python -m benchmarks.bench_cache_memory [--tasks 10,100,1000]
+       [--users 10] [--redis-url redis://localhost:6379/15]
+"""
+
+import argparse
+import json
+from typing import Dict, List
+
+import orjson
+import redis
+
+from redis_cache.redis_client import encode_value
+
+PREFIX = "bench_mem:"
+
+
+def make_tasks(user_id: int, count: int) -> List[dict]:
+    return [
+        {
+            "id": user_id * 1_000_000 + i,
+            "title": f"Task {i}: prepare the quarterly report",
+            "description": "Collect figures from every team and write the summary.",
+            "user_id": user_id,
+        }
+        for i in range(count)
+    ]
+
+
+def listing_row(task: dict) -> bytes:
+    return orjson.dumps(
+        {"id": task["id"], "title": task["title"], "description": task["description"]}
+    )
+
+
+def blob_layout(user_id: int, tasks: List[dict]) -> Dict[str, dict]:
+    keys = {f"user_tasks:{user_id}": {"string": json.dumps(tasks).encode()}}
+    for task in tasks:
+        keys[f"task:{task['id']}"] = {"string": json.dumps(task).encode()}
+    return keys
+
+
+def pages_layout(user_id: int, tasks: List[dict], page_size: int = 50) -> Dict[str, dict]:
+    keys = {}
+    for start in range(0, len(tasks), page_size):
+        rows = [listing_row(task) for task in tasks[start : start + page_size]]
+        body = (b"[" + b",".join(rows) + b"]").decode()
+        page = {"body": body, "etag": '"0123456789abcdef01234567"', "next_cursor": 1,
+                "generation": 1, "expires_at": 1.7e9, "delta": 0.001}
+        keys[f"user_tasks:{user_id}:{start:016x}"] = {"string": encode_value(page)}
+    tags = set()
+    for task in tasks:
+        entry = {**task, "expires_at": 1.7e9, "delta": 0.001}
+        keys[f"task:{task['id']}"] = {"string": encode_value(entry)}
+        tags.add(f"task:{task['id']}".encode())
+    keys[f"user_task_keys:{user_id}"] = {"set": tags}
+    return keys
+
+
+def collection_layout(user_id: int, tasks: List[dict]) -> Dict[str, dict]:
+    return {
+        f"user_tasks_loaded:{user_id}": {"string": b"1"},
+        f"user_tasks_ids:{user_id}": {
+            "zset": {str(task["id"]).encode(): task["id"] for task in tasks}
+        },
+        f"user_tasks_rows:{user_id}": {
+            "hash": {str(task["id"]).encode(): listing_row(task) for task in tasks}
+        },
+    }
+
+
+LAYOUTS = {"blob": blob_layout, "pages": pages_layout, "collection": collection_layout}
+
+
+def raw_bytes(keys: Dict[str, dict]) -> int:
+    total = 0
+    for key, value in keys.items():
+        total += len(key)
+        (kind, data), = value.items()
+        if kind == "string":
+            total += len(data)
+        elif kind == "set":
+            total += sum(map(len, data))
+        elif kind == "zset":
+            total += sum(len(member) + 8 for member in data)
+        else:
+            total += sum(len(field) + len(row) for field, row in data.items())
+    return total
+
+
+def redis_bytes(client: redis.Redis, keys: Dict[str, dict]) -> int:
+    pipe = client.pipeline(transaction=False)
+    for key, value in keys.items():
+        (kind, data), = value.items()
+        key = PREFIX + key
+        if kind == "string":
+            pipe.set(key, data)
+        elif kind == "set":
+            pipe.sadd(key, *data)
+        elif kind == "zset":
+            pipe.zadd(key, data)
+        else:
+            pipe.hset(key, mapping=data)
+    pipe.execute()
+    for key in keys:
+        pipe.memory_usage(PREFIX + key, samples=0)
+    total = sum(pipe.execute())
+    client.delete(*(PREFIX + key for key in keys))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", default="10,100,1000")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--redis-url")
+    args = parser.parse_args()
+
+    client = redis.Redis.from_url(args.redis_url) if args.redis_url else None
+    unit = "MEMORY USAGE" if client else "key+value bytes"
+    print(f"{args.users} users, bytes per user ({unit})")
+    print(f"{'tasks/user':>10} {'layout':>11} {'bytes/user':>11} {'bytes/task':>11}")
+    for count in (int(n) for n in args.tasks.split(",")):
+        for name, layout in LAYOUTS.items():
+            total = 0
+            for user_id in range(1, args.users + 1):
+                keys = layout(user_id, make_tasks(user_id, count))
+                total += redis_bytes(client, keys) if client else raw_bytes(keys)
+            per_user = total / args.users
+            print(f"{count:>10} {name:>11} {per_user:>11.0f} {per_user / count:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Queue latency of short Celery jobs behind a backlog of long ones.
+
+Runs embedded workers on the in-memory broker, with the app's own
+configuration otherwise. --long jobs (sleeping --long-seconds, standing in
+for RAG answers and index builds) are queued first, then --short jobs
+arrive one every --interval seconds. Compares:
+
+  shared  every job on one queue, one worker of --concurrency
+  lanes   long jobs on their lane's worker of --concurrency, short jobs
+          on the maintenance lane's own worker of --short-concurrency
+
+and reports how long the short jobs waited between publish and start.
+The memory transport has no priorities, so this measures routing alone.
+Its polling loop also stalls for up to two seconds between messages at
+the app's prefetch of one, so workers here prefetch --prefetch per
+process; in the shared setup that is more long jobs ahead of each short
+one than production sees.
+
+Usage: python -m benchmarks.bench_celery_queues [--long 20] [--short 20]
+       [--long-seconds 0.5] [--concurrency 2] [--short-concurrency 1]
+       [--prefetch 4]
+"""
+
+import argparse
+import os
+import time
+from contextlib import ExitStack
+
+os.environ.setdefault("CELERY_WARM_WORKERS", "false")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from celery.contrib.testing.worker import start_worker  # noqa: E402
+
+from celery_worker.celery_worker import (  # noqa: E402
+    INDEX_QUEUE,
+    MAINTENANCE_QUEUE,
+    celery_app,
+)
+
+celery_app.conf.update(
+    broker_url="memory://",
+    result_backend="cache+memory://",
+    # The memory transport polls; its default second would swamp the waits
+    broker_transport_options={"polling_interval": 0.005},
+    task_routes={},
+    task_annotations={},
+)
+
+
+@celery_app.task
+def long_job(seconds: float):
+    time.sleep(seconds)
+
+
+@celery_app.task
+def short_job(published_at: float):
+    return time.time() - published_at
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(args, long_queue, short_queue, workers):
+    with ExitStack() as stack:
+        for queues, concurrency in workers:
+            stack.enter_context(
+                start_worker(
+                    celery_app,
+                    concurrency=concurrency,
+                    pool="threads",
+                    queues=queues,
+                    perform_ping_check=False,
+                    loglevel="WARNING",
+                    shutdown_timeout=args.long * args.long_seconds + 10,
+                )
+            )
+        started = time.perf_counter()
+        backlog = [
+            long_job.apply_async((args.long_seconds,), queue=long_queue)
+            for _ in range(args.long)
+        ]
+        shorts = []
+        for _ in range(args.short):
+            shorts.append(short_job.apply_async((time.time(),), queue=short_queue))
+            time.sleep(args.interval)
+        waits = sorted(result.get(timeout=600) for result in shorts)
+        for result in backlog:
+            result.get(timeout=600)
+        elapsed = time.perf_counter() - started
+    return waits, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--long", type=int, default=20)
+    parser.add_argument("--short", type=int, default=20)
+    parser.add_argument("--long-seconds", type=float, default=0.5)
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--short-concurrency", type=int, default=1)
+    parser.add_argument("--prefetch", type=int, default=4)
+    args = parser.parse_args()
+    celery_app.conf.worker_prefetch_multiplier = args.prefetch
+
+    scenarios = {
+        "shared": (
+            INDEX_QUEUE,
+            INDEX_QUEUE,
+            [([INDEX_QUEUE], args.concurrency)],
+        ),
+        "lanes": (
+            INDEX_QUEUE,
+            MAINTENANCE_QUEUE,
+            [
+                ([INDEX_QUEUE], args.concurrency),
+                ([MAINTENANCE_QUEUE], args.short_concurrency),
+            ],
+        ),
+    }
+    print(f"{args.long} long jobs of {args.long_seconds}s, then {args.short} short "
+          f"jobs every {args.interval}s, concurrency {args.concurrency}")
+    print(f"{'setup':>8} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'total s':>8}")
+    for name, (long_queue, short_queue, workers) in scenarios.items():
+        waits, elapsed = run(args, long_queue, short_queue, workers)
+        print(f"{name:>8} {percentile(waits, 0.5) * 1000:>9.1f} "
+              f"{percentile(waits, 0.95) * 1000:>9.1f} {waits[-1] * 1000:>9.1f} "
+              f"{elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
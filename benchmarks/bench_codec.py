@@ -0,0 +1,80 @@
+"""Encode/decode cost and size of cached task pages per Redis codec.
+
+Compares the legacy json.dumps/json.loads path with every codec in
+redis_cache.redis_client, with and without zstd, on task lists of the
+sizes /tasks serves (one task, a default page, a max page). msgpack is
+skipped when it is not installed.
+
+Usage: python -m benchmarks.bench_codec [--sizes 1,50,500] [--repeat 200]
+"""
+
+import argparse
+import json
+import time
+
+from redis_cache.redis_client import CODECS, decode_value, encode_value
+
+
+def task_page(size: int) -> dict:
+    items = [
+        {
+            "id": 100000 + i,
+            "title": f"Task number {i}: prepare the quarterly report",
+            "description": "Collect figures from every team, check them against "
+            "last quarter and write the summary for the review meeting.",
+        }
+        for i in range(size)
+    ]
+    return {"items": items, "next_cursor": 100000 + size, "generation": 3}
+
+
+def measure(encode, decode, value, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        data = encode(value)
+    encode_us = (time.perf_counter() - started) / repeat * 1e6
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        decode(data)
+    decode_us = (time.perf_counter() - started) / repeat * 1e6
+    return encode_us, decode_us, len(data)
+
+
+def variants():
+    yield "legacy json", lambda v: json.dumps(v, default=str), json.loads
+    for name, codec in CODECS.items():
+        try:
+            codec.dumps({})
+        except ImportError:
+            print(f"skipping {name}: not installed")
+            continue
+        for compress in (0, 1):
+            label = f"{name}{'+zstd' if compress else ''}"
+            yield (
+                label,
+                lambda v, c=codec, z=compress: encode_value(v, c, compress_min_bytes=z),
+                decode_value,
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1,50,500")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'tasks':>6} {'codec':>14} {'encode us':>10} {'decode us':>10} {'bytes':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        value = task_page(size)
+        for label, encode, decode in variants():
+            assert decode(encode(value)) == value
+            encode_us, decode_us, length = measure(encode, decode, value, args.repeat)
+            print(
+                f"{size:>6} {label:>14} {encode_us:>10.1f} {decode_us:>10.1f}"
+                f" {length:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
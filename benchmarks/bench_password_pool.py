@@ -0,0 +1,56 @@
+"""Login throughput of the bcrypt worker pool at different pool sizes.
+
+Usage: python -m benchmarks.bench_password_pool [--logins 64] [--rounds 12]
+"""
+
+import argparse
+import asyncio
+import time
+
+from passlib.context import CryptContext
+
+from auth import auth
+
+
+async def run_logins(hasher, hashed, logins):
+    async def one_login():
+        try:
+            verified, _ = await hasher.run(
+                auth.verify_and_update_password, "secret", hashed
+            )
+            return verified
+        except auth.PasswordHasherBusy:
+            return None
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one_login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    return elapsed, results.count(True), results.count(None)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=auth.BCRYPT_ROUNDS)
+    parser.add_argument("--sizes", default="1,2,4,8")
+    parser.add_argument("--max-pending", type=int, default=1000)
+    parser.add_argument("--executor", default="thread")
+    args = parser.parse_args()
+
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=args.rounds)
+    auth.pwd_context = context
+    hashed = context.hash("secret")
+
+    print(f"bcrypt rounds={args.rounds} logins={args.logins}")
+    print(f"{'workers':>8} {'seconds':>8} {'logins/s':>9} {'rejected':>9}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        hasher = auth.PasswordHasher(
+            workers=size, max_pending=args.max_pending, executor=args.executor
+        )
+        elapsed, ok, rejected = await run_logins(hasher, hashed, args.logins)
+        hasher.shutdown()
+        print(f"{size:>8} {elapsed:>8.2f} {ok / elapsed:>9.1f} {rejected:>9}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
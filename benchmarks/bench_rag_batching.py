@@ -0,0 +1,151 @@
+"""Throughput of RAG questions answered one by one vs micro-batched.
+
+Stand-ins replace the network: the local hash embedder sleeps
+--embed-latency per backend call, however many texts it gets, and a
+fake chat model sleeps --llm-latency per answer. Compares, over
+--questions distinct questions:
+
+  sequential  one task at a time, as in a prefork child
+  threads     --threads tasks at once, each running the chain itself
+  batched     --threads tasks at once through the QuestionBatcher
+
+and reports questions per second, latency per question and how many
+embedding calls were made.
+
+Usage: python -m benchmarks.bench_rag_batching [--questions 200]
+       [--threads 16] [--window-ms 20] [--llm-concurrency 16]
+       [--embed-latency 0.02] [--llm-latency 0.05]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("RAG_EMBEDDING_BACKEND", "local")
+os.environ.setdefault("RAG_LLM_BACKEND", "fake")
+os.environ.setdefault("EMBEDDING_CACHE", "local")
+
+from langchain_core.language_models import FakeListChatModel  # noqa: E402
+
+import rag.index as rag_index  # noqa: E402
+from rag.batching import QuestionBatcher  # noqa: E402
+from rag.embedding_cache import CachedEmbeddings  # noqa: E402
+from rag.embeddings import LocalHashEmbeddings, embedding_model_id  # noqa: E402
+from rag.runtime import RagRuntime  # noqa: E402
+
+
+class SlowEmbeddings(LocalHashEmbeddings):
+    """Local embedder paying one simulated round trip per call"""
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls += 1
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+
+class SlowChatModel(FakeListChatModel):
+    """Fake chat model paying a simulated round trip per answer"""
+
+    latency: float = 0.05
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return super()._generate(messages, stop=stop, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return super()._generate(messages, stop=stop, **kwargs)
+
+
+def build_runtime(args):
+    runtime = RagRuntime()
+    backend = SlowEmbeddings(args.embed_latency)
+    # Same model id as the built index, so it is loaded rather than rebuilt
+    runtime.embeddings = CachedEmbeddings(
+        backend, embedding_model_id(LocalHashEmbeddings()), use_redis=False
+    )
+    runtime.llm = SlowChatModel(
+        responses=["This is a canned answer."], latency=args.llm_latency
+    )
+    runtime.warm_up()
+    backend.calls = 0
+    return runtime, backend
+
+
+def timed(ask, question):
+    started = time.perf_counter()
+    ask(question)
+    return time.perf_counter() - started
+
+
+def run(args, name, runtime):
+    # Fresh questions per run, so the embedding cache cannot answer them
+    questions = [
+        f"{name} question {i}: how does attention weigh tokens?"
+        for i in range(args.questions)
+    ]
+    if name == "sequential":
+        ask = runtime.get_chain().run
+        workers = 1
+    elif name == "threads":
+        chain = runtime.get_chain()
+        ask = chain.run
+        workers = args.threads
+    else:
+        batcher = QuestionBatcher(
+            runtime,
+            window_ms=args.window_ms,
+            max_size=args.max_batch,
+            llm_concurrency=args.llm_concurrency,
+        )
+        ask = batcher.ask
+        workers = args.threads
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        latencies = list(pool.map(lambda question: timed(ask, question), questions))
+    elapsed = time.perf_counter() - started
+    return elapsed, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--window-ms", type=float, default=20)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--llm-concurrency", type=int, default=16)
+    parser.add_argument("--embed-latency", type=float, default=0.02)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    rag_index.build_index()
+    runtime, backend = build_runtime(args)
+    print(f"{args.questions} questions, embed {args.embed_latency * 1000:.0f} ms/call, "
+          f"LLM {args.llm_latency * 1000:.0f} ms/answer, {args.threads} threads, "
+          f"window {args.window_ms:.0f} ms")
+    print(f"{'mode':>10} {'q/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'embed calls':>12}")
+    for name in ("sequential", "threads", "batched"):
+        backend.calls = 0
+        elapsed, latencies = run(args, name, runtime)
+        p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+        print(f"{name:>10} {args.questions / elapsed:>8.1f} "
+              f"{statistics.median(latencies) * 1000:>8.1f} {p95 * 1000:>8.1f} "
+              f"{backend.calls:>12}")
+
+
+if __name__ == "__main__":
+    main()
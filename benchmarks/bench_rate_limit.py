@@ -0,0 +1,65 @@
+"""Cost and accuracy of the Redis rate limiter.
+
+Times one limiter check on the leased fast path and on the exact path
+(a Lua call per request), then bursts requests at a small bucket and
+counts how many got through. Redis is fakeredis here, whose Lua runs far
+slower than a real server's; point REDIS_URL at one and set
+BENCH_REAL_REDIS=true for realistic Redis-path numbers.
+
+Usage: python -m benchmarks.bench_rate_limit [--checks 5000] [--burst 500]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ["RATE_LIMIT_ENABLED"] = "true"
+
+if os.getenv("BENCH_REAL_REDIS", "false").lower() != "true":
+    from benchmarks import app_env  # noqa: E402,F401
+
+from services import rate_limit  # noqa: E402
+from services.rate_limit import RateLimitPolicy, hit  # noqa: E402
+
+
+async def per_check(policy, checks):
+    started = time.perf_counter()
+    for _ in range(checks):
+        await hit(policy, "bench-user")
+    return (time.perf_counter() - started) / checks * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checks", type=int, default=5000)
+    parser.add_argument("--burst", type=int, default=500)
+    args = parser.parse_args()
+
+    # Far from its limit, so leases are granted
+    leased = RateLimitPolicy("bench_leased", "1000000/60", "user")
+    exact = RateLimitPolicy("bench_exact", "1000000/60", "user")
+    exact.lease = 1
+    results = {
+        "leased (fast path)": await per_check(leased, args.checks),
+        "exact (Lua per call)": await per_check(exact, args.checks),
+    }
+    print(f"{args.checks} checks")
+    print(f"{'path':>22} {'us/check':>9}")
+    for name, micros in results.items():
+        print(f"{name:>22} {micros:>9.1f}")
+
+    small = RateLimitPolicy("bench_burst", "100/60", "user")
+    outcomes = await asyncio.gather(
+        *(hit(small, "burst-user") for _ in range(args.burst))
+    )
+    allowed = sum(outcome is None for outcome in outcomes)
+    retry_after = max(outcome or 0 for outcome in outcomes)
+    print(f"\nburst of {args.burst} at a 100/60 bucket: {allowed} allowed, "
+          f"Retry-After {retry_after:.2f}s")
+    print(f"lease fraction {rate_limit.RATE_LIMIT_LEASE_FRACTION}, "
+          f"lease ttl {rate_limit.RATE_LIMIT_LEASE_TTL}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""Operations per second of the /tasks/batch endpoints vs per-item endpoints.
+
+Usage: python -m benchmarks.bench_task_batch [--items 200] [--batch-size 100]
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks import app_env
+
+
+async def per_item(http, headers, items):
+    timings = {}
+    started = time.perf_counter()
+    ids = []
+    for i in range(items):
+        response = await http.post(
+            "/tasks/", json={"title": f"item {i}", "description": "d"}, headers=headers
+        )
+        ids.append(response.json()["id"])
+    timings["create"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for task_id in ids:
+        await http.put(
+            f"/tasks/{task_id}",
+            json={"title": "updated", "description": "d"},
+            headers=headers,
+        )
+    timings["update"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for task_id in ids:
+        await http.delete(f"/tasks/{task_id}", headers=headers)
+    timings["delete"] = time.perf_counter() - started
+    return timings
+
+
+async def batched(http, headers, items, batch_size):
+    timings = {"create": 0.0, "update": 0.0, "delete": 0.0}
+    for start in range(0, items, batch_size):
+        count = min(batch_size, items - start)
+        began = time.perf_counter()
+        response = await http.post(
+            "/tasks/batch",
+            json={"tasks": [{"title": f"item {i}", "description": "d"}
+                            for i in range(count)]},
+            headers=headers,
+        )
+        ids = [result["id"] for result in response.json()]
+        timings["create"] += time.perf_counter() - began
+
+        began = time.perf_counter()
+        await http.put(
+            "/tasks/batch",
+            json={"tasks": [{"id": task_id, "title": "updated", "description": "d"}
+                            for task_id in ids]},
+            headers=headers,
+        )
+        timings["update"] += time.perf_counter() - began
+
+        began = time.perf_counter()
+        await http.request(
+            "DELETE", "/tasks/batch", json={"ids": ids}, headers=headers
+        )
+        timings["delete"] += time.perf_counter() - began
+    return timings
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    async with app_env.client() as http:
+        headers = await app_env.login(http, "bench-batch")
+        single = await per_item(http, headers, args.items)
+        batch = await batched(http, headers, args.items, args.batch_size)
+
+    print(f"{args.items} tasks, batch size {args.batch_size}")
+    print(f"{'op':>8} {'per-item ops/s':>15} {'batch ops/s':>12} {'speedup':>8}")
+    for op in ("create", "update", "delete"):
+        single_rate = args.items / single[op]
+        batch_rate = args.items / batch[op]
+        print(
+            f"{op:>8} {single_rate:>15.1f} {batch_rate:>12.1f}"
+            f" {batch_rate / single_rate:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+"""Requests per second of GET /tasks, before and after pre-rendered pages.
+
+Runs sequential requests for two baselines, served by routes this script
+adds to the app under the same rate limit dependency as /tasks:
+
+  uncached DB     the page queried on every request and validated against
+                  the response model
+  validated       GET /tasks as it worked before cached pages kept their
+                  rendered body: the same cached page, decoded and
+                  validated against the response model on every hit
+
+then for GET /tasks itself on a warm cache: a full page, a projected page
+(fields=) and a revalidation with If-None-Match (304). Each case is also
+reported as a multiple of the validated baseline.
+
+Usage: python -m benchmarks.bench_task_list [--tasks 50] [--requests 500]
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List
+
+from benchmarks import app_env
+
+import orjson  # noqa: E402
+from fastapi import APIRouter, Depends  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+
+from api.tasks.tasks import TASKS_RATE_LIMIT, list_user_tasks  # noqa: E402
+from api.users.users import current_user_key, get_current_user  # noqa: E402
+from db.dependencies import get_db  # noqa: E402
+from db.models import Tasks  # noqa: E402
+from schemas.task_schemas import TaskFields  # noqa: E402
+from schemas.user_schemas import Principal  # noqa: E402
+from services.rate_limit import rate_limit  # noqa: E402
+
+baseline = APIRouter(
+    prefix="/bench/tasks",
+    dependencies=[Depends(rate_limit(TASKS_RATE_LIMIT, current_user_key))],
+)
+
+
+@baseline.get("/db", response_model=List[TaskFields], response_model_exclude_unset=True)
+async def uncached_page(
+    limit: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    result = await db.execute(
+        select(Tasks.id, Tasks.title, Tasks.description)
+        .where(Tasks.user_id == current_user.id)
+        .order_by(Tasks.id)
+        .limit(limit)
+    )
+    return [dict(row) for row in result.mappings()]
+
+
+@baseline.get(
+    "/validated", response_model=List[TaskFields], response_model_exclude_unset=True
+)
+async def validated_page(limit: int, current_user: Principal = Depends(get_current_user)):
+    response = await list_user_tasks(
+        cursor=None,
+        limit=limit,
+        title_prefix=None,
+        fields=None,
+        if_none_match=None,
+        current_user=current_user,
+    )
+    return orjson.loads(response.body)
+
+
+app_env.app.include_router(baseline)
+
+
+async def rate(http, requests, url, headers):
+    await http.get(url, headers=headers)
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = await http.get(url, headers=headers)
+    elapsed = time.perf_counter() - started
+    return requests / elapsed, response.status_code
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    async with app_env.client() as http:
+        headers = await app_env.login(http, "bench-list")
+        await http.post(
+            "/tasks/batch",
+            json={"tasks": [{"title": f"Task {i}", "description": "d" * 120}
+                            for i in range(args.tasks)]},
+            headers=headers,
+        )
+        url = f"/tasks/?limit={args.tasks}"
+        etag = (await http.get(url, headers=headers)).headers.get("ETag")
+        cases = {
+            "uncached DB": (f"/bench/tasks/db?limit={args.tasks}", headers),
+            "validated": (f"/bench/tasks/validated?limit={args.tasks}", headers),
+            "full page": (url, headers),
+            "fields=id,title": (f"{url}&fields=id,title", headers),
+            "If-None-Match": (url, {**headers, "If-None-Match": etag or '"none"'}),
+        }
+        results = {
+            name: await rate(http, args.requests, case_url, case_headers)
+            for name, (case_url, case_headers) in cases.items()
+        }
+
+    before = results["validated"][0]
+    print(f"GET /tasks, {args.tasks} tasks per page, {args.requests} requests")
+    print(f"{'case':>16} {'req/s':>8} {'status':>7} {'vs before':>10}")
+    for name, (per_second, status) in results.items():
+        print(f"{name:>16} {per_second:>8.1f} {status:>7} {per_second / before:>9.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,140 @@
+"""Latency of task search on Postgres with a million tasks or more.
+
+Seeds --tasks tasks spread over --users users (once; reruns reuse the rows
+under the bench_search_ user prefix), then times the /tasks/search query
+for a hot user against a plain ILIKE scan of the same user's tasks, and
+prints the plan of the indexed query. Needs DATABASE_URL pointing at a
+Postgres database migrated to head or created by db/init_db.py (search_vector
+column and GIN indexes).
+
+Usage: python -m benchmarks.bench_task_search [--tasks 1000000]
+       [--users 1000] [--runs 50]
+"""
+
+import argparse
+import statistics
+import time
+
+from sqlalchemy import func, or_, select, text
+
+from db.database import engine
+from db.models import Tasks
+from api.tasks.tasks import search_tasks_query, search_terms
+
+PREFIX = "bench_search_"
+WORDS = [
+    "report", "invoice", "meeting", "review", "deploy", "budget", "hiring",
+    "roadmap", "migration", "backup", "audit", "release", "design", "support",
+]
+QUERIES = ["report", "quarterly invoice", "deploy rel", "migraton", "budget review"]
+
+SEED_USERS = text(
+    """
+    INSERT INTO "Users" (username, hashed_password)
+    SELECT :prefix || g, 'x' FROM generate_series(1, :users) AS g
+    ON CONFLICT (username) DO NOTHING
+    """
+)
+SEED_TASKS = text(
+    """
+    INSERT INTO "Tasks" (title, description, user_id)
+    SELECT
+        initcap(w[1 + g % n]) || ' ' || w[1 + (g / n) % n] || ' ' || g,
+        'Quarterly ' || w[1 + (g / 7) % n] || ' for the ' || w[1 + (g / 13) % n]
+            || ' team, follow up on ' || w[1 + (g / 31) % n],
+        u.ids[1 + g % array_length(u.ids, 1)]
+    FROM generate_series(1, :tasks) AS g,
+         (SELECT CAST(:words AS text[]) AS w, :n AS n) AS c,
+         (SELECT array_agg(id) AS ids FROM "Users"
+          WHERE username LIKE :prefix || '%') AS u
+    """
+)
+
+
+def seed(conn, tasks, users):
+    conn.execute(SEED_USERS, {"prefix": PREFIX, "users": users})
+    have = conn.execute(
+        text(
+            'SELECT count(*) FROM "Tasks" t JOIN "Users" u ON u.id = t.user_id '
+            "WHERE u.username LIKE :prefix || '%'"
+        ),
+        {"prefix": PREFIX},
+    ).scalar()
+    if have < tasks:
+        started = time.perf_counter()
+        conn.execute(
+            SEED_TASKS, {"tasks": tasks - have, "words": WORDS, "n": len(WORDS),
+                         "prefix": PREFIX}
+        )
+        conn.commit()
+        print(f"Seeded {tasks - have} tasks in {time.perf_counter() - started:.1f}s")
+    conn.execute(text('ANALYZE "Tasks"'))
+
+
+def timed(conn, query, runs):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        conn.execute(query).all()
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+
+def ilike_query(user_id, terms, limit):
+    query = select(Tasks.id, Tasks.title, Tasks.description).where(
+        Tasks.user_id == user_id
+    )
+    for term in terms:
+        query = query.where(
+            or_(Tasks.title.ilike(f"%{term}%"), Tasks.description.ilike(f"%{term}%"))
+        )
+    return query.order_by(Tasks.id).limit(limit)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("bench_task_search needs DATABASE_URL to be Postgres")
+
+    with engine.connect() as conn:
+        seed(conn, args.tasks, args.users)
+        user_id = conn.execute(
+            text("SELECT min(id) FROM \"Users\" WHERE username LIKE :prefix || '%'"),
+            {"prefix": PREFIX},
+        ).scalar()
+        per_user = conn.execute(
+            select(func.count()).select_from(Tasks).where(Tasks.user_id == user_id)
+        ).scalar()
+
+        print(f"{args.tasks} tasks, {per_user} for the searched user, "
+              f"{args.runs} runs, limit {args.limit}")
+        print(f"{'query':>18} {'search p50':>11} {'p95':>8} {'ILIKE p50':>10} {'p95':>8} {'hits':>5}")
+        for q in QUERIES:
+            terms = search_terms(q)
+            search = search_tasks_query(user_id, terms, 0, args.limit, True)
+            ilike = ilike_query(user_id, terms, args.limit)
+            hits = len(conn.execute(search).all())
+            search_p50, search_p95 = timed(conn, search, args.runs)
+            ilike_p50, ilike_p95 = timed(conn, ilike, args.runs)
+            print(f"{q:>18} {search_p50:>9.2f}ms {search_p95:>6.2f}ms "
+                  f"{ilike_p50:>8.2f}ms {ilike_p95:>6.2f}ms {hits:>5}")
+
+        # Plan of the indexed search, with the values bound by the driver
+        explained = search_tasks_query(
+            user_id, search_terms(QUERIES[1]), 0, args.limit, True
+        ).compile(bind=conn)
+        plan = conn.exec_driver_sql(
+            "EXPLAIN (ANALYZE, BUFFERS) " + str(explained), explained.params
+        ).scalars()
+        print("\n".join(plan))
+
+
+if __name__ == "__main__":
+    main()
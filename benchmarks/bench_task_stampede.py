@@ -0,0 +1,118 @@
+"""Database reads caused by a synchronized cache expiry of one hot user.
+
+Warms the task list page and one task, expires them all at once, then fires
+--concurrency simultaneous reads of each and counts SELECTs on "Tasks".
+Modes: protection off, Redis lock only (what separate processes see), and
+single-flight plus lock. Expiry kinds: "evicted" (keys gone), "stale" (past
+logical expiry, inside the stale window) and "invalidated" (after a write).
+
+Usage: python -m benchmarks.bench_task_stampede [--concurrency 100]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+# Exercise per-page and per-task entries rather than the user's task collection
+os.environ.setdefault("TASK_COLLECTION_MAX_TASKS", "0")
+
+from sqlalchemy import event  # noqa: E402
+
+from benchmarks import app_env  # noqa: E402
+from db.database import async_engine  # noqa: E402
+from redis_cache.redis_client import redis_client  # noqa: E402
+from services import stampede  # noqa: E402
+from services.task_cache import TaskCacheService  # noqa: E402
+
+task_selects = 0
+
+
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def count_task_selects(conn, cursor, statement, parameters, context, executemany):
+    global task_selects
+    if statement.lstrip().upper().startswith("SELECT") and '"Tasks"' in statement:
+        task_selects += 1
+
+
+class NoCoalescing(stampede.SingleFlight):
+    """Every caller loads on its own, as if each were a separate process"""
+
+    def start(self, key, fn):
+        return asyncio.ensure_future(fn())
+
+
+async def expire(kind, user_id, task_id):
+    page_key = TaskCacheService._get_task_page_cache_key(user_id, None, 50, None)
+    task_key = TaskCacheService._get_task_cache_key(task_id)
+    if kind == "evicted":
+        await redis_client.client.delete(page_key, task_key)
+    elif kind == "stale":
+        for key in (page_key, task_key):
+            entry = await redis_client.get(key)
+            entry["expires_at"] = time.time() - 1
+            await redis_client.set(key, entry, expire=stampede.CACHE_STALE_TTL)
+    else:
+        await TaskCacheService.invalidate_user_cache(user_id)
+        await redis_client.client.delete(task_key)
+
+
+async def run(http, headers, user_id, task_id, kind, concurrency):
+    global task_selects
+    # Warm both keys, then expire them together
+    await http.get("/tasks/", headers=headers)
+    await http.get(f"/tasks/{task_id}", headers=headers)
+    await expire(kind, user_id, task_id)
+
+    task_selects = 0
+    started = time.perf_counter()
+    responses = await asyncio.gather(
+        *(http.get("/tasks/", headers=headers) for _ in range(concurrency)),
+        *(http.get(f"/tasks/{task_id}", headers=headers) for _ in range(concurrency)),
+    )
+    elapsed = time.perf_counter() - started
+    # Let background refreshes finish and be counted
+    await asyncio.sleep(0.2)
+    assert all(response.status_code == 200 for response in responses)
+    return task_selects, elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--tasks", type=int, default=50)
+    args = parser.parse_args()
+
+    modes = {
+        "off": (False, NoCoalescing()),
+        "lock only": (True, NoCoalescing()),
+        "single-flight+lock": (True, stampede.SingleFlight()),
+    }
+    results = {}
+    async with app_env.client() as http:
+        headers = await app_env.login(http, "bench-stampede")
+        me = (await http.get("/users/me", headers=headers)).json()
+        await http.post(
+            "/tasks/batch",
+            json={"tasks": [{"title": f"t{i}", "description": "d"}
+                            for i in range(args.tasks)]},
+            headers=headers,
+        )
+        task_id = (await http.get("/tasks/", headers=headers)).json()[0]["id"]
+
+        for mode, (enabled, flight) in modes.items():
+            stampede.STAMPEDE_PROTECTION = enabled
+            stampede.single_flight = flight
+            for kind in ("evicted", "stale", "invalidated"):
+                results[mode, kind] = await run(
+                    http, headers, me["id"], task_id, kind, args.concurrency
+                )
+
+    print(f"{args.concurrency} concurrent reads each of a page and a task")
+    print(f"{'mode':>20} {'expiry':>12} {'task SELECTs':>13} {'seconds':>8}")
+    for (mode, kind), (selects, elapsed) in results.items():
+        print(f"{mode:>20} {kind:>12} {selects:>13} {elapsed:>8.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
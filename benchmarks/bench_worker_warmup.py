@@ -0,0 +1,73 @@
+"""Per-task latency of ask_ai_task's work with a cold vs a warm runtime.
+
+Cold rebuilds embeddings, LLM client, index handle and chain for every task
+(the old behaviour); warm reuses the process-local runtime built at worker
+start. Runs offline with the local embedder and the fake LLM by default.
+
+Usage: python -m benchmarks.bench_worker_warmup [--tasks 20]
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("RAG_EMBEDDING_BACKEND", "local")
+os.environ.setdefault("RAG_LLM_BACKEND", "fake")
+os.environ.setdefault("EMBEDDING_CACHE", "local")
+
+import rag.index as rag_index  # noqa: E402
+from rag.runtime import RagRuntime  # noqa: E402
+
+QUESTION = "How does multi-head attention work?"
+
+
+def run_cold(tasks):
+    timings = []
+    for _ in range(tasks):
+        started = time.perf_counter()
+        # Drop the process-wide index so each task loads it again
+        rag_index._loaded_key = rag_index._loaded_store = None
+        RagRuntime().get_chain().run(QUESTION)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def run_warm(tasks):
+    rag_index._loaded_key = rag_index._loaded_store = None
+    runtime = RagRuntime()
+    warm_started = time.perf_counter()
+    runtime.warm_up()
+    warm_seconds = time.perf_counter() - warm_started
+    timings = []
+    for _ in range(tasks):
+        started = time.perf_counter()
+        runtime.get_chain().run(QUESTION)
+        timings.append(time.perf_counter() - started)
+    return warm_seconds, timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+    print(
+        f"{name:>5}: mean {statistics.mean(timings) * 1000:8.2f} ms"
+        f"  p50 {statistics.median(timings) * 1000:8.2f} ms"
+        f"  p95 {p95 * 1000:8.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=20)
+    args = parser.parse_args()
+
+    rag_index.build_index()
+    report("cold", run_cold(args.tasks))
+    warm_seconds, timings = run_warm(args.tasks)
+    print(f"warm-up once per process: {warm_seconds * 1000:.2f} ms")
+    report("warm", timings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""Load test of the API with a realistic request mix, compared against baselines.
+
+Runs the app in-process (see app_env: SQLite and fakeredis by default,
+DATABASE_URL with BENCH_USE_ENV_DB=true). --concurrency virtual users,
+each with an account and --seed-tasks tasks of its own, send requests
+drawn from --mix for --duration seconds (or --requests in total).
+
+Reports per operation latency p50/p95/p99 and throughput, plus database
+statements per request and the task cache hit ratios of the run. --save
+writes the report as a JSON baseline; --baseline compares against one and
+exits non-zero when p95 latency or throughput regressed by more than
+--tolerance. Baselines are only comparable on the same machine and setup;
+on SQLite writes queue on the file lock, so their tail latency is noisy.
+
+Usage: python -m benchmarks.load_test [--concurrency 20] [--duration 10]
+       [--mix token=1,list=8,read=6,create=2,update=2,delete=1]
+       [--save benchmarks/baselines/load_test.json]
+       [--baseline benchmarks/baselines/load_test.json] [--tolerance 0.5]
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+DEFAULT_MIX = "token=1,list=8,read=6,create=2,update=2,delete=1"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument(
+        "--requests", type=int, default=0, help="stop after this many instead"
+    )
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--seed-tasks", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    return parser.parse_args()
+
+
+args = parse_args()
+
+from sqlalchemy import event  # noqa: E402
+
+from benchmarks import app_env  # noqa: E402
+from db.database import async_engine, engine  # noqa: E402
+from services.task_cache import TaskCacheService  # noqa: E402
+
+db_statements = 0
+
+
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+@event.listens_for(engine, "before_cursor_execute")
+def count_statements(conn, cursor, statement, parameters, context, executemany):
+    global db_statements
+    db_statements += 1
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(
+                f"Unknown operation {name!r}, pick from {', '.join(OPERATIONS)}"
+            )
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class VirtualUser:
+    def __init__(self, http, name: str, rng: random.Random):
+        self.http = http
+        self.name = name
+        self.rng = rng
+        self.headers = {}
+        self.task_ids: List[int] = []
+        self.next_cursor = None
+
+    async def setup(self, seed_tasks: int):
+        self.headers = await app_env.login(self.http, self.name)
+        response = await self.http.post(
+            "/tasks/batch",
+            json={"tasks": [{"title": f"Task {i}", "description": "seeded " * 8}
+                            for i in range(seed_tasks)]},
+            headers=self.headers,
+        )
+        self.task_ids = [item["id"] for item in response.json()]
+
+    async def token(self):
+        return await self.http.post(
+            "/users/token", data={"username": self.name, "password": "bench"}
+        )
+
+    async def list(self):
+        url = f"/tasks/?limit={args.page_size}"
+        # Page on from the last listing now and then, not only the first page
+        if self.next_cursor and self.rng.random() < 0.3:
+            url += f"&cursor={self.next_cursor}"
+        response = await self.http.get(url, headers=self.headers)
+        self.next_cursor = response.headers.get("X-Next-Cursor")
+        return response
+
+    async def read(self):
+        if not self.task_ids:
+            return await self.create()
+        task_id = self.rng.choice(self.task_ids)
+        return await self.http.get(f"/tasks/{task_id}", headers=self.headers)
+
+    async def create(self):
+        response = await self.http.post(
+            "/tasks/",
+            json={"title": f"Task {self.rng.randrange(10_000)}", "description": "new"},
+            headers=self.headers,
+        )
+        if response.status_code == 200:
+            self.task_ids.append(response.json()["id"])
+        return response
+
+    async def update(self):
+        if not self.task_ids:
+            return await self.create()
+        task_id = self.rng.choice(self.task_ids)
+        return await self.http.put(
+            f"/tasks/{task_id}",
+            json={"title": f"Task {self.rng.randrange(10_000)}", "description": "edited"},
+            headers=self.headers,
+        )
+
+    async def delete(self):
+        if not self.task_ids:
+            return await self.create()
+        task_id = self.task_ids.pop(self.rng.randrange(len(self.task_ids)))
+        return await self.http.delete(f"/tasks/{task_id}", headers=self.headers)
+
+
+OPERATIONS = ("token", "list", "read", "create", "update", "delete")
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_user(user: VirtualUser, weights, deadline, budget, latencies, errors):
+    names, values = list(weights), list(weights.values())
+    while time.perf_counter() < deadline and budget[0] != 0:
+        budget[0] -= 1
+        op = user.rng.choices(names, values)[0]
+        started = time.perf_counter()
+        response = await getattr(user, op)()
+        latencies[op].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors[op] += 1
+
+
+def cache_hit_ratios(before: dict, after: dict) -> Dict[str, float]:
+    ratios = {}
+    for family, counts in after.items():
+        if not isinstance(counts, dict) or "misses" not in counts:
+            continue
+        lookups = {
+            event: counts[event] - before[family][event]
+            for event in ("l1_hits", "l2_hits", "misses")
+        }
+        total = sum(lookups.values())
+        ratios[family] = round((total - lookups["misses"]) / total, 4) if total else None
+    return ratios
+
+
+async def main():
+    global db_statements
+    weights = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+
+    async with app_env.client() as http:
+        users = [
+            VirtualUser(http, f"load-{i}", random.Random(rng.random()))
+            for i in range(args.concurrency)
+        ]
+        await asyncio.gather(*(user.setup(args.seed_tasks) for user in users))
+
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        # Shared countdown of requests left, -1 for no limit
+        budget = [args.requests or -1]
+        stats_before = TaskCacheService.stats()
+        db_statements = 0
+        started = time.perf_counter()
+        deadline = float("inf") if args.requests else started + args.duration
+        await asyncio.gather(
+            *(
+                run_user(user, weights, deadline, budget, latencies, errors)
+                for user in users
+            )
+        )
+        elapsed = time.perf_counter() - started
+        statements = db_statements
+        stats_after = TaskCacheService.stats()
+
+    total = sum(len(values) for values in latencies.values())
+    report = {
+        "config": {
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "requests": args.requests,
+            "mix": weights,
+            "seed_tasks": args.seed_tasks,
+            "page_size": args.page_size,
+            "database": async_engine.dialect.name,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "requests": total,
+        "seconds": round(elapsed, 3),
+        "throughput": round(total / elapsed, 1),
+        "db_statements_per_request": round(statements / total, 3) if total else None,
+        "cache_hit_ratio": cache_hit_ratios(stats_before, stats_after),
+        "stampede": {
+            event: count - stats_before["stampede"][event]
+            for event, count in stats_after["stampede"].items()
+        },
+        "operations": {},
+    }
+    for op, values in sorted(latencies.items()):
+        values.sort()
+        report["operations"][op] = {
+            "requests": len(values),
+            "errors": errors[op],
+            "throughput": round(len(values) / elapsed, 1),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        }
+    return report
+
+
+def print_report(report: dict):
+    config = report["config"]
+    print(f"{report['requests']} requests in {report['seconds']}s, "
+          f"{report['throughput']} req/s, {config['concurrency']} virtual users, "
+          f"{config['database']}")
+    print(f"DB statements per request: {report['db_statements_per_request']}")
+    ratios = ", ".join(
+        f"{family} {ratio:.1%}" if ratio is not None else f"{family} -"
+        for family, ratio in report["cache_hit_ratio"].items()
+    )
+    print(f"Cache hit ratio: {ratios}")
+    print("Refills: " + ", ".join(
+        f"{event} {count}" for event, count in report["stampede"].items()
+    ))
+    print(f"{'operation':>10} {'requests':>9} {'errors':>7} {'req/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for op, row in report["operations"].items():
+        print(f"{op:>10} {row['requests']:>9} {row['errors']:>7} {row['throughput']:>8} "
+              f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8}")
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regressions of report against baseline beyond tolerance"""
+    regressions = []
+    if report["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(
+            f"throughput {report['throughput']} < baseline {baseline['throughput']}"
+        )
+    for op, row in report["operations"].items():
+        base = baseline["operations"].get(op)
+        if base and row["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{op} p95 {row['p95_ms']}ms > baseline {base['p95_ms']}ms")
+    base_statements = baseline.get("db_statements_per_request")
+    statements = report["db_statements_per_request"]
+    if base_statements is not None and statements is not None and (
+        statements > base_statements * (1 + tolerance)
+    ):
+        regressions.append(
+            f"DB statements per request {statements} > baseline {base_statements}"
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    result = asyncio.run(main())
+    print_report(result)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {args.save}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = compare(result, json.load(f), args.tolerance)
+        for regression in found:
+            print(f"REGRESSION: {regression}")
+        print("baseline: " + ("REGRESSED" if found else "ok"))
+        sys.exit(1 if found else 0)
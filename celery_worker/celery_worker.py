@@ -1,9 +1,227 @@
 from celery import Celery
+from celery.signals import (
+    setup_logging,
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+    worker_shutdown,
+)
+from kombu import Queue
+import json
+import logging
 import os
+import socket
+import threading
+import time
+from typing import List
 from dotenv import load_dotenv
 
+from services.logging_config import configure_logging
+from services.metrics import instrument_celery, metrics_registry
+
 load_dotenv()
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 
-celery_app = Celery("tasks", broker=REDIS_URL, backend=REDIS_URL)
+# prefork for CPU isolation, threads/gevent to share one warm runtime
+CELERY_POOL = os.getenv("CELERY_POOL", "prefork")
+CELERY_CONCURRENCY = int(os.getenv("CELERY_CONCURRENCY", "0")) or None
+CELERY_PREFETCH_MULTIPLIER = int(os.getenv("CELERY_PREFETCH_MULTIPLIER", "1"))
+CELERY_MAX_TASKS_PER_CHILD = int(os.getenv("CELERY_MAX_TASKS_PER_CHILD", "200"))
+CELERY_WARM_WORKERS = os.getenv("CELERY_WARM_WORKERS", "true").lower() == "true"
+# Port of the worker's Prometheus endpoint, unset to not serve one. Prefork
+# children only show up there with PROMETHEUS_MULTIPROC_DIR set.
+CELERY_METRICS_PORT = int(os.getenv("CELERY_METRICS_PORT", "0"))
+
+# Lanes, each consumed by its own workers (celery worker -Q <lane>) with
+# their own concurrency, so a short job never waits behind a long one
+RAG_QUEUE = "rag"
+INDEX_QUEUE = "index"
+MAINTENANCE_QUEUE = "maintenance"
+
+# Time limits per lane: soft raises inside the task, hard kills the process
+AI_TASK_SOFT_TIME_LIMIT = int(os.getenv("AI_TASK_SOFT_TIME_LIMIT", "300"))
+AI_TASK_TIME_LIMIT = int(os.getenv("AI_TASK_TIME_LIMIT", "360"))
+INDEX_TASK_SOFT_TIME_LIMIT = int(os.getenv("INDEX_TASK_SOFT_TIME_LIMIT", "3600"))
+INDEX_TASK_TIME_LIMIT = int(os.getenv("INDEX_TASK_TIME_LIMIT", "3900"))
+MAINTENANCE_TASK_SOFT_TIME_LIMIT = int(
+    os.getenv("MAINTENANCE_TASK_SOFT_TIME_LIMIT", "60")
+)
+MAINTENANCE_TASK_TIME_LIMIT = int(os.getenv("MAINTENANCE_TASK_TIME_LIMIT", "90"))
+
+# With acks_late a message stays unacked while its task runs, and Redis
+# hands it to another worker after this long: keep it above every hard limit
+CELERY_VISIBILITY_TIMEOUT = int(os.getenv("CELERY_VISIBILITY_TIMEOUT", "7200"))
+# Results and task states in the Redis backend expire after this
+CELERY_RESULT_EXPIRES = int(os.getenv("CELERY_RESULT_EXPIRES", "3600"))
+
+# Redis has no native priorities: each step is a list of its own, polled
+# lowest number (highest priority) first
+BROKER_PRIORITY_STEPS = list(range(10))
+BROKER_PRIORITY_SEP = ":"
+CELERY_DEFAULT_PRIORITY = 5
+# Health checks must run inside a RAG worker, ahead of its queued questions
+HEALTH_TASK_PRIORITY = 0
+
+RAG_WORKERS_HEALTH_KEY = "rag_workers"
+# Warm processes refresh their report this often; readers drop reports
+# older than RAG_WORKER_HEALTH_MAX_AGE as left by dead processes
+RAG_WORKER_HEALTH_INTERVAL = int(os.getenv("RAG_WORKER_HEALTH_INTERVAL", "30"))
+RAG_WORKER_HEALTH_MAX_AGE = 3 * RAG_WORKER_HEALTH_INTERVAL
+
+celery_app = Celery(
+    "tasks",
+    broker=REDIS_URL,
+    backend=REDIS_URL,
+    include=["redis_cache.ai_tasks", "redis_cache.maintenance_tasks"],
+)
+
+celery_app.conf.update(
+    # Report STARTED so /ai/tasks/{id} can tell queued from running work
+    task_track_started=True,
+    worker_pool=CELERY_POOL,
+    worker_concurrency=CELERY_CONCURRENCY,
+    # LLM tasks run for minutes, don't let one process hoard queued work
+    worker_prefetch_multiplier=CELERY_PREFETCH_MULTIPLIER,
+    worker_max_tasks_per_child=CELERY_MAX_TASKS_PER_CHILD,
+    task_queues=[Queue(RAG_QUEUE), Queue(INDEX_QUEUE), Queue(MAINTENANCE_QUEUE)],
+    # Anything not routed below is assumed to be short
+    task_default_queue=MAINTENANCE_QUEUE,
+    task_routes={
+        "redis_cache.ai_tasks.ask_ai_task": {"queue": RAG_QUEUE},
+        "redis_cache.ai_tasks.rag_worker_health": {
+            "queue": RAG_QUEUE,
+            "priority": HEALTH_TASK_PRIORITY,
+        },
+        "redis_cache.ai_tasks.build_index_task": {"queue": INDEX_QUEUE},
+        "redis_cache.maintenance_tasks.*": {"queue": MAINTENANCE_QUEUE},
+    },
+    task_default_priority=CELERY_DEFAULT_PRIORITY,
+    task_annotations={
+        # Acked on receipt: a rerun would stream a second answer into the
+        # same task's stream
+        "redis_cache.ai_tasks.ask_ai_task": {
+            "soft_time_limit": AI_TASK_SOFT_TIME_LIMIT,
+            "time_limit": AI_TASK_TIME_LIMIT,
+            "acks_late": False,
+        },
+        "redis_cache.ai_tasks.build_index_task": {
+            "soft_time_limit": INDEX_TASK_SOFT_TIME_LIMIT,
+            "time_limit": INDEX_TASK_TIME_LIMIT,
+        },
+        # Short and idempotent, so requeued when its process dies
+        "redis_cache.maintenance_tasks.sweep_cache_task": {
+            "soft_time_limit": MAINTENANCE_TASK_SOFT_TIME_LIMIT,
+            "time_limit": MAINTENANCE_TASK_TIME_LIMIT,
+            "reject_on_worker_lost": True,
+        },
+        "redis_cache.ai_tasks.rag_worker_health": {"reject_on_worker_lost": True},
+    },
+    # Ack after the task ran, so a task survives a worker restart. A task
+    # whose process died (OOM, native crash) is failed, not requeued, unless
+    # annotated above: requeueing a task that kills its process loops forever
+    task_acks_late=True,
+    task_reject_on_worker_lost=False,
+    broker_transport_options={
+        "visibility_timeout": CELERY_VISIBILITY_TIMEOUT,
+        "queue_order_strategy": "priority",
+        "priority_steps": BROKER_PRIORITY_STEPS,
+        "sep": BROKER_PRIORITY_SEP,
+    },
+    result_expires=CELERY_RESULT_EXPIRES,
+)
+
+# Publishers stamp the enqueue time, workers time queue wait and run time
+instrument_celery()
+
+logger = logging.getLogger(__name__)
+
+
+@setup_logging.connect
+def use_structured_logging(**kwargs):
+    # Connecting this stops Celery from installing its own handlers
+    configure_logging()
+
+
+def queue_keys(queue: str) -> List[str]:
+    """Redis lists holding a queue's waiting messages, one per priority step"""
+    return [queue] + [
+        f"{queue}{BROKER_PRIORITY_SEP}{step}" for step in BROKER_PRIORITY_STEPS[1:]
+    ]
+
+
+def report_worker_health():
+    """Publish this process's runtime health to Redis"""
+    from rag.runtime import get_runtime
+    from redis_cache.redis_client import get_sync_redis
+
+    health = get_runtime().health()
+    health["reported_at"] = time.time()
+    get_sync_redis().hset(
+        RAG_WORKERS_HEALTH_KEY, f"{health['host']}:{health['pid']}", json.dumps(health)
+    )
+
+
+def _report_health_periodically():
+    while True:
+        time.sleep(RAG_WORKER_HEALTH_INTERVAL)
+        try:
+            report_worker_health()
+        except Exception as e:
+            logger.warning("RAG worker health report failed", extra={"error": str(e)})
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def drop_worker_health(**kwargs):
+    """Remove this process's report, so recycled children do not pile up"""
+    from redis_cache.redis_client import get_sync_redis
+
+    try:
+        get_sync_redis().hdel(
+            RAG_WORKERS_HEALTH_KEY, f"{socket.gethostname()}:{os.getpid()}"
+        )
+    except Exception as e:
+        logger.warning("RAG worker health removal failed", extra={"error": str(e)})
+
+
+def warm_worker():
+    from rag.runtime import get_runtime
+
+    try:
+        get_runtime().warm_up()
+    except Exception as e:
+        logger.warning(
+            "RAG worker warm-up failed, tasks will retry lazily",
+            extra={"error": str(e)},
+        )
+    try:
+        report_worker_health()
+    except Exception as e:
+        logger.warning("RAG worker health report failed", extra={"error": str(e)})
+    threading.Thread(
+        target=_report_health_periodically, name="rag-health", daemon=True
+    ).start()
+
+
+@worker_process_init.connect
+def warm_prefork_child(**kwargs):
+    if CELERY_WARM_WORKERS:
+        warm_worker()
+
+
+@worker_init.connect
+def serve_metrics(**kwargs):
+    if CELERY_METRICS_PORT:
+        from prometheus_client import start_http_server
+
+        start_http_server(CELERY_METRICS_PORT, registry=metrics_registry())
+
+
+@worker_init.connect
+def warm_shared_pool(sender=None, **kwargs):
+    # threads/gevent/solo pools run tasks in this process, no child init fires
+    pool = getattr(sender, "pool_cls", CELERY_POOL)
+    pool_name = pool if isinstance(pool, str) else pool.__module__
+    if CELERY_WARM_WORKERS and "prefork" not in pool_name:
+        warm_worker()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import DDL, Column, Integer, String, ForeignKey, Index, event
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -22,3 +22,39 @@ class Tasks(Base):
     user_id = Column(Integer, ForeignKey("Users.id"), nullable=False)
 
     owner = relationship("Users", back_populates="tasks")
+
+    # Keyset pagination of a user's tasks walks (user_id, id)
+    __table_args__ = (Index("ix_Tasks_user_id_id", "user_id", "id"),)
+
+    # Postgres only, added by migration c4d5e6f7a8b9 (or by create_all, see
+    # SEARCH_SCHEMA_DDL) and not mapped here so the model still works on other
+    # databases: the generated tsvector column search_vector and the GIN
+    # indexes behind /tasks/search.
+    SEARCH_ONLY_SCHEMA = (
+        "search_vector",
+        "ix_Tasks_user_id_search_vector",
+        "ix_Tasks_user_id_title_trgm",
+    )
+
+
+# Same search schema as migration c4d5e6f7a8b9, so a database bootstrapped with
+# Base.metadata.create_all (db/init_db.py) can serve /tasks/search as well
+SEARCH_SCHEMA_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE EXTENSION IF NOT EXISTS btree_gin",
+    'ALTER TABLE "Tasks" ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ('
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+    ") STORED",
+    'CREATE INDEX "ix_Tasks_user_id_search_vector" ON "Tasks" '
+    "USING gin (user_id, search_vector)",
+    'CREATE INDEX "ix_Tasks_user_id_title_trgm" ON "Tasks" '
+    "USING gin (user_id, title gin_trgm_ops)",
+)
+
+for statement in SEARCH_SCHEMA_DDL:
+    event.listen(
+        Tasks.__table__,
+        "after_create",
+        DDL(statement).execute_if(dialect="postgresql"),
+    )
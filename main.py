@@ -1,10 +1,24 @@
-from fastapi import FastAPI
+import logging
+
+from fastapi import FastAPI, Response
 from api.users import users
 from api.tasks import tasks
 from redis_cache.redis_client import redis_client
 from api.ai import ai
+from auth.auth import password_hasher
+from services.task_cache import TaskCacheService
+from db.database import engine, async_engine
+from services.logging_config import configure_logging
+from services.metrics import MetricsMiddleware, instrument_engine, render_metrics
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
 
 app = FastAPI()
+app.add_middleware(MetricsMiddleware)
 app.include_router(tasks.router)
 app.include_router(users.router)
 app.include_router(ai.router)
@@ -15,6 +29,13 @@ async def root():
     return {"message": "Hello World"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 @app.on_event("startup")
 async def startup_event():
     """Test Redis connection on startup"""
@@ -22,11 +43,12 @@ async def startup_event():
         await redis_client.set("health_check", "ok", expire=10)
         test_value = await redis_client.get("health_check")
         if test_value == "ok":
-            print("✅ Redis connection successful")
+            logger.info("Redis connection successful")
         else:
-            print("❌ Redis connection failed")
+            logger.error("Redis connection failed")
     except Exception as e:
-        print(f"❌ Redis connection error: {e}")
+        logger.error("Redis connection error", extra={"error": str(e)})
+    await TaskCacheService.start_invalidation_listener()
 
 
 @app.get("/health/redis")
@@ -38,3 +60,11 @@ async def redis_health():
         return {"redis_status": "healthy" if result == "working" else "unhealthy"}
     except Exception as e:
         return {"redis_status": "unhealthy", "error": str(e)}
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled Redis connections and the password hashing pool"""
+    await TaskCacheService.stop_invalidation_listener()
+    await redis_client.close()
+    password_hasher.shutdown()
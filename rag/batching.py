@@ -0,0 +1,206 @@
+"""Micro-batching of RAG questions inside one worker process.
+
+With a threads or gevent pool, ask_ai_task calls running at the same time
+hand their question to one QuestionBatcher rather than each running the
+chain. It waits up to RAG_BATCH_WINDOW_MS for more questions, then embeds
+the whole batch in one call, searches FAISS once with the query matrix and
+fans the LLM calls out on an event loop, at most RAG_BATCH_LLM_CONCURRENCY
+at a time. Each caller gets its own answer, or exception, back.
+
+Prefork children run one task at a time, so there is nothing to batch
+there: leave RAG_BATCH_WINDOW_MS at 0 and every task runs the chain itself.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Sequence
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from celery_worker.celery_worker import AI_TASK_SOFT_TIME_LIMIT
+
+RAG_BATCH_WINDOW_MS = float(os.getenv("RAG_BATCH_WINDOW_MS", "0"))
+RAG_BATCH_MAX_SIZE = int(os.getenv("RAG_BATCH_MAX_SIZE", "32"))
+RAG_BATCH_LLM_CONCURRENCY = int(os.getenv("RAG_BATCH_LLM_CONCURRENCY", "8"))
+# How long a caller waits for its answer; thread pools have no hard time
+# limit to end a task whose batch never finishes
+RAG_BATCH_TIMEOUT = AI_TASK_SOFT_TIME_LIMIT
+
+logger = logging.getLogger(__name__)
+
+
+def embed_queries(embeddings: Embeddings, questions: Sequence[str]) -> List[List[float]]:
+    """Query vectors of many questions, in one backend call where supported"""
+    embed_batch = getattr(embeddings, "embed_queries", None)
+    if embed_batch is not None:
+        return embed_batch(list(questions))
+    return [embeddings.embed_query(question) for question in questions]
+
+
+def _fail_pending(batch: list, error: BaseException):
+    for _, _, future in batch:
+        if not future.done():
+            future.set_exception(error)
+
+
+def search_batch(
+    vector_store: FAISS, vectors: Sequence[Sequence[float]], k: int
+) -> List[List[Document]]:
+    """Top k documents per query vector from one FAISS search over all of them
+
+    Matches what the chain's similarity retriever returns for each question.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if vector_store._normalize_L2:
+        faiss.normalize_L2(matrix)
+    _, indices = vector_store.index.search(matrix, k)
+    results = []
+    for row in indices:
+        docs = []
+        for i in row:
+            # -1 pads rows when the index holds fewer than k vectors
+            if i != -1:
+                docs.append(
+                    vector_store.docstore.search(vector_store.index_to_docstore_id[i])
+                )
+        results.append(docs)
+    return results
+
+
+class QuestionBatcher:
+    """Collects questions from many threads and answers them a batch at a time
+
+    One thread collects and retrieves batches while an event loop thread
+    runs their LLM calls, so the next batch is retrieved while the last
+    one is still being answered. The LLM bound holds across batches.
+    """
+
+    def __init__(
+        self,
+        runtime,
+        window_ms: float = RAG_BATCH_WINDOW_MS,
+        max_size: int = RAG_BATCH_MAX_SIZE,
+        llm_concurrency: int = RAG_BATCH_LLM_CONCURRENCY,
+        timeout: float = RAG_BATCH_TIMEOUT,
+    ):
+        self.runtime = runtime
+        self.window = window_ms / 1000
+        self.timeout = timeout
+        self.max_size = max_size
+        self.llm_concurrency = llm_concurrency
+        self.batches = 0
+        self.questions = 0
+        self._pending: queue.Queue = queue.Queue()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._collector: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def ask(self, question: str, callbacks: Optional[list] = None) -> str:
+        """Answer question as part of the next batch, blocking until it is done
+
+        Raises concurrent.futures.TimeoutError after self.timeout seconds.
+        """
+        future: Future = Future()
+        self._pending.put((question, callbacks, future))
+        self._ensure_running()
+        return future.result(timeout=self.timeout)
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, name="rag-batch-llm", daemon=True
+                ).start()
+            if self._collector is None or not self._collector.is_alive():
+                self._collector = threading.Thread(
+                    target=self._run, name="rag-batcher", daemon=True
+                )
+                self._collector.start()
+
+    def _collect(self) -> list:
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                chain, documents = self.retrieve([question for question, _, _ in batch])
+            except Exception as e:
+                logger.warning("RAG batch retrieval failed", extra={"error": str(e)})
+                _fail_pending(batch, e)
+                continue
+            done = asyncio.run_coroutine_threadsafe(
+                self.answer_batch(chain, batch, documents), self._loop
+            )
+            done.add_done_callback(lambda done, batch=batch: self._answered(done, batch))
+
+    @staticmethod
+    def _answered(done, batch: list):
+        # answer_batch resolves every future itself; this catches what escaped it
+        error = done.exception()
+        if error is not None:
+            logger.error("RAG batch failed", extra={"error": str(error)})
+            _fail_pending(batch, error)
+
+    def retrieve(self, questions: List[str]) -> tuple:
+        """Chain and top documents per question: one embedding call, one search"""
+        chain = self.runtime.get_chain(served=len(questions))
+        vectors = embed_queries(self.runtime.embeddings, questions)
+        documents = search_batch(
+            self.runtime.vector_store, vectors, chain.retriever.search_kwargs["k"]
+        )
+        self.batches += 1
+        self.questions += len(questions)
+        logger.debug("RAG batch retrieved", extra={"size": len(questions)})
+        return chain, documents
+
+    async def answer_batch(self, chain, batch: list, documents: List[List[Document]]):
+        """Run a batch's LLM calls concurrently, at most llm_concurrency overall
+
+        Resolves every caller's future, with an exception if anything failed.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.llm_concurrency)
+
+        async def answer(item, docs):
+            question, callbacks, future = item
+            try:
+                async with self._semaphore:
+                    combine = chain.combine_documents_chain
+                    outputs = await combine.ainvoke(
+                        {"input_documents": docs, "question": question},
+                        config={"callbacks": callbacks},
+                    )
+                future.set_result(outputs[combine.output_key])
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+
+        try:
+            await asyncio.gather(
+                *(answer(item, docs) for item, docs in zip(batch, documents))
+            )
+        except BaseException as e:
+            _fail_pending(batch, e)
+            raise
@@ -0,0 +1,165 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from redis_cache.redis_client import get_sync_redis
+from services.metrics import CacheCounters
+
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", str(7 * 24 * 3600)))
+EMBEDDING_CACHE_LOCAL_BYTES = int(
+    os.getenv("EMBEDDING_CACHE_LOCAL_BYTES", str(64 * 1024 * 1024))
+)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+
+logger = logging.getLogger(__name__)
+
+
+class _LocalVectorCache:
+    """LRU of float32 blobs bounded by total bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            blob = self._data.get(key)
+            if blob is not None:
+                self._data.move_to_end(key)
+            return blob
+
+    def set(self, key: str, blob: bytes):
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._data[key] = blob
+            self.size += len(blob)
+            while self.size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class CachedEmbeddings(Embeddings):
+    """Content-addressed cache in front of any embedding backend.
+
+    Vectors are keyed by sha256(model, text) and stored as float32 blobs in
+    a local LRU and in Redis; only the misses reach the wrapped backend.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model_id: str,
+        use_redis: bool = True,
+        local_max_bytes: int = EMBEDDING_CACHE_LOCAL_BYTES,
+        ttl: int = EMBEDDING_CACHE_TTL,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+    ):
+        self.underlying = underlying
+        self.model_id = model_id
+        self.use_redis = use_redis
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.local = _LocalVectorCache(local_max_bytes)
+        self.stats = CacheCounters(
+            "embeddings", ("local_hits", "redis_hits", "misses", "errors")
+        )
+
+    def _key(self, kind: str, text: str) -> str:
+        digest = hashlib.sha256(f"{self.model_id}\0{kind}\0{text}".encode())
+        return f"emb:{digest.hexdigest()}"
+
+    def _lookup(self, keys: List[str]) -> Dict[str, bytes]:
+        found = {}
+        remote = []
+        for key in keys:
+            blob = self.local.get(key)
+            if blob is not None:
+                found[key] = blob
+            else:
+                remote.append(key)
+        self.stats.incr("local_hits", len(found))
+
+        if remote and self.use_redis:
+            try:
+                client = get_sync_redis()
+                for start in range(0, len(remote), self.batch_size):
+                    chunk = remote[start : start + self.batch_size]
+                    for key, blob in zip(chunk, client.mget(chunk)):
+                        if blob is not None:
+                            found[key] = blob
+                            self.local.set(key, blob)
+                            self.stats.incr("redis_hits")
+            except Exception as e:
+                self.stats.incr("errors")
+                logger.warning("embedding cache lookup failed", extra={"error": str(e)})
+        return found
+
+    def _store(self, blobs: Dict[str, bytes]):
+        for key, blob in blobs.items():
+            self.local.set(key, blob)
+        if not self.use_redis:
+            return
+        try:
+            with get_sync_redis().pipeline(transaction=False) as pipe:
+                for key, blob in blobs.items():
+                    pipe.setex(key, self.ttl, blob)
+                pipe.execute()
+        except Exception as e:
+            self.stats.incr("errors")
+            logger.warning("embedding cache store failed", extra={"error": str(e)})
+
+    def _embed(self, kind: str, texts: List[str], embed_batch) -> List[List[float]]:
+        keys = [self._key(kind, text) for text in texts]
+        found = self._lookup(list(dict.fromkeys(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing[key] = text
+        self.stats.incr("misses", len(missing))
+
+        missing_keys = list(missing)
+        for start in range(0, len(missing_keys), self.batch_size):
+            batch_keys = missing_keys[start : start + self.batch_size]
+            vectors = embed_batch([missing[key] for key in batch_keys])
+            blobs = {
+                key: np.asarray(vector, dtype=np.float32).tobytes()
+                for key, vector in zip(batch_keys, vectors)
+            }
+            found.update(blobs)
+            self._store(blobs)
+
+        return [np.frombuffer(found[key], dtype=np.float32).tolist() for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed("doc", texts, self.underlying.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(
+            "query", [text], lambda batch: [self.underlying.embed_query(batch[0])]
+        )[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """embed_query of many texts, with the misses embedded in one batch
+
+        Every backend here embeds queries and documents with the same model,
+        so the batch goes through embed_documents.
+        """
+        return self._embed("query", texts, self.underlying.embed_documents)
+
+    def hit_ratio(self) -> float:
+        hits = self.stats["local_hits"] + self.stats["redis_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
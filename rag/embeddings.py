@@ -0,0 +1,79 @@
+import hashlib
+import os
+import re
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_BACKEND = os.getenv("RAG_EMBEDDING_BACKEND", "openai")
+OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+LOCAL_EMBEDDING_DIM = int(os.getenv("RAG_LOCAL_EMBEDDING_DIM", "384"))
+# "redis" (local LRU + Redis), "local" (in-process LRU only) or "off"
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "redis")
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class LocalHashEmbeddings(Embeddings):
+    """Deterministic offline embeddings using the hashing trick.
+
+    Not semantically strong, but stable across processes and runs, which is
+    enough to build and exercise the index without network access.
+    """
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM):
+        self.dim = dim
+        self.model = f"local-hash-{dim}"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in _TOKEN_RE.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def get_embeddings(backend: str = None, cache: str = None) -> Embeddings:
+    """Build the configured embedding backend, wrapped in the embedding cache"""
+    backend = backend or EMBEDDING_BACKEND
+    cache = cache or EMBEDDING_CACHE
+    if backend == "local":
+        embeddings = LocalHashEmbeddings()
+    elif backend == "openai":
+        from langchain_openai import OpenAIEmbeddings
+
+        embeddings = OpenAIEmbeddings(
+            model=OPENAI_EMBEDDING_MODEL,
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+        )
+    else:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    if cache == "off":
+        return embeddings
+
+    from rag.embedding_cache import CachedEmbeddings
+
+    return CachedEmbeddings(
+        embeddings, embedding_model_id(embeddings), use_redis=cache == "redis"
+    )
+
+
+def embedding_model_id(embeddings: Embeddings) -> str:
+    """Stable identifier of the model behind an embedding backend"""
+    model_id = getattr(embeddings, "model_id", None)
+    if model_id:
+        return model_id
+    model = getattr(embeddings, "model", None) or ""
+    return f"{type(embeddings).__name__}:{model}"
@@ -0,0 +1,166 @@
+"""On-disk FAISS index for the RAG corpus.
+
+The index is keyed by a hash of the source PDFs, the splitter settings and
+the embedding model, so it is only rebuilt when one of them changes. The
+build itself is done incrementally by rag.ingest.
+
+Build it ahead of time with: python -m rag.index build [--force]
+"""
+
+import argparse
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from rag.embeddings import get_embeddings, embedding_model_id
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAG_SOURCE_DIR = os.getenv("RAG_SOURCE_DIR", os.path.join(BASE_DIR, "api/ai"))
+RAG_INDEX_DIR = os.getenv("RAG_INDEX_DIR", os.path.join(BASE_DIR, "var/rag_index"))
+CHUNK_SIZE = int(os.getenv("RAG_CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "100"))
+
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+_lock = threading.Lock()
+_loaded_key: Optional[str] = None
+_loaded_store: Optional[FAISS] = None
+
+
+def source_files(source_dir: str = RAG_SOURCE_DIR) -> List[str]:
+    """All PDFs under source_dir, recursively"""
+    return sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(source_dir)
+        for name in names
+        if name.lower().endswith(".pdf")
+    )
+
+
+def file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_checksums(
+    files: List[str], source_dir: str = RAG_SOURCE_DIR
+) -> Dict[str, str]:
+    """Checksums keyed by path relative to source_dir"""
+    return {os.path.relpath(path, source_dir): file_checksum(path) for path in files}
+
+
+def index_key(checksums: Dict[str, str], embeddings: Embeddings) -> str:
+    """Content hash of everything that determines the index"""
+    digest = hashlib.sha256()
+    for name, checksum in sorted(checksums.items()):
+        digest.update(name.encode())
+        digest.update(checksum.encode())
+    digest.update(f"chunk={CHUNK_SIZE}:overlap={CHUNK_OVERLAP}".encode())
+    digest.update(embedding_model_id(embeddings).encode())
+    return digest.hexdigest()[:32]
+
+
+def current_index_version(index_dir: str = RAG_INDEX_DIR) -> Optional[str]:
+    """Key of the index workers should serve, None before the first build"""
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_current_index(index_dir: str, key: str):
+    fd, tmp_path = tempfile.mkstemp(dir=index_dir)
+    with os.fdopen(fd, "w") as f:
+        f.write(key)
+    os.replace(tmp_path, os.path.join(index_dir, CURRENT_FILE))
+
+
+def build_index(
+    embeddings: Embeddings = None,
+    source_dir: str = RAG_SOURCE_DIR,
+    index_dir: str = RAG_INDEX_DIR,
+    force: bool = False,
+) -> str:
+    """Build the index if its inputs changed, return its key"""
+    from rag.ingest import ingest_directory
+
+    stats = ingest_directory(
+        source_dir, index_dir, embeddings=embeddings or get_embeddings(), force=force
+    )
+    return stats.key
+
+
+def load_index(
+    key: str, embeddings: Embeddings, index_dir: str = RAG_INDEX_DIR, mmap=True
+) -> FAISS:
+    """Load a built index, memory-mapping the vectors where FAISS supports it"""
+    path = os.path.join(index_dir, key)
+    index_path = os.path.join(path, "index.faiss")
+    index = None
+    if mmap:
+        try:
+            index = faiss.read_index(
+                index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            )
+        except RuntimeError:
+            pass
+    if index is None:
+        index = faiss.read_index(index_path)
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+
+
+def loaded_index_version() -> Optional[str]:
+    """Key of the index this process has loaded, if any"""
+    return _loaded_key
+
+
+def get_vector_store(embeddings: Embeddings = None) -> FAISS:
+    """Process-wide vector store, reloaded only when the current index changes"""
+    global _loaded_key, _loaded_store
+    key = current_index_version()
+    if key is not None and key == _loaded_key:
+        return _loaded_store
+
+    with _lock:
+        embeddings = embeddings or get_embeddings()
+        if key is None:
+            key = build_index(embeddings)
+        if key != _loaded_key:
+            _loaded_store = load_index(key, embeddings)
+            _loaded_key = key
+        return _loaded_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the RAG FAISS index")
+    parser.add_argument("command", choices=["build", "current"])
+    parser.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(build_index(force=args.force))
+    else:
+        print(current_index_version())
+
+
+if __name__ == "__main__":
+    main()
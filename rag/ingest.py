@@ -0,0 +1,281 @@
+"""Streaming, parallel ingestion of a directory of PDFs into the FAISS index.
+
+Pages are parsed in a process pool and streamed through the splitter, then
+embedded and appended to the index in batches, so memory stays bounded by
+a few files in flight plus one batch, however large the corpus is. Files
+whose checksum is unchanged since the current index are skipped, changed
+or removed files have their chunks deleted first.
+
+Usage: python -m rag.ingest [SOURCE_DIR] [--workers N] [--batch-size N] [--force]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
+
+from rag.embeddings import get_embeddings, embedding_model_id
+from rag.index import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    MANIFEST_FILE,
+    RAG_INDEX_DIR,
+    RAG_SOURCE_DIR,
+    current_index_version,
+    index_key,
+    load_index,
+    set_current_index,
+    source_checksums,
+    source_files,
+)
+
+RAG_INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", str(os.cpu_count() or 2)))
+RAG_INGEST_BATCH_SIZE = int(os.getenv("RAG_INGEST_BATCH_SIZE", "128"))
+
+
+@dataclass
+class IngestStats:
+    key: str = ""
+    files_total: int = 0
+    files_skipped: int = 0
+    files_ingested: int = 0
+    files_removed: int = 0
+    pages: int = 0
+    chunks: int = 0
+    # Wall time per stage; "parse" is time spent waiting on the parser pool
+    seconds: Dict[str, float] = field(
+        default_factory=lambda: dict.fromkeys(
+            ["checksum", "parse", "split", "embed", "index", "save"], 0.0
+        )
+    )
+
+    def report(self) -> dict:
+        def rate(count, stage):
+            elapsed = self.seconds[stage]
+            return round(count / elapsed, 1) if elapsed else None
+
+        throughput = {
+            "pages_per_s_parse": rate(self.pages, "parse"),
+            "chunks_per_s_split": rate(self.chunks, "split"),
+            "chunks_per_s_embed": rate(self.chunks, "embed"),
+            "chunks_per_s_index": rate(self.chunks, "index"),
+        }
+        return {**self.__dict__, "throughput": throughput}
+
+
+def parse_pdf(path: str, source: str) -> List[Tuple[str, int, str]]:
+    """Extract (source, page, text) for every page; runs in a worker process"""
+    reader = PdfReader(path)
+    return [
+        (source, number, page.extract_text() or "")
+        for number, page in enumerate(reader.pages)
+    ]
+
+
+def _read_manifest(index_dir: str, key: Optional[str]) -> Optional[dict]:
+    if key is None:
+        return None
+    try:
+        with open(os.path.join(index_dir, key, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _stream_pages(
+    jobs: List[Tuple[str, str]], workers: int, stats: IngestStats
+) -> Iterator[Tuple[str, int, str]]:
+    """Parse files in a process pool, yielding pages with bounded look-ahead"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        jobs = iter(jobs)
+        for path, source in jobs:
+            pending.append(pool.submit(parse_pdf, path, source))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            started = time.perf_counter()
+            pages = pending.popleft().result()
+            stats.seconds["parse"] += time.perf_counter() - started
+            for path, source in jobs:
+                pending.append(pool.submit(parse_pdf, path, source))
+                break
+            stats.files_ingested += 1
+            for page in pages:
+                stats.pages += 1
+                yield page
+
+
+def _stream_chunks(
+    pages: Iterator[Tuple[str, int, str]],
+    splitter: RecursiveCharacterTextSplitter,
+    stats: IngestStats,
+) -> Iterator[Document]:
+    for source, number, text in pages:
+        started = time.perf_counter()
+        chunks = splitter.split_documents(
+            [Document(page_content=text, metadata={"source": source, "page": number})]
+        )
+        stats.seconds["split"] += time.perf_counter() - started
+        yield from chunks
+
+
+def _batches(items: Iterator[Document], size: int) -> Iterator[List[Document]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ingest_directory(
+    source_dir: str = RAG_SOURCE_DIR,
+    index_dir: str = RAG_INDEX_DIR,
+    embeddings: Embeddings = None,
+    workers: int = RAG_INGEST_WORKERS,
+    batch_size: int = RAG_INGEST_BATCH_SIZE,
+    force: bool = False,
+) -> IngestStats:
+    """Bring the index in line with source_dir, touching only changed files"""
+    embeddings = embeddings or get_embeddings()
+    stats = IngestStats()
+    os.makedirs(index_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    files = source_files(source_dir)
+    checksums = source_checksums(files, source_dir)
+    stats.seconds["checksum"] = time.perf_counter() - started
+    stats.files_total = len(files)
+    stats.key = key = index_key(checksums, embeddings)
+
+    if not force and os.path.exists(os.path.join(index_dir, key, MANIFEST_FILE)):
+        set_current_index(index_dir, key)
+        stats.files_skipped = len(files)
+        return stats
+
+    model_id = embedding_model_id(embeddings)
+    previous = None
+    if not force:
+        previous = _read_manifest(index_dir, current_index_version(index_dir))
+    if previous and (
+        previous.get("chunk_size") != CHUNK_SIZE
+        or previous.get("chunk_overlap") != CHUNK_OVERLAP
+        or previous.get("embedding_model") != model_id
+        or "doc_ids" not in previous
+    ):
+        previous = None
+
+    vector_store = None
+    doc_ids: Dict[str, List[str]] = {}
+    if previous:
+        vector_store = load_index(previous["key"], embeddings, index_dir, mmap=False)
+        stale = []
+        for source, checksum in previous["files"].items():
+            if checksums.get(source) == checksum:
+                doc_ids[source] = previous["doc_ids"][source]
+            else:
+                stale.extend(previous["doc_ids"].get(source, []))
+                stats.files_removed += source not in checksums
+        if stale:
+            vector_store.delete(stale)
+
+    stats.files_skipped = len(doc_ids)
+    jobs = [
+        (os.path.join(source_dir, source), source)
+        for source in sorted(checksums)
+        if source not in doc_ids
+    ]
+    for _, source in jobs:
+        doc_ids[source] = []
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+    )
+    chunks = _stream_chunks(_stream_pages(jobs, workers, stats), splitter, stats)
+    for batch in _batches(chunks, batch_size):
+        started = time.perf_counter()
+        texts = [doc.page_content for doc in batch]
+        vectors = embeddings.embed_documents(texts)
+        stats.seconds["embed"] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        ids = [str(uuid.uuid4()) for _ in batch]
+        metadatas = [doc.metadata for doc in batch]
+        pairs = list(zip(texts, vectors))
+        if vector_store is None:
+            vector_store = FAISS.from_embeddings(
+                pairs, embeddings, metadatas=metadatas, ids=ids
+            )
+        else:
+            vector_store.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+        for doc, doc_id in zip(batch, ids):
+            doc_ids.setdefault(doc.metadata["source"], []).append(doc_id)
+        stats.chunks += len(batch)
+        stats.seconds["index"] += time.perf_counter() - started
+
+    if vector_store is None:
+        raise ValueError(f"No PDF text found in {source_dir}")
+
+    # Write into a scratch dir and rename, so readers never see half an index
+    started = time.perf_counter()
+    target = os.path.join(index_dir, key)
+    tmp_dir = tempfile.mkdtemp(dir=index_dir, prefix=f".{key}-")
+    vector_store.save_local(tmp_dir)
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+        json.dump(
+            {
+                "key": key,
+                "files": checksums,
+                "doc_ids": doc_ids,
+                "chunk_size": CHUNK_SIZE,
+                "chunk_overlap": CHUNK_OVERLAP,
+                "embedding_model": model_id,
+                "chunks": vector_store.index.ntotal,
+            },
+            f,
+        )
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.rename(tmp_dir, target)
+    set_current_index(index_dir, key)
+    stats.seconds["save"] = time.perf_counter() - started
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a directory of PDFs")
+    parser.add_argument("source_dir", nargs="?", default=RAG_SOURCE_DIR)
+    parser.add_argument("--index-dir", default=RAG_INDEX_DIR)
+    parser.add_argument("--workers", type=int, default=RAG_INGEST_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=RAG_INGEST_BATCH_SIZE)
+    parser.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+
+    stats = ingest_directory(
+        args.source_dir,
+        args.index_dir,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        force=args.force,
+    )
+    print(json.dumps(stats.report(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Process-local registry of the heavy RAG objects.
+
+Celery workers build it once per process (see celery_worker) so tasks only
+pay for retrieval and the LLM call, not for constructing clients or loading
+the index.
+"""
+
+import os
+import socket
+import threading
+import time
+from typing import Optional
+
+from langchain.chains import RetrievalQA
+
+from rag.batching import RAG_BATCH_WINDOW_MS, QuestionBatcher
+from rag.embeddings import get_embeddings
+from rag.index import get_vector_store, loaded_index_version
+
+RAG_LLM_BACKEND = os.getenv("RAG_LLM_BACKEND", "openai")
+RAG_LLM_MODEL = os.getenv("RAG_LLM_MODEL", "gpt-4")
+RAG_LLM_TEMPERATURE = float(os.getenv("RAG_LLM_TEMPERATURE", "0.3"))
+RAG_RETRIEVER_K = int(os.getenv("RAG_RETRIEVER_K", "4"))
+
+
+def build_llm(backend: str = None):
+    backend = backend or RAG_LLM_BACKEND
+    if backend == "fake":
+        from langchain_core.language_models import FakeListChatModel
+
+        return FakeListChatModel(responses=["This is a canned answer."])
+    if backend == "openai":
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(
+            temperature=RAG_LLM_TEMPERATURE,
+            model=RAG_LLM_MODEL,
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            streaming=True,
+        )
+    raise ValueError(f"Unknown LLM backend: {backend}")
+
+
+class RagRuntime:
+    def __init__(self):
+        self.embeddings = None
+        self.llm = None
+        self.vector_store = None
+        self.chain = None
+        self.index_version: Optional[str] = None
+        self.warmed_at: Optional[float] = None
+        self.warm_seconds: Optional[float] = None
+        self.tasks_served = 0
+        self.error: Optional[str] = None
+        self.batcher: Optional[QuestionBatcher] = None
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """Build clients, load the index and assemble the chain"""
+        started = time.perf_counter()
+        try:
+            with self._lock:
+                self.embeddings = self.embeddings or get_embeddings()
+                self.llm = self.llm or build_llm()
+                self._load_chain()
+            self.error = None
+        except Exception as e:
+            self.error = str(e)
+            raise
+        finally:
+            self.warm_seconds = time.perf_counter() - started
+            self.warmed_at = time.time()
+
+    def _load_chain(self):
+        self.vector_store = get_vector_store(self.embeddings)
+        retriever = self.vector_store.as_retriever(
+            search_type="similarity", search_kwargs={"k": RAG_RETRIEVER_K}
+        )
+        self.chain = RetrievalQA.from_chain_type(llm=self.llm, retriever=retriever)
+        self.index_version = loaded_index_version()
+
+    def get_chain(self, served: int = 1) -> RetrievalQA:
+        """Warm chain, rebuilt only when a new index has been published
+
+        served is the number of questions it is fetched for.
+        """
+        if self.chain is None:
+            self.warm_up()
+        elif get_vector_store(self.embeddings) is not self.vector_store:
+            with self._lock:
+                self._load_chain()
+        self.tasks_served += served
+        return self.chain
+
+    def ask(self, question: str, callbacks: Optional[list] = None) -> str:
+        """Answer question, micro-batched with concurrent ones when enabled"""
+        if RAG_BATCH_WINDOW_MS <= 0:
+            return self.get_chain().run(question, callbacks=callbacks)
+        if self.batcher is None:
+            with self._lock:
+                self.batcher = self.batcher or QuestionBatcher(self)
+        return self.batcher.ask(question, callbacks=callbacks)
+
+    def health(self) -> dict:
+        return {
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "ready": self.chain is not None and self.error is None,
+            "index_version": self.index_version,
+            "warmed_at": self.warmed_at,
+            "warm_seconds": self.warm_seconds,
+            "tasks_served": self.tasks_served,
+            "batches": self.batcher.batches if self.batcher else None,
+            "error": self.error,
+        }
+
+
+_runtime: Optional[RagRuntime] = None
+
+
+def get_runtime() -> RagRuntime:
+    global _runtime
+    if _runtime is None:
+        _runtime = RagRuntime()
+    return _runtime
@@ -0,0 +1,157 @@
+"""Token streaming for AI tasks over Redis Streams.
+
+The worker appends LLM tokens to ai_stream:{task_id}; API processes read
+the stream (from the start, so late subscribers replay what they missed)
+and forward it as Server-Sent Events.
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from redis_cache.redis_client import (
+    REDIS_STREAM_MAX_CONNECTIONS,
+    get_stream_redis,
+    get_sync_redis,
+    redis_client,
+)
+
+AI_STREAM_TTL = int(os.getenv("AI_STREAM_TTL", "3600"))
+AI_STREAM_MAXLEN = int(os.getenv("AI_STREAM_MAXLEN", "10000"))
+AI_STREAM_FLUSH_INTERVAL = float(os.getenv("AI_STREAM_FLUSH_INTERVAL", "0.05"))
+# Also the keep-alive interval; kept short so a read rarely waits long for
+# one of the stream pool's connections
+AI_STREAM_BLOCK_MS = int(os.getenv("AI_STREAM_BLOCK_MS", "5000"))
+# Open SSE streams per process, one stream pool connection each
+AI_STREAM_MAX_STREAMS = int(
+    os.getenv("AI_STREAM_MAX_STREAMS", str(REDIS_STREAM_MAX_CONNECTIONS))
+)
+
+CELERY_META_PREFIX = "celery-task-meta-"
+FINISHED_STATES = {"SUCCESS", "FAILURE", "REVOKED"}
+
+_open_streams = 0
+
+logger = logging.getLogger(__name__)
+
+
+def stream_key(task_id: str) -> str:
+    return f"ai_stream:{task_id}"
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisStreamCallbackHandler(BaseCallbackHandler):
+    """Publishes LLM tokens of one task, batched every flush interval"""
+
+    def __init__(self, task_id: str):
+        self.key = stream_key(task_id)
+        self.client = get_sync_redis()
+        self.buffer = []
+        self.last_flush = time.monotonic()
+
+    def _append(self, event: str, data: str):
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.xadd(
+                self.key,
+                {"event": event, "data": data},
+                maxlen=AI_STREAM_MAXLEN,
+                approximate=True,
+            )
+            pipe.expire(self.key, AI_STREAM_TTL)
+            pipe.execute()
+
+    def flush(self):
+        if self.buffer:
+            self._append("token", "".join(self.buffer))
+            self.buffer = []
+        self.last_flush = time.monotonic()
+
+    def on_llm_new_token(self, token: str, **kwargs: Any):
+        self.buffer.append(token)
+        if time.monotonic() - self.last_flush >= AI_STREAM_FLUSH_INTERVAL:
+            self.flush()
+
+    def finish(self, answer: str):
+        self.flush()
+        self._append("end", answer)
+
+    def fail(self, error: str):
+        self.flush()
+        self._append("error", error)
+
+
+async def get_task_meta(task_id: str) -> Optional[dict]:
+    """Status and result of a Celery task in a single GET on the result backend"""
+    raw = await redis_client.client.get(f"{CELERY_META_PREFIX}{task_id}")
+    return json.loads(raw) if raw else None
+
+
+def _sse(event: str, data: str, event_id: str = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def streams_full() -> bool:
+    """Whether this process already has AI_STREAM_MAX_STREAMS streams open"""
+    return _open_streams >= AI_STREAM_MAX_STREAMS
+
+
+async def sse_events(
+    task_id: str, request, last_id: str = "0-0"
+) -> AsyncIterator[str]:
+    """Replay and follow the token stream of a task as SSE frames"""
+    global _open_streams
+    # Counted from inside, so a stream is released however it ends
+    _open_streams += 1
+    try:
+        async for frame in _follow(task_id, request, last_id):
+            yield frame
+    finally:
+        _open_streams -= 1
+
+
+async def _follow(task_id: str, request, last_id: str) -> AsyncIterator[str]:
+    key = stream_key(task_id)
+    if not await redis_client.client.exists(key):
+        meta = await get_task_meta(task_id)
+        if meta and meta.get("status") in FINISHED_STATES:
+            event = "end" if meta["status"] == "SUCCESS" else "error"
+            yield _sse(event, str(meta.get("result")))
+            return
+
+    while not await request.is_disconnected():
+        try:
+            response = await get_stream_redis().xread(
+                {key: last_id}, count=100, block=AI_STREAM_BLOCK_MS
+            )
+        except Exception as e:
+            # Ends the stream; EventSource clients reconnect with Last-Event-ID
+            logger.warning("Redis stream read failed", extra={"error": str(e)})
+            return
+        if not response:
+            # Nothing new: the stream may be gone (expired, cached answer or
+            # worker crash), so fall back to the result backend
+            meta = await get_task_meta(task_id)
+            if meta and meta.get("status") in FINISHED_STATES:
+                event = "end" if meta["status"] == "SUCCESS" else "error"
+                yield _sse(event, str(meta.get("result")))
+                return
+            yield ": keep-alive\n\n"
+            continue
+
+        for message_id, fields in response[0][1]:
+            last_id = _text(message_id)
+            fields = {_text(k): _text(v) for k, v in fields.items()}
+            yield _sse(fields["event"], fields["data"], last_id)
+            if fields["event"] in ("end", "error"):
+                return
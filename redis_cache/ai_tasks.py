@@ -1,38 +1,58 @@
-from celery_worker.celery_worker import celery_app
-from langchain.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import FAISS
-from langchain.chat_models import ChatOpenAI
-from langchain.chains import RetrievalQA
-import os
+import logging
 
+from celery_worker.celery_worker import celery_app, report_worker_health
+from rag.index import build_index
+from rag.runtime import get_runtime
+from redis_cache.ai_stream import RedisStreamCallbackHandler
+from services.answer_cache import AnswerCacheService
+from services.rate_limit import release_ai_task_sync
+
+logger = logging.getLogger(__name__)
 
-@celery_app.task
-def ask_ai_task(question: str):
-    try:
-        base_path = os.path.join(os.path.dirname(__file__), "../api/ai")
-        files = ["LSTMPaper.pdf", "AttentionIsAllYouNeed.pdf"]
 
-        all_docs = []
-        for file in files:
-            file_path = os.path.join(base_path, file)
-            loader = PyPDFLoader(file_path)
-            docs = loader.load()
-            all_docs.extend(docs)
+@celery_app.task(bind=True)
+def ask_ai_task(self, question: str, index_version: str = None):
+    answer = None
+    runtime = get_runtime()
+    stream = RedisStreamCallbackHandler(self.request.id)
+    try:
+        # Warm chain built once per worker process, see celery_worker; with
+        # RAG_BATCH_WINDOW_MS set, concurrent tasks share retrieval
+        answer = runtime.ask(question, callbacks=[stream])
+        stream.finish(answer)
+        return answer
+    except Exception as e:
+        try:
+            stream.fail(str(e))
+        except Exception:
+            pass
+        return f"Error: {str(e)}"
+    finally:
+        # Failed runs only release the in-flight claim, they are never cached
+        try:
+            AnswerCacheService.record_answer(
+                question,
+                self.request.id,
+                answer,
+                version=runtime.index_version or index_version or "none",
+                inflight_version=index_version,
+            )
+        except Exception as e:
+            logger.warning("answer cache record failed", extra={"error": str(e)})
+        # Frees this task's place under the global AI cap
+        release_ai_task_sync(self.request.id)
 
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        split_docs = splitter.split_documents(all_docs)
 
-        embeddings = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
-        vector_store = FAISS.from_documents(split_docs, embeddings)
+@celery_app.task
+def rag_worker_health():
+    """Health of the warm RAG runtime in whichever worker process runs this"""
+    report_worker_health()
+    return get_runtime().health()
 
-        retriever = vector_store.as_retriever(search_type="similarity", k=4)
-        llm = ChatOpenAI(
-            temperature=0.3, model="gpt-4", openai_api_key=os.getenv("OPENAI_API_KEY")
-        )
-        qa_chain = RetrievalQA.from_chain_type(llm=llm, retriever=retriever)
 
-        return qa_chain.run(question)
-    except Exception as e:
-        return f"Error: {str(e)}"
+@celery_app.task
+def build_index_task(force: bool = False):
+    """Rebuild the RAG index if its inputs changed, off the question lane"""
+    key = build_index(force=force)
+    logger.info("RAG index built", extra={"index_version": key})
+    return key
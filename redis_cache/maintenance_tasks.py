@@ -0,0 +1,71 @@
+import logging
+import os
+import time
+from typing import List, Optional
+
+from celery_worker.celery_worker import MAINTENANCE_TASK_SOFT_TIME_LIMIT, celery_app
+from redis_cache.redis_client import get_sync_redis
+from services.cache_sweeper import (
+    CACHE_SWEEP_BATCH,
+    CACHE_SWEEP_MAX_KEYS_PER_SECOND,
+    LEGACY_PATTERNS,
+)
+
+# One run sweeps for this long, then re-enqueues itself at its SCAN cursor,
+# so no keyspace is too large to finish within the maintenance time limit
+CACHE_SWEEP_CHUNK_SECONDS = float(
+    os.getenv("CACHE_SWEEP_CHUNK_SECONDS", str(MAINTENANCE_TASK_SOFT_TIME_LIMIT / 2))
+)
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task
+def sweep_cache_task(
+    patterns: Optional[List[str]] = None,
+    max_keys_per_second: Optional[float] = CACHE_SWEEP_MAX_KEYS_PER_SECOND,
+    cursor: int = 0,
+    deleted: int = 0,
+):
+    """Run the cache sweeper, by default over the legacy key families
+
+    Sweeps patterns in order, continuing in a new task every
+    CACHE_SWEEP_CHUNK_SECONDS; cursor and deleted carry the first pattern's
+    progress over. Returns the keys deleted by this run.
+    """
+    patterns = list(patterns or LEGACY_PATTERNS)
+    client = get_sync_redis()
+    started = time.monotonic()
+    swept = 0
+    while patterns:
+        pattern = patterns[0]
+        regex = LEGACY_PATTERNS.get(pattern)
+        cursor, keys = client.scan(cursor, match=pattern, count=CACHE_SWEEP_BATCH)
+        if regex is not None:
+            keys = [key for key in keys if regex.fullmatch(key)]
+        if keys:
+            count = client.unlink(*keys)
+            swept += count
+            deleted += count
+        if max_keys_per_second:
+            # Sleep off whatever we are ahead of the allowed rate
+            ahead = swept / max_keys_per_second - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+        if cursor == 0:
+            logger.info(
+                "swept cache keys", extra={"pattern": pattern, "deleted": deleted}
+            )
+            patterns.pop(0)
+            deleted = 0
+        if patterns and time.monotonic() - started >= CACHE_SWEEP_CHUNK_SECONDS:
+            sweep_cache_task.apply_async(
+                kwargs={
+                    "patterns": patterns,
+                    "max_keys_per_second": max_keys_per_second,
+                    "cursor": cursor,
+                    "deleted": deleted,
+                }
+            )
+            break
+    return swept
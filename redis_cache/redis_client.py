@@ -1,52 +1,309 @@
-import redis
+import redis as sync_redis
+import redis.asyncio as redis
+import asyncio
 import json
+import logging
+import orjson
 import os
-from typing import Optional, Any
+import time
+import zstandard
+from typing import Optional, Any, AsyncIterator, Callable, Dict, Iterable, List
+from redis.asyncio.client import Pipeline
+
+from services.metrics import observe_redis
+
+logger = logging.getLogger(__name__)
+
+# Codec for new values; values written with any other codec stay readable
+REDIS_CODEC = os.getenv("REDIS_CODEC", "orjson")
+# Payloads at least this large are zstd-compressed, 0 turns compression off
+REDIS_COMPRESS_MIN_BYTES = int(os.getenv("REDIS_COMPRESS_MIN_BYTES", "2048"))
+REDIS_COMPRESS_LEVEL = int(os.getenv("REDIS_COMPRESS_LEVEL", "3"))
+
+# First byte of every encoded value: codec id, high bit set when compressed.
+# Legacy plain JSON values never start with these bytes.
+_COMPRESSED = 0x80
+
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+class JsonCodec:
+    id = 1
+
+    @staticmethod
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, default=str).encode()
+
+    @staticmethod
+    def loads(data: bytes) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    id = 2
+
+    @staticmethod
+    def dumps(value: Any) -> bytes:
+        return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+    @staticmethod
+    def loads(data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackCodec:
+    id = 3
+
+    @staticmethod
+    def dumps(value: Any) -> bytes:
+        import msgpack
+
+        return msgpack.packb(value, default=str, use_bin_type=True)
+
+    @staticmethod
+    def loads(data: bytes) -> Any:
+        import msgpack
+
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+CODECS = {"json": JsonCodec, "orjson": OrjsonCodec, "msgpack": MsgpackCodec}
+_CODECS_BY_ID = {codec.id: codec for codec in CODECS.values()}
+
+
+def encode_value(
+    value: Any,
+    codec=None,
+    compress_min_bytes: int = REDIS_COMPRESS_MIN_BYTES,
+    level: int = REDIS_COMPRESS_LEVEL,
+) -> bytes:
+    """Encode value as a version byte followed by the (maybe compressed) payload"""
+    codec = codec or CODECS[REDIS_CODEC]
+    payload = codec.dumps(value)
+    if compress_min_bytes and len(payload) >= compress_min_bytes:
+        compressed = zstandard.ZstdCompressor(level=level).compress(payload)
+        if len(compressed) < len(payload):
+            return bytes((codec.id | _COMPRESSED,)) + compressed
+    return bytes((codec.id,)) + payload
+
+
+def decode_value(data) -> Optional[Any]:
+    """Decode a value written by encode_value, or a legacy plain JSON one"""
+    if not data:
+        return None
+    if isinstance(data, str):
+        data = data.encode()
+    codec = _CODECS_BY_ID.get(data[0] & ~_COMPRESSED)
+    if codec is None:
+        # Written before the codec layer, or by code that writes raw JSON
+        return json.loads(data)
+    payload = data[1:]
+    if data[0] & _COMPRESSED:
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+    return codec.loads(payload)
+
+
+class _TimedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            observe_redis("PIPELINE", time.perf_counter() - started)
+
+
+class TimedRedis(redis.Redis):
+    """Async client recording the latency of every command it sends"""
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            observe_redis(args[0], time.perf_counter() - started)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> Pipeline:
+        return _TimedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
 
 
 class RedisClient:
     def __init__(self):
         self.redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-        self.client = redis.from_url(self.redis_url, decode_responses=True)
+        # One pool per process, shared by every coroutine in the event loop
+        self.pool = redis.ConnectionPool.from_url(
+            self.redis_url,
+            # Values are codec bytes, see encode_value
+            decode_responses=False,
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+            socket_timeout=_env_float("REDIS_SOCKET_TIMEOUT"),
+            socket_connect_timeout=_env_float("REDIS_CONNECT_TIMEOUT"),
+            health_check_interval=int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30")),
+        )
+        self.client = TimedRedis(connection_pool=self.pool)
+
+    @staticmethod
+    def serialize(value: Any) -> bytes:
+        return encode_value(value)
+
+    @staticmethod
+    def deserialize(value) -> Optional[Any]:
+        return decode_value(value)
 
     async def get(self, key: str) -> Optional[Any]:
         """Get value from Redis"""
         try:
-            value = self.client.get(key)
-            if value:
-                return json.loads(value)
-            return None
+            return self.deserialize(await self.client.get(key))
         except Exception as e:
-            print(f"Redis GET error: {e}")
+            logger.warning("Redis GET failed", extra={"error": str(e)})
             return None
 
     async def set(self, key: str, value: Any, expire: int = 300) -> bool:
         """Set value in Redis with expiration (default 5 minutes)"""
         try:
-            serialized_value = json.dumps(value, default=str)
-            return self.client.setex(key, expire, serialized_value)
+            return await self.client.setex(key, expire, self.serialize(value))
         except Exception as e:
-            print(f"Redis SET error: {e}")
+            logger.warning("Redis SET failed", extra={"error": str(e)})
             return False
 
     async def delete(self, key: str) -> bool:
         """Delete key from Redis"""
         try:
-            return bool(self.client.delete(key))
+            return bool(await self.client.delete(key))
         except Exception as e:
-            print(f"Redis DELETE error: {e}")
+            logger.warning("Redis DELETE failed", extra={"error": str(e)})
             return False
 
-    async def delete_pattern(self, pattern: str) -> int:
-        """Delete all keys matching pattern"""
+    async def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """Get several values in one round trip, None for missing keys"""
+        if not keys:
+            return []
         try:
-            keys = self.client.keys(pattern)
-            if keys:
-                return self.client.delete(*keys)
+            values = await self.client.mget(keys)
+            return [self.deserialize(value) for value in values]
+        except Exception as e:
+            logger.warning("Redis MGET failed", extra={"error": str(e)})
+            return [None] * len(keys)
+
+    async def mset_with_ttl(self, items: Dict[str, Any], expire: int = 300) -> bool:
+        """Set several values with the same expiration in one pipelined round trip"""
+        if not items:
+            return True
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key, value in items.items():
+                    pipe.setex(key, expire, self.serialize(value))
+                results = await pipe.execute()
+            return all(results)
+        except Exception as e:
+            logger.warning("Redis MSET failed", extra={"error": str(e)})
+            return False
+
+    async def delete_many(self, keys: Iterable[str], chunk_size: int = 500) -> int:
+        """Delete several keys, pipelined in chunks to keep each command small"""
+        keys = list(keys)
+        if not keys:
             return 0
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for start in range(0, len(keys), chunk_size):
+                    pipe.delete(*keys[start : start + chunk_size])
+                results = await pipe.execute()
+            return sum(results)
         except Exception as e:
-            print(f"Redis DELETE PATTERN error: {e}")
+            logger.warning("Redis DELETE MANY failed", extra={"error": str(e)})
             return 0
 
+    async def scan_iter_batches(
+        self, pattern: str, count: int = 500
+    ) -> AsyncIterator[List[str]]:
+        """Yield keys matching pattern in SCAN-sized batches, never blocking Redis"""
+        cursor = 0
+        while True:
+            cursor, keys = await self.client.scan(cursor, match=pattern, count=count)
+            if keys:
+                yield keys
+            if not cursor:
+                break
+
+    async def delete_pattern(
+        self,
+        pattern: str,
+        count: int = 500,
+        max_keys_per_second: Optional[float] = None,
+        where: Optional[Callable[[bytes], bool]] = None,
+    ) -> int:
+        """Delete all keys matching pattern with SCAN and UNLINK, optionally rate limited
+
+        where narrows the match further, for what a glob cannot express.
+        """
+        deleted = 0
+        started = time.monotonic()
+        try:
+            async for keys in self.scan_iter_batches(pattern, count):
+                if where is not None:
+                    keys = [key for key in keys if where(key)]
+                    if not keys:
+                        continue
+                deleted += await self.client.unlink(*keys)
+                if max_keys_per_second:
+                    # Sleep off whatever we are ahead of the allowed rate
+                    ahead = deleted / max_keys_per_second - (time.monotonic() - started)
+                    if ahead > 0:
+                        await asyncio.sleep(ahead)
+            return deleted
+        except Exception as e:
+            logger.warning("Redis DELETE PATTERN failed", extra={"error": str(e)})
+            return deleted
+
+    async def close(self):
+        """Release pooled connections"""
+        await self.client.aclose()
+        await self.pool.disconnect()
+
 
 redis_client = RedisClient()
+
+# Blocking stream reads (XREAD BLOCK) hold their connection for the whole block,
+# so they get a pool of their own rather than starving the shared one; when it
+# is exhausted a read waits up to the pool timeout for a connection
+REDIS_STREAM_MAX_CONNECTIONS = int(os.getenv("REDIS_STREAM_MAX_CONNECTIONS", "100"))
+REDIS_STREAM_POOL_TIMEOUT = float(os.getenv("REDIS_STREAM_POOL_TIMEOUT", "5"))
+
+_sync_client: Optional[sync_redis.Redis] = None
+_stream_client: Optional[redis.Redis] = None
+
+
+def get_sync_redis() -> sync_redis.Redis:
+    """Blocking binary-safe client for Celery workers and other sync code"""
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = sync_redis.Redis.from_url(
+            os.getenv("REDIS_URL", "redis://localhost:6379"),
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+            socket_timeout=_env_float("REDIS_SOCKET_TIMEOUT"),
+            socket_connect_timeout=_env_float("REDIS_CONNECT_TIMEOUT"),
+        )
+    return _sync_client
+
+
+def get_stream_redis() -> redis.Redis:
+    """Async client for blocking stream reads, on a bounded pool of its own"""
+    global _stream_client
+    if _stream_client is None:
+        pool = redis.BlockingConnectionPool.from_url(
+            os.getenv("REDIS_URL", "redis://localhost:6379"),
+            decode_responses=False,
+            max_connections=REDIS_STREAM_MAX_CONNECTIONS,
+            timeout=REDIS_STREAM_POOL_TIMEOUT,
+            # No socket timeout: a blocked read is idle on purpose
+            socket_connect_timeout=_env_float("REDIS_CONNECT_TIMEOUT"),
+            socket_keepalive=True,
+            health_check_interval=int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30")),
+        )
+        _stream_client = TimedRedis(connection_pool=pool)
+    return _stream_client
@@ -1,4 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import List, Optional
+import os
+
+TASK_BATCH_MAX_ITEMS = int(os.getenv("TASK_BATCH_MAX_ITEMS", "500"))
 
 
 class TaskBase(BaseModel):
@@ -19,3 +23,35 @@ class TaskOut(TaskBase):
 
     class Config:
         orm_mode = True
+
+
+class TaskFields(BaseModel):
+    """Task with only the requested fields set, for sparse listings"""
+
+    id: Optional[int] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+
+
+class TaskBatchCreate(BaseModel):
+    tasks: List[TaskCreate] = Field(..., min_length=1, max_length=TASK_BATCH_MAX_ITEMS)
+
+
+class TaskBatchUpdateItem(TaskUpdate):
+    id: int
+
+
+class TaskBatchUpdate(BaseModel):
+    tasks: List[TaskBatchUpdateItem] = Field(
+        ..., min_length=1, max_length=TASK_BATCH_MAX_ITEMS
+    )
+
+
+class TaskBatchDelete(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=TASK_BATCH_MAX_ITEMS)
+
+
+class TaskBatchResult(BaseModel):
+    id: int
+    status: str
+    task: Optional[TaskOut] = None
@@ -29,3 +29,11 @@ class UserLogin(BaseModel):
 class UserCreate(BaseModel):
     username: str
     password: str
+
+
+class Principal(BaseModel):
+    id: int
+    username: str
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,242 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from redis_cache.redis_client import redis_client, get_sync_redis
+from rag.index import current_index_version
+from services.metrics import CacheCounters
+
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_INFLIGHT_TTL = int(os.getenv("ANSWER_INFLIGHT_TTL", "900"))
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "true").lower() == "true"
+ANSWER_CACHE_SEMANTIC_THRESHOLD = float(
+    os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", "0.95")
+)
+ANSWER_CACHE_SEMANTIC_MAX = int(os.getenv("ANSWER_CACHE_SEMANTIC_MAX", "5000"))
+ANSWER_CACHE_SEMANTIC_REFRESH = float(
+    os.getenv("ANSWER_CACHE_SEMANTIC_REFRESH", "30")
+)
+# How long a process keeps serving the index version it last read from disk
+ANSWER_CACHE_VERSION_TTL = float(os.getenv("ANSWER_CACHE_VERSION_TTL", "5"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+answer_cache_stats = CacheCounters(
+    "answers", ("exact_hits", "semantic_hits", "inflight_dedup", "misses")
+)
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question: str) -> str:
+    return _WHITESPACE_RE.sub(" ", question).strip().rstrip("?!. ").lower()
+
+
+def question_hash(question: str) -> str:
+    return hashlib.sha256(normalize_question(question).encode()).hexdigest()[:32]
+
+
+def _normalized_vector(vector: List[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+class _SemanticIndex:
+    """Per-process matrix of answered question embeddings for one index version"""
+
+    def __init__(self):
+        self.version: Optional[str] = None
+        self.hashes: List[str] = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _fresh(self, version: str) -> bool:
+        return (
+            version == self.version
+            and time.monotonic() - self.loaded_at < ANSWER_CACHE_SEMANTIC_REFRESH
+        )
+
+    async def refresh(self, version: str):
+        if self._fresh(version):
+            return
+        # One rebuild at a time; whoever waited finds it fresh
+        async with self._lock:
+            if self._fresh(version):
+                return
+            # Reading and stacking every cached vector would stall the event loop
+            hashes, matrix = await asyncio.to_thread(self._load, version)
+            self.version = version
+            self.hashes = hashes
+            self.matrix = matrix
+            self.loaded_at = time.monotonic()
+
+    @staticmethod
+    def _load(version: str):
+        raw = get_sync_redis().hgetall(AnswerCacheService._vectors_key(version))
+        hashes, vectors = [], []
+        for qhash, encoded in raw.items():
+            hashes.append(qhash.decode())
+            vectors.append(np.frombuffer(base64.b64decode(encoded), dtype=np.float32))
+        matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), np.float32)
+        return hashes, matrix
+
+    def best_match(self, vector: np.ndarray):
+        if not self.hashes or self.matrix.shape[1] != vector.shape[0]:
+            return None, 0.0
+        scores = self.matrix @ vector
+        best = int(np.argmax(scores))
+        return self.hashes[best], float(scores[best])
+
+
+_semantic_index = _SemanticIndex()
+_embeddings = None
+# (version, monotonic time it was read)
+_index_version: Optional[tuple] = None
+
+
+def _get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        from rag.embeddings import get_embeddings
+
+        _embeddings = get_embeddings()
+    return _embeddings
+
+
+class AnswerCacheService:
+    @staticmethod
+    def _answer_key(version: str, qhash: str) -> str:
+        return f"ai_answer:{version}:{qhash}"
+
+    @staticmethod
+    def _inflight_key(version: str, qhash: str) -> str:
+        return f"ai_inflight:{version}:{qhash}"
+
+    @staticmethod
+    def _vectors_key(version: str) -> str:
+        return f"ai_question_vectors:{version}"
+
+    @staticmethod
+    def _order_key(version: str) -> str:
+        return f"ai_question_order:{version}"
+
+    @staticmethod
+    def index_version() -> str:
+        """Current index version, read from disk at most every ANSWER_CACHE_VERSION_TTL"""
+        global _index_version
+        now = time.monotonic()
+        if _index_version is None or now - _index_version[1] >= ANSWER_CACHE_VERSION_TTL:
+            _index_version = (current_index_version() or "none", now)
+        return _index_version[0]
+
+    @staticmethod
+    async def get_exact(version: str, qhash: str) -> Optional[dict]:
+        """Answer previously given to the same normalized question"""
+        cached = await redis_client.get(AnswerCacheService._answer_key(version, qhash))
+        if cached:
+            answer_cache_stats.incr("exact_hits")
+        return cached
+
+    @staticmethod
+    async def get_semantic(version: str, question: str) -> Optional[dict]:
+        """Answer to a past question whose embedding is close enough"""
+        if not ANSWER_CACHE_SEMANTIC:
+            return None
+        try:
+            await _semantic_index.refresh(version)
+            if not _semantic_index.hashes:
+                return None
+            vector = await asyncio.to_thread(_get_embeddings().embed_query, question)
+            qhash, score = _semantic_index.best_match(_normalized_vector(vector))
+        except Exception as e:
+            logger.warning("semantic answer cache failed", extra={"error": str(e)})
+            return None
+        if qhash is None or score < ANSWER_CACHE_SEMANTIC_THRESHOLD:
+            return None
+
+        cached = await redis_client.get(AnswerCacheService._answer_key(version, qhash))
+        if cached:
+            answer_cache_stats.incr("semantic_hits")
+            cached["similarity"] = score
+        return cached
+
+    @staticmethod
+    async def claim_inflight(version: str, qhash: str, task_id: str) -> Optional[str]:
+        """Register task_id as the run answering qhash.
+
+        Returns the id of a run already in flight instead, if there is one.
+        """
+        key = AnswerCacheService._inflight_key(version, qhash)
+        claimed = await redis_client.client.set(
+            key, task_id, nx=True, ex=ANSWER_INFLIGHT_TTL
+        )
+        if claimed:
+            answer_cache_stats.incr("misses")
+            return None
+        existing = await redis_client.client.get(key)
+        if existing is None:
+            # Run finished between SET and GET, claim again
+            return await AnswerCacheService.claim_inflight(version, qhash, task_id)
+        answer_cache_stats.incr("inflight_dedup")
+        return existing.decode()
+
+    @staticmethod
+    async def release_inflight(version: str, qhash: str):
+        await redis_client.delete(AnswerCacheService._inflight_key(version, qhash))
+
+    @staticmethod
+    def record_answer(
+        question: str,
+        task_id: str,
+        answer: str,
+        version: str,
+        inflight_version: Optional[str] = None,
+    ):
+        """Store a worker's answer and release the in-flight claim (sync, for Celery)"""
+        qhash = question_hash(question)
+        client = get_sync_redis()
+        with client.pipeline(transaction=False) as pipe:
+            pipe.delete(
+                AnswerCacheService._inflight_key(inflight_version or version, qhash)
+            )
+            if answer is not None:
+                pipe.setex(
+                    AnswerCacheService._answer_key(version, qhash),
+                    ANSWER_CACHE_TTL,
+                    json.dumps(
+                        {"task_id": task_id, "question": question, "answer": answer}
+                    ),
+                )
+            pipe.execute()
+
+        if answer is None or not ANSWER_CACHE_SEMANTIC:
+            return
+        vector = _normalized_vector(_get_embeddings().embed_query(question))
+        vectors_key = AnswerCacheService._vectors_key(version)
+        order_key = AnswerCacheService._order_key(version)
+        with client.pipeline(transaction=False) as pipe:
+            pipe.hset(vectors_key, qhash, base64.b64encode(vector.tobytes()))
+            pipe.zadd(order_key, {qhash: time.time()})
+            pipe.expire(vectors_key, ANSWER_CACHE_TTL)
+            pipe.expire(order_key, ANSWER_CACHE_TTL)
+            pipe.zcard(order_key)
+            size = pipe.execute()[-1]
+        if size > ANSWER_CACHE_SEMANTIC_MAX:
+            # Keep the semantic tier bounded by dropping the oldest questions
+            oldest = client.zpopmin(order_key, size - ANSWER_CACHE_SEMANTIC_MAX)
+            if oldest:
+                client.hdel(vectors_key, *(member for member, _ in oldest))
+
+    @staticmethod
+    def stats() -> dict:
+        return dict(answer_cache_stats)
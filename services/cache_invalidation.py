@@ -0,0 +1,76 @@
+"""Cross-worker invalidation for in-process caches.
+
+Each process that keeps a local cache subscribes to a Redis channel, and
+every writer publishes what it invalidated. Messages are JSON with the
+publishing process id, so a process skips its own (already applied) ones.
+Pub/sub is fire-and-forget: after a reconnect the subscriber resets its
+cache, since it may have missed messages, and local TTLs bound the damage
+of anything lost in between.
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from typing import Callable, Optional
+
+from redis_cache.redis_client import redis_client
+
+INSTANCE_ID = uuid.uuid4().hex
+
+logger = logging.getLogger(__name__)
+
+
+def encode_invalidation(**payload) -> str:
+    return json.dumps({"origin": INSTANCE_ID, **payload})
+
+
+class InvalidationSubscriber:
+    def __init__(
+        self,
+        channel: str,
+        on_message: Callable[[dict], None],
+        on_reset: Callable[[], None],
+        retry_delay: float = 1.0,
+    ):
+        self.channel = channel
+        self.on_message = on_message
+        self.on_reset = on_reset
+        self.retry_delay = retry_delay
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                async with redis_client.client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # Anything published while we were away is lost
+                    self.on_reset()
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        payload = json.loads(message["data"])
+                        if payload.get("origin") != INSTANCE_ID:
+                            self.on_message(payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(
+                    "cache invalidation subscriber failed",
+                    extra={"channel": self.channel, "error": str(e)},
+                )
+                self.on_reset()
+                await asyncio.sleep(self.retry_delay)
@@ -0,0 +1,87 @@
+"""Background sweeper for cache keys that no longer have an owner.
+
+Normal invalidation never deletes by pattern: task pages go stale through the
+user's generation counter and age out by TTL. This is for one-off cleanups,
+such as key families left behind by an older cache layout. It walks the
+keyspace with SCAN and UNLINKs at a bounded rate so Redis keeps serving.
+
+Migrating from an older task cache layout needs no flush: current code never
+reads the old keys, they expire by TTL, and running this with no patterns
+frees them early. Users' task collections fill on their next read.
+
+Usage: python -m services.cache_sweeper PATTERN [PATTERN ...] [--rate N]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import re
+from typing import Dict, Optional, Pattern
+
+from redis_cache.redis_client import redis_client
+from services.logging_config import configure_logging
+
+CACHE_SWEEP_BATCH = int(os.getenv("CACHE_SWEEP_BATCH", "500"))
+CACHE_SWEEP_MAX_KEYS_PER_SECOND = float(
+    os.getenv("CACHE_SWEEP_MAX_KEYS_PER_SECOND", "2000")
+)
+
+logger = logging.getLogger(__name__)
+
+# Keys written by earlier task cache layouts, not read by anything any more,
+# with a regex for when the glob alone would also match current keys
+LEGACY_PATTERNS: Dict[str, Optional[Pattern]] = {
+    # Page index sets, before pages were invalidated by generation
+    "user_tasks_pages:*": None,
+    # One JSON blob of all of a user's tasks, before pages and collections;
+    # current page keys share the prefix but carry a page hash
+    "user_tasks:*": re.compile(rb"user_tasks:\d+"),
+}
+
+
+async def sweep(
+    patterns: Dict[str, Optional[Pattern]] = LEGACY_PATTERNS,
+    batch: int = CACHE_SWEEP_BATCH,
+    max_keys_per_second: Optional[float] = CACHE_SWEEP_MAX_KEYS_PER_SECOND,
+) -> Dict[str, int]:
+    """Delete keys matching each pattern, returning how many went per pattern"""
+    deleted = {}
+    for pattern, regex in patterns.items():
+        deleted[pattern] = await redis_client.delete_pattern(
+            pattern,
+            count=batch,
+            max_keys_per_second=max_keys_per_second,
+            where=regex.fullmatch if regex else None,
+        )
+        logger.info(
+            "swept cache keys",
+            extra={"pattern": pattern, "deleted": deleted[pattern]},
+        )
+    return deleted
+
+
+async def _main(args):
+    try:
+        patterns = dict.fromkeys(args.patterns) or LEGACY_PATTERNS
+        await sweep(patterns, args.batch, args.rate or None)
+    finally:
+        await redis_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate-limited SCAN cache sweeper")
+    parser.add_argument("patterns", nargs="*")
+    parser.add_argument("--batch", type=int, default=CACHE_SWEEP_BATCH)
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=CACHE_SWEEP_MAX_KEYS_PER_SECOND,
+        help="max keys deleted per second, 0 for unlimited",
+    )
+    configure_logging()
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
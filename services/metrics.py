@@ -0,0 +1,245 @@
+"""Prometheus metrics for the API and the Celery workers.
+
+Request latency comes from MetricsMiddleware, database timing from
+SQLAlchemy cursor events (instrument_engine), Redis command timing from
+redis_cache.redis_client and cache hit/miss counts from CacheCounters.
+Celery task duration and queue wait are recorded by signal handlers
+(instrument_celery).
+
+With several processes per host (uvicorn workers, prefork children) set
+PROMETHEUS_MULTIPROC_DIR to an empty directory shared by them, so that
+metrics_registry() aggregates all of them.
+"""
+
+import contextvars
+import os
+import time
+from typing import Dict, Iterable, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Fast in-memory and Redis operations sit well below the default buckets
+_FAST_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5,
+)
+_REQUEST_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+_TASK_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ("method", "route", "status"),
+    buckets=_REQUEST_BUCKETS,
+)
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database statements executed per HTTP request",
+    ("route",),
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100),
+)
+HTTP_REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds",
+    "Time spent in database statements per HTTP request",
+    ("route",),
+    buckets=_FAST_BUCKETS,
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Database statement latency by statement kind",
+    ("statement",),
+    buckets=_FAST_BUCKETS,
+)
+REDIS_COMMAND_DURATION = Histogram(
+    "redis_command_duration_seconds",
+    "Redis command latency, pipelines counted as one PIPELINE command",
+    ("command",),
+    buckets=_FAST_BUCKETS,
+)
+CACHE_EVENTS = Counter(
+    "cache_events_total",
+    "Cache lookups and refills by key family and outcome",
+    ("family", "event"),
+)
+RATE_LIMIT_DECISIONS = Counter(
+    "rate_limit_decisions_total",
+    "Rate limit checks by policy and outcome: local (leased), redis, rejected, error",
+    ("policy", "decision"),
+)
+CELERY_TASK_DURATION = Histogram(
+    "celery_task_duration_seconds",
+    "Celery task run time by task and final state",
+    ("task", "state"),
+    buckets=_TASK_BUCKETS,
+)
+CELERY_TASK_QUEUE_WAIT = Histogram(
+    "celery_task_queue_wait_seconds",
+    "Time from publishing a Celery task to a worker starting it",
+    ("task",),
+    buckets=_TASK_BUCKETS,
+)
+
+# [statements, seconds] of the HTTP request being handled, None outside one
+_request_db: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar(
+    "request_db", default=None
+)
+
+
+def metrics_registry() -> CollectorRegistry:
+    """Registry to expose: every process's metrics in multiprocess mode"""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics() -> tuple:
+    """Body and content type of a Prometheus scrape"""
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
+
+
+class CacheCounters(dict):
+    """Per-process counts of one cache key family, mirrored to cache_events_total
+
+    Reads like the plain dict of counts it replaces; count with incr.
+    """
+
+    def __init__(self, family: str, events: Iterable[str]):
+        super().__init__(dict.fromkeys(events, 0))
+        self._children = {event: CACHE_EVENTS.labels(family, event) for event in self}
+
+    def incr(self, event: str, amount: int = 1):
+        self[event] += amount
+        if METRICS_ENABLED and amount:
+            self._children[event].inc(amount)
+
+
+def observe_redis(command, seconds: float):
+    if METRICS_ENABLED:
+        if isinstance(command, bytes):
+            command = command.decode()
+        REDIS_COMMAND_DURATION.labels(command.upper()).observe(seconds)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request and its database statements
+
+    Requests are labelled by route template (/tasks/{task_id}), so the
+    label set stays bounded; paths no route matched share "unmatched".
+    """
+
+    def __init__(self, app, exclude: Iterable[str] = ("/metrics",)):
+        self.app = app
+        self.exclude = frozenset(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not METRICS_ENABLED
+            or scope["type"] != "http"
+            or scope["path"] in self.exclude
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        db = [0, 0.0]
+        token = _request_db.set(db)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_db.reset(token)
+            # The router leaves the matched route in the scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_DURATION.labels(scope["method"], route, status).observe(
+                elapsed
+            )
+            HTTP_REQUEST_DB_QUERIES.labels(route).observe(db[0])
+            HTTP_REQUEST_DB_SECONDS.labels(route).observe(db[1])
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # One value, not a stack: statements on a connection never overlap, and
+    # the start of one that failed is simply overwritten by the next
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    kind = statement.lstrip().split(None, 1)[0].upper() if statement else "OTHER"
+    DB_QUERY_DURATION.labels(kind).observe(elapsed)
+    # Also counted when run by a task a request started, such as a cache refill
+    db = _request_db.get()
+    if db is not None:
+        db[0] += 1
+        db[1] += elapsed
+
+
+def instrument_engine(engine):
+    """Time every statement run on a sync Engine (async_engine.sync_engine for async)"""
+    from sqlalchemy import event
+
+    if METRICS_ENABLED:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# task id -> perf_counter at start, for tasks running in this process
+_task_started: Dict[str, float] = {}
+
+
+def _stamp_published(headers=None, **kwargs):
+    # Travels with the message; workers read it back as request.published_at
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+
+def _task_prerun(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+    published_at = getattr(task.request, "published_at", None)
+    if published_at:
+        CELERY_TASK_QUEUE_WAIT.labels(task.name).observe(
+            max(0.0, time.time() - float(published_at))
+        )
+
+
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        CELERY_TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(
+            time.perf_counter() - started
+        )
+
+
+def instrument_celery():
+    """Record task duration and queue wait; call where tasks are published and run"""
+    from celery.signals import before_task_publish, task_postrun, task_prerun
+
+    if METRICS_ENABLED:
+        before_task_publish.connect(_stamp_published, weak=False)
+        task_prerun.connect(_task_prerun, weak=False)
+        task_postrun.connect(_task_postrun, weak=False)
@@ -0,0 +1,50 @@
+from redis_cache.redis_client import redis_client
+from services.local_cache import LocalLRUCache
+from schemas.user_schemas import Principal
+from typing import Optional
+import os
+
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "300"))
+PRINCIPAL_LOCAL_TTL = float(os.getenv("PRINCIPAL_LOCAL_TTL", "30"))
+PRINCIPAL_LOCAL_SIZE = int(os.getenv("PRINCIPAL_LOCAL_SIZE", "10000"))
+
+_local_principals = LocalLRUCache(
+    maxsize=PRINCIPAL_LOCAL_SIZE, ttl=PRINCIPAL_LOCAL_TTL
+)
+
+
+class PrincipalCacheService:
+    @staticmethod
+    def _get_principal_cache_key(user_id: int) -> str:
+        return f"principal:{user_id}"
+
+    @staticmethod
+    async def get_principal(user_id: int) -> Optional[Principal]:
+        """Get authenticated user from the local LRU, falling back to Redis"""
+        principal = _local_principals.get(user_id)
+        if principal is not None:
+            return principal
+
+        cache_key = PrincipalCacheService._get_principal_cache_key(user_id)
+        cached = await redis_client.get(cache_key)
+        if cached:
+            principal = Principal(**cached)
+            _local_principals.set(user_id, principal)
+            return principal
+        return None
+
+    @staticmethod
+    async def cache_principal(principal: Principal):
+        """Store authenticated user in both cache tiers"""
+        _local_principals.set(principal.id, principal)
+        cache_key = PrincipalCacheService._get_principal_cache_key(principal.id)
+        await redis_client.set(
+            cache_key, principal.model_dump(), expire=PRINCIPAL_CACHE_TTL
+        )
+
+    @staticmethod
+    async def invalidate_principal(user_id: int):
+        """Drop cached user after it changes"""
+        _local_principals.delete(user_id)
+        cache_key = PrincipalCacheService._get_principal_cache_key(user_id)
+        await redis_client.delete(cache_key)
@@ -0,0 +1,237 @@
+"""Rate limiting and admission control backed by Redis.
+
+Each policy is a token bucket of `capacity` requests refilled evenly over
+`period` seconds, kept per user, per client IP or per route (one bucket
+shared by every caller). A bucket lives in a Redis hash and is updated
+atomically by one Lua call, using the Redis clock, so every API process
+shares it.
+
+Fast path: a caller well under its limit is granted a small lease of
+tokens at once, which this process then spends locally without asking
+Redis again. Leases are taken out of the shared bucket, so the limit
+holds across processes; unspent ones lapse after RATE_LIMIT_LEASE_TTL.
+Near the limit only single tokens are granted and every request is exact.
+
+AI tasks are also admitted against a global cap: a sorted set of in-flight
+task ids (queued or running, each with a lease expiry so a crashed worker
+cannot leak its slot) plus the depth of the Celery queue they go to,
+summed over its priority lists.
+
+Redis errors fail open: limiting is protection, not correctness.
+"""
+
+import logging
+import math
+import os
+from typing import Callable, Optional
+
+from fastapi import Depends, HTTPException, Request
+
+from celery_worker.celery_worker import RAG_QUEUE, queue_keys
+from redis_cache.redis_client import get_sync_redis, redis_client
+from services.local_cache import LocalLRUCache
+from services.metrics import RATE_LIMIT_DECISIONS
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Share of a bucket's capacity leased to one process at a time, 0 for no leases
+RATE_LIMIT_LEASE_FRACTION = float(os.getenv("RATE_LIMIT_LEASE_FRACTION", "0.1"))
+RATE_LIMIT_LEASE_TTL = float(os.getenv("RATE_LIMIT_LEASE_TTL", "1.0"))
+# Use the first X-Forwarded-For address; only behind a proxy that sets it
+RATE_LIMIT_TRUST_FORWARDED = (
+    os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+)
+
+# Global cap on AI tasks queued or running, and on the Celery queue behind them
+AI_MAX_INFLIGHT = int(os.getenv("AI_MAX_INFLIGHT", "50"))
+AI_MAX_QUEUE_DEPTH = int(os.getenv("AI_MAX_QUEUE_DEPTH", "200"))
+AI_QUEUE_NAME = os.getenv("AI_QUEUE_NAME", RAG_QUEUE)
+# Slot of a task whose worker never released it frees itself after this
+AI_SLOT_TTL = int(os.getenv("AI_SLOT_TTL", "900"))
+AI_ADMISSION_RETRY_AFTER = int(os.getenv("AI_ADMISSION_RETRY_AFTER", "5"))
+AI_INFLIGHT_KEY = "ai_inflight"
+
+logger = logging.getLogger(__name__)
+
+# Refills the bucket for the time since its last update, then grants up to
+# ARGV[3] tokens: all of them while at least twice that many are left, else
+# one, else none. KEYS = bucket. ARGV = capacity, tokens per ms, wanted.
+# Returns {granted, ms until a token is available when none was granted}.
+_TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = clock[1] * 1000 + math.floor(clock[2] / 1000)
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local last = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - last) * rate)
+local granted = 0
+if tokens >= wanted * 2 then
+    granted = wanted
+elseif tokens >= 1 then
+    granted = 1
+end
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+-- A full bucket needs no key
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate) + 1000)
+if granted > 0 then
+    return {granted, 0}
+end
+return {0, math.ceil((1 - tokens) / rate)}
+"""
+_token_bucket = redis_client.client.register_script(_TOKEN_BUCKET_LUA)
+
+# Takes an in-flight slot unless the cap or the queue depth is reached.
+# KEYS = in-flight zset, then the broker queue's lists. ARGV = member, cap,
+# max depth, slot ttl ms.
+_ADMIT_LUA = """
+local clock = redis.call('TIME')
+local now = clock[1] * 1000 + math.floor(clock[2] / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+if tonumber(ARGV[3]) > 0 then
+    local depth = 0
+    for i = 2, #KEYS do
+        depth = depth + redis.call('LLEN', KEYS[i])
+    end
+    if depth >= tonumber(ARGV[3]) then
+        return 0
+    end
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[4]), ARGV[1])
+return 1
+"""
+_admit = redis_client.client.register_script(_ADMIT_LUA)
+_ai_queue_keys = [AI_INFLIGHT_KEY] + queue_keys(AI_QUEUE_NAME)
+
+# bucket key -> [tokens left] of this process's lease, dropped when it lapses
+_leases = LocalLRUCache(maxsize=100_000, ttl=RATE_LIMIT_LEASE_TTL)
+
+
+class RateLimitPolicy:
+    """Token bucket of capacity requests per period seconds, one per scope key
+
+    scope is "user", "ip" or "route". limit reads "capacity/period", such
+    as "10/60", so policies can come straight from the environment.
+    """
+
+    def __init__(self, name: str, limit: str, scope: str):
+        capacity, _, period = limit.partition("/")
+        self.name = name
+        self.scope = scope
+        self.capacity = int(capacity)
+        self.period = float(period or 1)
+        self.rate_per_ms = self.capacity / (self.period * 1000)
+        self.lease = max(1, int(self.capacity * RATE_LIMIT_LEASE_FRACTION))
+
+    def key(self, identity: str) -> str:
+        return f"ratelimit:{self.name}:{identity}"
+
+
+def too_many_requests(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many requests, retry later",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+async def hit(policy: RateLimitPolicy, identity: str) -> Optional[float]:
+    """Count one request; None if allowed, else seconds until one would be"""
+    key = policy.key(identity)
+    lease = _leases.get(key)
+    if lease is not None and lease[0] > 0:
+        lease[0] -= 1
+        RATE_LIMIT_DECISIONS.labels(policy.name, "local").inc()
+        return None
+
+    try:
+        granted, retry_ms = await _token_bucket(
+            keys=[key], args=[policy.capacity, policy.rate_per_ms, policy.lease]
+        )
+    except Exception as e:
+        logger.warning(
+            "rate limit check failed, allowing",
+            extra={"policy": policy.name, "error": str(e)},
+        )
+        RATE_LIMIT_DECISIONS.labels(policy.name, "error").inc()
+        return None
+    if not granted:
+        RATE_LIMIT_DECISIONS.labels(policy.name, "rejected").inc()
+        return retry_ms / 1000
+    if granted > 1:
+        # One token is this request, the rest are spent locally
+        _leases.set(key, [granted - 1])
+    RATE_LIMIT_DECISIONS.labels(policy.name, "redis").inc()
+    return None
+
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def route_key() -> str:
+    return "all"
+
+
+def rate_limit(policy: RateLimitPolicy, key: Optional[Callable] = None):
+    """Dependency rejecting requests over policy with 429 and Retry-After
+
+    key is a dependency returning the caller's identity, such as the user
+    id for "user" policies; it defaults to the client IP, or to one shared
+    key for "route" policies.
+    """
+    if key is None:
+        key = route_key if policy.scope == "route" else client_ip
+
+    async def check(identity: str = Depends(key)):
+        if not RATE_LIMIT_ENABLED:
+            return
+        retry_after = await hit(policy, identity)
+        if retry_after is not None:
+            raise too_many_requests(retry_after)
+
+    return check
+
+
+async def admit_ai_task(task_id: str) -> bool:
+    """Take a global in-flight slot for task_id, False when AI work is saturated"""
+    if not RATE_LIMIT_ENABLED:
+        return True
+    try:
+        admitted = await _admit(
+            keys=_ai_queue_keys,
+            args=[task_id, AI_MAX_INFLIGHT, AI_MAX_QUEUE_DEPTH, AI_SLOT_TTL * 1000],
+        )
+    except Exception as e:
+        logger.warning("AI admission check failed, allowing", extra={"error": str(e)})
+        return True
+    RATE_LIMIT_DECISIONS.labels("ai_inflight", "redis" if admitted else "rejected").inc()
+    return bool(admitted)
+
+
+async def release_ai_task(task_id: str):
+    try:
+        await redis_client.client.zrem(AI_INFLIGHT_KEY, task_id)
+    except Exception as e:
+        logger.warning("AI slot release failed", extra={"error": str(e)})
+
+
+def release_ai_task_sync(task_id: str):
+    """release_ai_task for Celery workers"""
+    try:
+        get_sync_redis().zrem(AI_INFLIGHT_KEY, task_id)
+    except Exception as e:
+        logger.warning("AI slot release failed", extra={"error": str(e)})
+
+
+def ai_saturated() -> HTTPException:
+    return too_many_requests(AI_ADMISSION_RETRY_AFTER)
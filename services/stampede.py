@@ -0,0 +1,172 @@
+"""Cache stampede protection shared by the cache services.
+
+A refill of one key is coalesced within a process (single-flight) and
+across processes (a short Redis lock; losers wait for the winner's value).
+Entries carry their logical expiry and how long they took to compute, are
+refreshed early with probability rising towards expiry (XFetch), and stay
+in Redis for a short stale window past expiry, during which they are still
+served while one background refresh runs. TTLs are jittered so keys filled
+together do not expire together.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import random
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from redis_cache.redis_client import redis_client
+from services.metrics import CacheCounters
+
+logger = logging.getLogger(__name__)
+
+STAMPEDE_PROTECTION = os.getenv("CACHE_STAMPEDE_PROTECTION", "true").lower() == "true"
+CACHE_TTL_JITTER = float(os.getenv("CACHE_TTL_JITTER", "0.1"))
+# How long past logical expiry an entry may still be served while it refreshes
+CACHE_STALE_TTL = int(os.getenv("CACHE_STALE_TTL", "30"))
+# XFetch beta: > 1 favours earlier refreshes, 0 disables them
+CACHE_XFETCH_BETA = float(os.getenv("CACHE_XFETCH_BETA", "1.0"))
+CACHE_LOCK_TTL_MS = int(os.getenv("CACHE_LOCK_TTL_MS", "5000"))
+# How long a request that lost the lock waits for the winner before loading itself
+CACHE_LOCK_WAIT = float(os.getenv("CACHE_LOCK_WAIT", "0.5"))
+CACHE_LOCK_POLL = 0.02
+
+_RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+_release_lock = redis_client.client.register_script(_RELEASE_LOCK_LUA)
+
+# Also exported as cache_events_total{family="stampede"}
+stampede_stats = CacheCounters(
+    "stampede", ("loads", "coalesced", "stale_served", "early_refreshes")
+)
+
+
+def jittered_ttl(ttl: int, jitter: float = CACHE_TTL_JITTER) -> int:
+    return max(1, round(ttl * random.uniform(1 - jitter, 1 + jitter)))
+
+
+def stamp(entry: dict, ttl: int, delta: float) -> Tuple[dict, int]:
+    """Record logical expiry and compute time on entry, returning it with its Redis TTL"""
+    entry["expires_at"] = time.time() + ttl
+    entry["delta"] = round(delta, 4)
+    return entry, ttl + CACHE_STALE_TTL
+
+
+def is_expired(entry: dict) -> bool:
+    return time.time() >= entry.get("expires_at", math.inf)
+
+
+def should_refresh(entry: dict, beta: float = CACHE_XFETCH_BETA) -> bool:
+    """XFetch: refresh early with probability growing as expiry gets closer"""
+    expires_at = entry.get("expires_at")
+    if expires_at is None:
+        return False
+    gap = entry.get("delta", 0.0) * beta * -math.log(1.0 - random.random())
+    return time.time() + gap >= expires_at
+
+
+class SingleFlight:
+    """Run one load per key at a time in this process; others await its result"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    def start(self, key: str, fn: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self._calls.get(key)
+        if task is None:
+            # A task of its own, so a cancelled caller does not cancel the others
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        else:
+            stampede_stats.incr("coalesced")
+        return task
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        return await asyncio.shield(self.start(key, fn))
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+
+single_flight = SingleFlight()
+
+
+async def acquire_lock(key: str, ttl_ms: int = CACHE_LOCK_TTL_MS) -> Optional[str]:
+    token = uuid.uuid4().hex
+    try:
+        if await redis_client.client.set(f"lock:{key}", token, nx=True, px=ttl_ms):
+            return token
+        return None
+    except Exception as e:
+        logger.warning("Redis LOCK failed", extra={"error": str(e)})
+        # Without Redis there is nobody to coordinate with
+        return token
+
+
+async def release_lock(key: str, token: str):
+    try:
+        await _release_lock(keys=[f"lock:{key}"], args=[token])
+    except Exception as e:
+        logger.warning("Redis UNLOCK failed", extra={"error": str(e)})
+
+
+async def get_or_refill(
+    key: str,
+    read: Callable[[], Awaitable[Tuple[Optional[dict], Any]]],
+    load: Callable[[Any], Awaitable[Any]],
+) -> Any:
+    """Serve key from cache, refilling it at most once at a time
+
+    read returns the cached entry (None on a miss) and a context for load,
+    such as the generation it was read at; load queries the source, stores
+    the result and returns it.
+    """
+    entry, context = await read()
+    if not STAMPEDE_PROTECTION:
+        return entry if entry is not None and not is_expired(entry) else await load(context)
+
+    if entry is not None:
+        expired = is_expired(entry)
+        if expired or should_refresh(entry):
+            stampede_stats.incr("stale_served" if expired else "early_refreshes")
+            single_flight.start(key, lambda: _refill(key, read, load, context, wait=False))
+        return entry
+
+    return await single_flight.do(key, lambda: _refill(key, read, load, context, wait=True))
+
+
+async def _refill(key, read, load, context, wait: bool):
+    token = await acquire_lock(key)
+    if token is None:
+        if not wait:
+            # Another process is already refreshing this key
+            return None
+        deadline = time.monotonic() + CACHE_LOCK_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(CACHE_LOCK_POLL)
+            entry, context = await read()
+            if entry is not None and not is_expired(entry):
+                return entry
+        logger.info("gave up waiting for refill, loading here", extra={"key": key})
+    try:
+        stampede_stats.incr("loads")
+        return await load(context)
+    except Exception as e:
+        if not wait:
+            logger.warning(
+                "background refresh failed", extra={"key": key, "error": str(e)}
+            )
+            return None
+        raise
+    finally:
+        if token is not None:
+            await release_lock(key, token)
@@ -1,89 +1,774 @@
 from redis_cache.redis_client import redis_client
+from services.cache_invalidation import InvalidationSubscriber, encode_invalidation
+from services.local_cache import LocalLRUCache
+from services.metrics import CacheCounters
+from services.stampede import (
+    CACHE_STALE_TTL,
+    CACHE_TTL_JITTER,
+    get_or_refill,
+    is_expired,
+    jittered_ttl,
+    single_flight,
+    stamp,
+    stampede_stats,
+)
 from db.models import Tasks
-from typing import List, Optional
-import json
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple
+import hashlib
+import itertools
+import logging
+import orjson
+import os
+import time
+
+# Base TTL; each entry gets it jittered, plus the stale window of services.stampede
+TASK_CACHE_TTL = int(os.getenv("TASK_CACHE_TTL", "300"))
+
+# A user's tasks are cached as one collection: a hash of id -> listing JSON and
+# a sorted set of ids. Single-task reads and unfiltered pages are served from it.
+# "write_through": writes patch the collection in place.
+# "invalidate": writes drop the collection, the next read reloads it.
+TASK_CACHE_MODE = os.getenv("TASK_CACHE_MODE", "write_through")
+# Users with more tasks than this use per-page and per-task entries instead
+TASK_COLLECTION_MAX_TASKS = int(os.getenv("TASK_COLLECTION_MAX_TASKS", "5000"))
+
+# Optional in-process tier in front of Redis; enable on every API worker or none,
+# since only workers with it enabled publish invalidations
+TASK_L1_ENABLED = os.getenv("TASK_L1_CACHE", "false").lower() == "true"
+TASK_L1_SIZE = int(os.getenv("TASK_L1_SIZE", "10000"))
+# Upper bound on staleness if an invalidation message is lost
+TASK_L1_TTL = float(os.getenv("TASK_L1_TTL", "5"))
+TASK_INVALIDATION_CHANNEL = "task_cache_invalidation"
+
+# ("task", id) -> (marker, task), ("page", key) -> (marker, page) and, read
+# from collections, ("collection_task", id) -> (marker, {"task": task or None})
+# and ("collection_page", user id, cursor, limit) -> (marker, page)
+_l1 = LocalLRUCache(maxsize=TASK_L1_SIZE, ttl=TASK_L1_TTL)
+# user id -> marker; bumping a user's marker orphans all of their L1 entries
+_l1_markers = LocalLRUCache(maxsize=TASK_L1_SIZE, ttl=float("inf"))
+_marker_counter = itertools.count(1)
+
+logger = logging.getLogger(__name__)
+
+cache_stats = {
+    family: CacheCounters(family, ("l1_hits", "l2_hits", "misses"))
+    for family in ("tasks", "pages", "collections")
+}
+
+
+# Drops every task entry listed in a user's tag set, then the set itself
+_INVALIDATE_TAGGED_LUA = """
+local keys = redis.call('SMEMBERS', KEYS[1])
+for i = 1, #keys, 500 do
+    redis.call('UNLINK', unpack(keys, i, math.min(i + 499, #keys)))
+end
+return redis.call('UNLINK', KEYS[1]) + #keys
+"""
+_invalidate_tagged = redis_client.client.register_script(_INVALIDATE_TAGGED_LUA)
+
+
+# Collection keys: KEYS = generation, loaded flag, id index (zset), rows (hash).
+# Rows are the listing JSON of each task, so a page body is their concatenation.
+# The flag is "0" for a user too large to cache, else "1:<number of tasks>".
+# Eviction can drop the index or rows and leave the flag; a non-empty
+# collection missing either is read as not loaded.
+
+# Stores a freshly loaded collection unless a write moved the generation since
+# the load began. ARGV: generation, ttl, loaded flag, then id/row pairs.
+_STORE_COLLECTION_LUA = """
+if (redis.call('GET', KEYS[1]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[3], KEYS[4])
+for i = 4, #ARGV, 2 do
+    redis.call('ZADD', KEYS[3], ARGV[i], ARGV[i])
+    redis.call('HSET', KEYS[4], ARGV[i], ARGV[i + 1])
+end
+local flag = ARGV[3]
+if flag == '1' then
+    flag = '1:' .. (#ARGV - 3) / 2
+end
+redis.call('SET', KEYS[2], flag, 'EX', ARGV[2])
+redis.call('EXPIRE', KEYS[3], ARGV[2])
+redis.call('EXPIRE', KEYS[4], ARGV[2])
+return 1
+"""
+_store_collection = redis_client.client.register_script(_STORE_COLLECTION_LUA)
+
+# Shared head of the read scripts: returns {generation, "0" or ""} unless the
+# collection is loaded and whole, and leaves loaded = '1' when it is
+_READ_LOADED_LUA = """
+local generation = redis.call('GET', KEYS[1]) or '0'
+local loaded = redis.call('GET', KEYS[2])
+if not loaded or string.sub(loaded, 1, 1) ~= '1' then
+    return {generation, loaded or ''}
+end
+-- Flags written before they carried a size count as non-empty
+if (tonumber(string.sub(loaded, 3)) or 1) > 0
+    and redis.call('EXISTS', KEYS[3], KEYS[4]) < 2 then
+    return {generation, ''}
+end
+loaded = '1'
+"""
+
+# Reads one page: {generation, loaded flag, ids, rows}, flag "" when absent.
+# ARGV: exclusive lower id bound ('-inf' for the first page), count.
+_READ_COLLECTION_LUA = _READ_LOADED_LUA + """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[3], ARGV[1], '+inf', 'LIMIT', 0, ARGV[2])
+if #ids == 0 then
+    return {generation, loaded, {}, {}}
+end
+return {generation, loaded, ids, redis.call('HMGET', KEYS[4], unpack(ids))}
+"""
+_read_collection = redis_client.client.register_script(_READ_COLLECTION_LUA)
+
+# Reads one task: {generation, loaded flag, row}. ARGV: task id.
+_READ_COLLECTION_TASK_LUA = _READ_LOADED_LUA + """
+return {generation, loaded, redis.call('HGET', KEYS[4], ARGV[1])}
+"""
+_read_collection_task = redis_client.client.register_script(_READ_COLLECTION_TASK_LUA)
+
+# Applies a write to a loaded collection and moves to a new generation; a
+# partly evicted one is dropped instead, to be reloaded whole.
+# ARGV: number of upserts, then id/row pairs, then deleted ids.
+_PATCH_COLLECTION_LUA = """
+local loaded = redis.call('GET', KEYS[2])
+if not loaded or string.sub(loaded, 1, 1) ~= '1' then
+    loaded = nil
+elseif (tonumber(string.sub(loaded, 3)) or 1) > 0
+    and redis.call('EXISTS', KEYS[3], KEYS[4]) < 2 then
+    redis.call('DEL', KEYS[2], KEYS[3], KEYS[4])
+    loaded = nil
+end
+if loaded then
+    local upserts = tonumber(ARGV[1])
+    for i = 2, upserts * 2, 2 do
+        redis.call('ZADD', KEYS[3], ARGV[i], ARGV[i])
+        redis.call('HSET', KEYS[4], ARGV[i], ARGV[i + 1])
+    end
+    for i = upserts * 2 + 2, #ARGV do
+        redis.call('ZREM', KEYS[3], ARGV[i])
+        redis.call('HDEL', KEYS[4], ARGV[i])
+    end
+    redis.call('SET', KEYS[2], '1:' .. redis.call('ZCARD', KEYS[3]), 'KEEPTTL')
+    -- An empty collection has no index or rows yet; created here, they
+    -- must expire with the flag
+    local ttl = redis.call('TTL', KEYS[2])
+    if ttl > 0 then
+        redis.call('EXPIRE', KEYS[3], ttl)
+        redis.call('EXPIRE', KEYS[4], ttl)
+    end
+end
+return redis.call('INCR', KEYS[1])
+"""
+_patch_collection = redis_client.client.register_script(_PATCH_COLLECTION_LUA)
+
+
+def body_etag(body: str, *variant: str) -> str:
+    """Strong ETag of a rendered response body, optionally per variant of it"""
+    digest = hashlib.blake2b(body.encode(), digest_size=12)
+    for part in variant:
+        digest.update(b"\0" + part.encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def _user_marker(user_id: int) -> int:
+    marker = _l1_markers.get(user_id)
+    if marker is None:
+        marker = next(_marker_counter)
+        _l1_markers.set(user_id, marker)
+    return marker
+
+
+def _l1_get(key: tuple, marker: int):
+    entry = _l1.get(key)
+    if entry is not None and entry[0] == marker:
+        return entry[1]
+    return None
+
+
+def _drop_local_users(user_ids: Iterable[int]):
+    for user_id in user_ids:
+        _l1_markers.set(user_id, next(_marker_counter))
+
+
+def _apply_invalidation(message: dict):
+    _drop_local_users(message.get("users", []))
+    for task_id in message.get("tasks", []):
+        _l1.delete(("task", task_id))
+        _l1.delete(("collection_task", task_id))
+
+
+def _reset_l1():
+    _l1.clear()
+    _l1_markers.clear()
+
+
+_invalidation_subscriber = InvalidationSubscriber(
+    TASK_INVALIDATION_CHANNEL, _apply_invalidation, _reset_l1
+)
+
+
+@asynccontextmanager
+async def _invalidating(users: Iterable[int] = (), tasks: Iterable[int] = ()):
+    """Pipeline executed on exit, then the invalidation published and applied
+
+    Other workers get the message after the pipeline's commands, and this
+    worker drops its local entries only once they ran (or failed): a read
+    meanwhile takes the old marker, so the old Redis value it may store
+    locally is orphaned rather than served.
+    """
+    users, tasks = list(users), list(tasks)
+    try:
+        async with redis_client.client.pipeline(transaction=False) as pipe:
+            yield pipe
+            if TASK_L1_ENABLED:
+                pipe.publish(
+                    TASK_INVALIDATION_CHANNEL,
+                    encode_invalidation(users=users, tasks=tasks),
+                )
+            await pipe.execute()
+    finally:
+        if TASK_L1_ENABLED:
+            _apply_invalidation({"users": users, "tasks": tasks})
 
 
 class TaskCacheService:
     @staticmethod
-    def _get_user_tasks_cache_key(user_id: int) -> str:
-        return f"user_tasks:{user_id}"
+    def _task_to_dict(task) -> dict:
+        return {
+            "id": task.id,
+            "title": task.title,
+            "description": task.description,
+            "user_id": task.user_id,
+        }
 
     @staticmethod
     def _get_task_cache_key(task_id: int) -> str:
         return f"task:{task_id}"
 
     @staticmethod
-    async def get_user_tasks_from_cache(user_id: int) -> Optional[List[dict]]:
-        """Get user's tasks from cache"""
-        cache_key = TaskCacheService._get_user_tasks_cache_key(user_id)
-        cached_tasks = await redis_client.get(cache_key)
-        if cached_tasks:
-            print(f"Cache HIT for user {user_id} tasks")
-            return cached_tasks
-        print(f"Cache MISS for user {user_id} tasks")
-        return None
+    def _get_user_generation_key(user_id: int) -> str:
+        # Never expires: a reset counter could repeat a generation a live page holds
+        return f"user_tasks_gen:{user_id}"
 
     @staticmethod
-    async def cache_user_tasks(user_id: int, tasks: List[Tasks], expire: int = 300):
-        """Cache user's tasks"""
-        cache_key = TaskCacheService._get_user_tasks_cache_key(user_id)
-        tasks_dict = [
-            {
-                "id": task.id,
-                "title": task.title,
-                "description": task.description,
-                "user_id": task.user_id,
-            }
-            for task in tasks
+    def _get_user_task_keys_key(user_id: int) -> str:
+        return f"user_task_keys:{user_id}"
+
+    @staticmethod
+    def _get_collection_keys(user_id: int) -> List[str]:
+        return [
+            TaskCacheService._get_user_generation_key(user_id),
+            f"user_tasks_loaded:{user_id}",
+            f"user_tasks_ids:{user_id}",
+            f"user_tasks_rows:{user_id}",
         ]
-        await redis_client.set(cache_key, tasks_dict, expire=expire)
-        print(f"Cached {len(tasks)} tasks for user {user_id}")
+
+    @staticmethod
+    def _task_row_json(task: dict) -> bytes:
+        return orjson.dumps(
+            {"id": task["id"], "title": task["title"], "description": task["description"]}
+        )
+
+    @staticmethod
+    def _get_tag_ttl(expire: int) -> int:
+        # Outlive the longest jittered entry it lists
+        return round(expire * (1 + CACHE_TTL_JITTER)) + CACHE_STALE_TTL
+
+    @staticmethod
+    def _get_task_page_cache_key(
+        user_id: int,
+        cursor: Optional[int],
+        limit: int,
+        title_prefix: Optional[str],
+        query: Optional[str] = None,
+    ) -> str:
+        page = f"{cursor}:{limit}:{title_prefix}"
+        if query is not None:
+            # Search result pages, cursor being the offset into the ranking
+            page += f":search:{query}"
+        page = hashlib.sha1(page.encode()).hexdigest()
+        return f"user_tasks:{user_id}:{page[:16]}"
+
+    @staticmethod
+    async def get_task_page_from_cache(
+        user_id: int,
+        cursor: Optional[int],
+        limit: int,
+        title_prefix: Optional[str],
+        query: Optional[str] = None,
+    ) -> Tuple[Optional[dict], int]:
+        """Get one page of user's tasks from cache, with the user's current generation
+
+        Pass the generation back to cache_task_page on a miss, so a page built
+        from data read before a concurrent write is never served as fresh. A
+        page past its logical expiry is still returned while in the stale window.
+        """
+        cache_key = TaskCacheService._get_task_page_cache_key(
+            user_id, cursor, limit, title_prefix, query
+        )
+        stats = cache_stats["pages"]
+        if TASK_L1_ENABLED:
+            # Taken before the Redis read, so an invalidation arriving meanwhile
+            # keeps the page we are about to store locally from being served
+            marker = _user_marker(user_id)
+            cached_page = _l1_get(("page", cache_key), marker)
+            if cached_page is not None and not is_expired(cached_page):
+                stats.incr("l1_hits")
+                return cached_page, cached_page["generation"]
+
+        generation_key = TaskCacheService._get_user_generation_key(user_id)
+        generation, cached_page = await redis_client.mget([generation_key, cache_key])
+        generation = generation or 0
+        if (
+            cached_page
+            and cached_page.get("generation") == generation
+            and "body" in cached_page
+        ):
+            logger.debug(
+                "cache hit",
+                extra={"family": "pages", "user_id": user_id, "sampled": True},
+            )
+            stats.incr("l2_hits")
+            if TASK_L1_ENABLED:
+                _l1.set(("page", cache_key), (marker, cached_page))
+            return cached_page, generation
+        logger.debug(
+            "cache miss",
+            extra={"family": "pages", "user_id": user_id, "sampled": True},
+        )
+        stats.incr("misses")
+        return None, generation
+
+    @staticmethod
+    async def cache_task_page(
+        user_id: int,
+        cursor: Optional[int],
+        limit: int,
+        title_prefix: Optional[str],
+        tasks: List[dict],
+        next_cursor: Optional[int],
+        generation: int,
+        delta: float = 0.0,
+        expire: int = TASK_CACHE_TTL,
+        query: Optional[str] = None,
+    ) -> dict:
+        """Cache one page of user's tasks, tagged with the generation it was read at
+
+        The page is stored as its rendered JSON body and ETag, so a hit is
+        sent back as is, without validating or serializing it again.
+        """
+        cache_key = TaskCacheService._get_task_page_cache_key(
+            user_id, cursor, limit, title_prefix, query
+        )
+        body = orjson.dumps(tasks).decode()
+        page = {
+            "body": body,
+            "etag": body_etag(body),
+            "next_cursor": next_cursor,
+            "generation": generation,
+        }
+        page, ttl = stamp(page, jittered_ttl(expire), delta)
+        await redis_client.set(cache_key, page, expire=ttl)
+        logger.debug(
+            "cached page",
+            extra={"user_id": user_id, "tasks": len(tasks), "sampled": True},
+        )
+        return page
+
+    @staticmethod
+    async def get_or_load_page(
+        user_id: int,
+        cursor: Optional[int],
+        limit: int,
+        title_prefix: Optional[str],
+        loader: Callable[[], Awaitable[Tuple[List[dict], Optional[int]]]],
+        query: Optional[str] = None,
+    ) -> dict:
+        """Get one page of user's tasks, refilling it from loader at most once at a time
+
+        loader returns (items, next_cursor) and may run after the request has
+        finished, so it must not use the request's DB session. With query the
+        page is of search results; like any page it goes stale on the next
+        write to the user's tasks.
+        """
+
+        async def read():
+            return await TaskCacheService.get_task_page_from_cache(
+                user_id, cursor, limit, title_prefix, query
+            )
+
+        async def load(generation):
+            started = time.perf_counter()
+            items, next_cursor = await loader()
+            return await TaskCacheService.cache_task_page(
+                user_id,
+                cursor,
+                limit,
+                title_prefix,
+                items,
+                next_cursor,
+                generation,
+                delta=time.perf_counter() - started,
+                query=query,
+            )
+
+        cache_key = TaskCacheService._get_task_page_cache_key(
+            user_id, cursor, limit, title_prefix, query
+        )
+        return await get_or_refill(cache_key, read, load)
+
+    @staticmethod
+    def _render_collection_page(
+        ids: List[int], rows: List[bytes], limit: int
+    ) -> dict:
+        body = (b"[" + b",".join(rows[:limit]) + b"]").decode()
+        next_cursor = int(ids[limit - 1]) if len(ids) > limit else None
+        return {"body": body, "etag": body_etag(body), "next_cursor": next_cursor}
+
+    @staticmethod
+    async def _load_collection(
+        user_id: int, loader: Callable[[int], Awaitable[List[dict]]], generation: int
+    ) -> Optional[List[dict]]:
+        """Load and store user's collection once per process at a time, None if too large"""
+        keys = TaskCacheService._get_collection_keys(user_id)
+
+        async def store(args: list):
+            # Best effort, like every RedisClient call: the tasks are served anyway
+            try:
+                await _store_collection(keys=keys, args=args)
+            except Exception as e:
+                logger.warning("Redis collection store failed", extra={"error": str(e)})
+
+        async def load():
+            tasks = await loader(TASK_COLLECTION_MAX_TASKS)
+            args = [generation, jittered_ttl(TASK_CACHE_TTL)]
+            if len(tasks) > TASK_COLLECTION_MAX_TASKS:
+                await store(args + ["0"])
+                return None
+            rows = []
+            for task in tasks:
+                rows += [task["id"], TaskCacheService._task_row_json(task)]
+            await store(args + ["1"] + rows)
+            logger.debug(
+                "cached collection",
+                extra={"user_id": user_id, "tasks": len(tasks), "sampled": True},
+            )
+            return tasks
+
+        return await single_flight.do(f"{keys[3]}:load", load)
+
+    @staticmethod
+    async def get_or_load_collection_page(
+        user_id: int,
+        cursor: Optional[int],
+        limit: int,
+        loader: Callable[[int], Awaitable[List[dict]]],
+    ) -> Optional[dict]:
+        """Get one unfiltered page of user's tasks from their collection
+
+        On a miss loader(max_tasks) is called for all of the user's tasks in id
+        order, at most max_tasks + 1 of them; it may run after the request has
+        finished, so it must not use the request's DB session. Returns None when
+        the user has too many tasks for a collection, use get_or_load_page then.
+        """
+        keys = TaskCacheService._get_collection_keys(user_id)
+        lower = "-inf" if cursor is None else f"({cursor}"
+        stats = cache_stats["collections"]
+        l1_key = ("collection_page", user_id, cursor, limit)
+        if TASK_L1_ENABLED:
+            # Taken before the Redis read, as in get_task_page_from_cache
+            marker = _user_marker(user_id)
+            cached_page = _l1_get(l1_key, marker)
+            if cached_page is not None:
+                stats.incr("l1_hits")
+                return cached_page
+
+        async def read():
+            try:
+                reply = await _read_collection(keys=keys, args=[lower, limit + 1])
+            except Exception as e:
+                # Served from the database, as when any RedisClient call fails
+                logger.warning("Redis collection read failed", extra={"error": str(e)})
+                stats.incr("misses")
+                return None, 0
+            generation, loaded = int(reply[0]), reply[1]
+            if loaded == b"0":
+                return {"unavailable": True}, generation
+            if loaded != b"1" or None in reply[3]:
+                logger.debug(
+                    "cache miss",
+                    extra={"family": "collections", "user_id": user_id, "sampled": True},
+                )
+                stats.incr("misses")
+                return None, generation
+            logger.debug(
+                "cache hit",
+                extra={"family": "collections", "user_id": user_id, "sampled": True},
+            )
+            stats.incr("l2_hits")
+            return (
+                TaskCacheService._render_collection_page(reply[2], reply[3], limit),
+                generation,
+            )
+
+        async def load(generation):
+            tasks = await TaskCacheService._load_collection(user_id, loader, generation)
+            if tasks is None:
+                return {"unavailable": True}
+            page = [task for task in tasks if cursor is None or task["id"] > cursor]
+            return TaskCacheService._render_collection_page(
+                [task["id"] for task in page[: limit + 1]],
+                [TaskCacheService._task_row_json(task) for task in page[:limit]],
+                limit,
+            )
+
+        page = await get_or_refill(f"{keys[3]}:{cursor}:{limit}", read, load)
+        if page.get("unavailable"):
+            return None
+        if TASK_L1_ENABLED:
+            _l1.set(l1_key, (marker, page))
+        return page
 
     @staticmethod
     async def get_task_from_cache(task_id: int, user_id: int) -> Optional[dict]:
-        """Get single task from cache"""
+        """Get single task from the local tier, falling back to Redis"""
+        stats = cache_stats["tasks"]
+        if TASK_L1_ENABLED:
+            marker = _user_marker(user_id)
+            cached_task = _l1_get(("task", task_id), marker)
+            if (
+                cached_task is not None
+                and cached_task.get("user_id") == user_id
+                and not is_expired(cached_task)
+            ):
+                stats.incr("l1_hits")
+                return cached_task
+
         cache_key = TaskCacheService._get_task_cache_key(task_id)
         cached_task = await redis_client.get(cache_key)
 
         if cached_task and cached_task.get("user_id") == user_id:
-            print(f"Cache HIT for task {task_id}")
+            logger.debug(
+                "cache hit",
+                extra={"family": "tasks", "task_id": task_id, "sampled": True},
+            )
+            stats.incr("l2_hits")
+            if TASK_L1_ENABLED:
+                _l1.set(("task", task_id), (marker, cached_task))
             return cached_task
-        print(f"Cache MISS for task {task_id}")
+        logger.debug(
+            "cache miss",
+            extra={"family": "tasks", "task_id": task_id, "sampled": True},
+        )
+        stats.incr("misses")
         return None
 
     @staticmethod
-    async def cache_task(task: Tasks, expire: int = 300):
-        """Cache single task"""
+    async def cache_task(
+        task: Tasks, expire: int = TASK_CACHE_TTL, delta: float = 0.0
+    ) -> dict:
+        """Cache single task and tag it with its owner"""
         cache_key = TaskCacheService._get_task_cache_key(task.id)
-        task_dict = {
-            "id": task.id,
-            "title": task.title,
-            "description": task.description,
-            "user_id": task.user_id,
-        }
-        await redis_client.set(cache_key, task_dict, expire=expire)
-        print(f"Cached task {task.id}")
+        tag_key = TaskCacheService._get_user_task_keys_key(task.user_id)
+        task_dict, ttl = stamp(
+            TaskCacheService._task_to_dict(task), jittered_ttl(expire), delta
+        )
+        try:
+            async with redis_client.client.pipeline(transaction=False) as pipe:
+                pipe.setex(cache_key, ttl, redis_client.serialize(task_dict))
+                pipe.sadd(tag_key, cache_key)
+                pipe.expire(tag_key, TaskCacheService._get_tag_ttl(expire))
+                await pipe.execute()
+        except Exception as e:
+            logger.warning("Redis task store failed", extra={"error": str(e)})
+            return task_dict
+        logger.debug("cached task", extra={"task_id": task.id, "sampled": True})
+        return task_dict
+
+    @staticmethod
+    async def get_or_load_task(
+        task_id: int,
+        user_id: int,
+        loader: Callable[[], Awaitable[Optional[Tasks]]],
+        collection_loader: Callable[[int], Awaitable[List[dict]]],
+    ) -> Optional[dict]:
+        """Get single task from user's collection, refilling it at most once at a time
+
+        collection_loader is as for get_or_load_collection_page. For users too
+        large for a collection the task is cached on its own, loader returns it
+        or None. Either may run after the request has finished, so they must
+        not use the request's DB session.
+        """
+        keys = TaskCacheService._get_collection_keys(user_id)
+        stats = cache_stats["collections"]
+        l1_key = ("collection_task", task_id)
+        if TASK_L1_ENABLED:
+            marker = _user_marker(user_id)
+            entry = _l1_get(l1_key, marker)
+            if entry is not None:
+                stats.incr("l1_hits")
+                return entry["task"]
+
+        async def read_collection():
+            try:
+                reply = await _read_collection_task(keys=keys, args=[task_id])
+            except Exception as e:
+                # Served from the database, as in get_or_load_collection_page
+                logger.warning("Redis collection read failed", extra={"error": str(e)})
+                stats.incr("misses")
+                return None, 0
+            generation, loaded = int(reply[0]), reply[1]
+            if loaded == b"0":
+                return {"unavailable": True}, generation
+            if loaded != b"1":
+                stats.incr("misses")
+                return None, generation
+            # A loaded collection is complete, a missing row means no such task
+            stats.incr("l2_hits")
+            return {"task": orjson.loads(reply[2]) if reply[2] else None}, generation
+
+        async def load_collection(generation):
+            tasks = await TaskCacheService._load_collection(
+                user_id, collection_loader, generation
+            )
+            if tasks is None:
+                return {"unavailable": True}
+            return {"task": next((t for t in tasks if t["id"] == task_id), None)}
+
+        entry = await get_or_refill(
+            f"{keys[3]}:task:{task_id}", read_collection, load_collection
+        )
+        if not entry.get("unavailable"):
+            if TASK_L1_ENABLED:
+                _l1.set(l1_key, (marker, entry))
+            return entry["task"]
+
+        async def read():
+            return await TaskCacheService.get_task_from_cache(task_id, user_id), None
+
+        async def load(_):
+            started = time.perf_counter()
+            task = await loader()
+            if task is None:
+                return None
+            return await TaskCacheService.cache_task(
+                task, delta=time.perf_counter() - started
+            )
+
+        cache_key = TaskCacheService._get_task_cache_key(task_id)
+        return await get_or_refill(f"{cache_key}:{user_id}", read, load)
 
     @staticmethod
     async def invalidate_user_cache(user_id: int):
-        """Invalidate user's tasks cache"""
-        cache_key = TaskCacheService._get_user_tasks_cache_key(user_id)
-        await redis_client.delete(cache_key)
-        print(f"Invalidated cache for user {user_id}")
+        """Invalidate every cached page of user's tasks by moving to a new generation"""
+        async with _invalidating(users=[user_id]) as pipe:
+            pipe.incr(TaskCacheService._get_user_generation_key(user_id))
+            # A write-through collection would miss whatever changed too
+            pipe.delete(TaskCacheService._get_collection_keys(user_id)[1])
+        logger.debug("invalidated user cache", extra={"user_id": user_id})
+
+    @staticmethod
+    async def apply_task_batch(user_id: int, upserted: List[dict], deleted_ids: List[int]):
+        """Apply written tasks to user's cached collection and pages in one round trip
+
+        Write-through mode patches the collection, invalidate mode drops it.
+        Either way filtered pages move to a new generation, and per-task
+        entries of the touched tasks are dropped rather than rewritten, so
+        no task is stored twice.
+        """
+        keys = TaskCacheService._get_collection_keys(user_id)
+        tag_key = TaskCacheService._get_user_task_keys_key(user_id)
+        touched = [task["id"] for task in upserted] + list(deleted_ids)
+        task_keys = [TaskCacheService._get_task_cache_key(i) for i in touched]
+        try:
+            async with _invalidating(users=[user_id], tasks=touched) as pipe:
+                if touched:
+                    pipe.delete(*task_keys)
+                    pipe.srem(tag_key, *task_keys)
+                if TASK_CACHE_MODE == "write_through":
+                    rows = []
+                    for task in upserted:
+                        rows += [task["id"], TaskCacheService._task_row_json(task)]
+                    await _patch_collection(
+                        keys=keys, args=[len(upserted), *rows, *deleted_ids], client=pipe
+                    )
+                else:
+                    pipe.incr(keys[0])
+                    pipe.delete(*keys[1:])
+        except Exception as e:
+            # The write is committed by now, so never fail the request over the cache
+            logger.warning("Redis task batch failed", extra={"error": str(e)})
+            await TaskCacheService._drop_after_failed_batch(user_id, touched, task_keys)
+            return
+        logger.debug(
+            "applied task batch to cache",
+            extra={
+                "user_id": user_id,
+                "upserted": len(upserted),
+                "deleted": len(deleted_ids),
+            },
+        )
+
+    @staticmethod
+    async def _drop_after_failed_batch(
+        user_id: int, touched: List[int], task_keys: List[str]
+    ):
+        """Best effort: drop whatever a batch that failed to apply may leave stale"""
+        keys = TaskCacheService._get_collection_keys(user_id)
+        try:
+            async with _invalidating(users=[user_id], tasks=touched) as pipe:
+                pipe.incr(keys[0])
+                pipe.delete(*keys[1:], *task_keys)
+        except Exception as e:
+            logger.warning(
+                "Redis invalidation failed", extra={"user_id": user_id, "error": str(e)}
+            )
 
     @staticmethod
     async def invalidate_task_cache(task_id: int):
         """Invalidate single task cache"""
         cache_key = TaskCacheService._get_task_cache_key(task_id)
-        await redis_client.delete(cache_key)
-        print(f"Invalidated cache for task {task_id}")
+        async with _invalidating(tasks=[task_id]) as pipe:
+            pipe.delete(cache_key)
+        logger.debug("invalidated task cache", extra={"task_id": task_id})
 
     @staticmethod
     async def invalidate_all_user_caches(user_id: int):
-        """Invalidate all caches related to a user"""
-        await TaskCacheService.invalidate_user_cache(user_id)
-        # Also invalidate individual task caches for this user's tasks
-        pattern = f"task:*"
-        await redis_client.delete_pattern(pattern)
-        print(f"Invalidated all caches for user {user_id}")
+        """Invalidate all caches related to a user, leaving other users' entries alone"""
+        tag_key = TaskCacheService._get_user_task_keys_key(user_id)
+        async with _invalidating(users=[user_id]) as pipe:
+            pipe.incr(TaskCacheService._get_user_generation_key(user_id))
+            pipe.delete(*TaskCacheService._get_collection_keys(user_id)[1:])
+            await _invalidate_tagged(keys=[tag_key], client=pipe)
+        logger.info("invalidated all user caches", extra={"user_id": user_id})
+
+    @staticmethod
+    async def start_invalidation_listener():
+        """Follow other workers' invalidations while the local tier is enabled"""
+        if TASK_L1_ENABLED:
+            await _invalidation_subscriber.start()
+
+    @staticmethod
+    async def stop_invalidation_listener():
+        await _invalidation_subscriber.stop()
+
+    @staticmethod
+    def stats() -> dict:
+        """Hits per tier and hit ratios for task and page lookups, and refill counts"""
+        report = {
+            "l1_enabled": TASK_L1_ENABLED,
+            "l1_entries": len(_l1),
+            "stampede": dict(stampede_stats),
+        }
+        for family, counts in cache_stats.items():
+            lookups = sum(counts.values())
+            report[family] = {
+                **counts,
+                "l1_hit_ratio": counts["l1_hits"] / lookups if lookups else None,
+                "l2_hit_ratio": counts["l2_hits"] / lookups if lookups else None,
+                "hit_ratio": (lookups - counts["misses"]) / lookups if lookups else None,
+            }
+        return report
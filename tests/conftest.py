@@ -0,0 +1,37 @@
+"""Shared fixtures: the app in-process on SQLite and fakeredis (benchmarks.app_env).
+
+Needs the dev packages of benchmarks/requirements.txt.
+"""
+
+import itertools
+
+import pytest
+
+from benchmarks import app_env
+from redis_cache.redis_client import redis_client
+from services import task_cache
+
+_usernames = itertools.count()
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def http():
+    await redis_client.client.flushall()
+    task_cache._reset_l1()
+    async with app_env.client() as client:
+        yield client
+
+
+@pytest.fixture
+def new_user(http):
+    """Registers and logs in a fresh user, returning auth headers"""
+
+    async def register():
+        return await app_env.login(http, f"test-user-{next(_usernames)}")
+
+    return register
@@ -0,0 +1,36 @@
+"""SSE streams read on their own Redis pool and are capped per process."""
+
+import pytest
+from redis.asyncio import BlockingConnectionPool
+
+import redis_cache.redis_client as redis_module
+from redis_cache import ai_stream
+from redis_cache.redis_client import get_sync_redis
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_stream_replays_tokens_and_releases_its_slot(http):
+    get_sync_redis().xadd(ai_stream.stream_key("t1"), {"event": "token", "data": "Hel"})
+    get_sync_redis().xadd(ai_stream.stream_key("t1"), {"event": "end", "data": "Hello"})
+
+    response = await http.get("/ai/tasks/t1/stream")
+    assert response.status_code == 200
+    events = [line for line in response.text.splitlines() if line.startswith("event")]
+    assert events == ["event: token", "event: end"]
+    assert ai_stream._open_streams == 0
+
+
+async def test_streams_beyond_the_cap_are_refused(http, monkeypatch):
+    monkeypatch.setattr(ai_stream, "AI_STREAM_MAX_STREAMS", 0)
+    response = await http.get("/ai/tasks/t1/stream")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_stream_reads_get_a_bounded_pool_of_their_own(monkeypatch):
+    monkeypatch.setattr(redis_module, "_stream_client", None)
+    pool = redis_module.get_stream_redis().connection_pool
+    assert isinstance(pool, BlockingConnectionPool)
+    assert pool.max_connections == redis_module.REDIS_STREAM_MAX_CONNECTIONS
+    assert pool is not redis_module.redis_client.pool
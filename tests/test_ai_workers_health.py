@@ -0,0 +1,42 @@
+"""RAG worker health reports are removed on shutdown and pruned when stale."""
+
+import json
+import os
+import socket
+import time
+
+import pytest
+
+from celery_worker.celery_worker import (
+    RAG_WORKER_HEALTH_MAX_AGE,
+    RAG_WORKERS_HEALTH_KEY,
+    drop_worker_health,
+)
+from redis_cache.redis_client import get_sync_redis, redis_client
+
+
+@pytest.mark.anyio
+async def test_stale_reports_are_dropped(http):
+    now = time.time()
+    await redis_client.client.hset(
+        RAG_WORKERS_HEALTH_KEY,
+        mapping={
+            "host:1": json.dumps({"pid": 1, "reported_at": now}),
+            "host:2": json.dumps(
+                {"pid": 2, "reported_at": now - RAG_WORKER_HEALTH_MAX_AGE - 1}
+            ),
+            "host:3": json.dumps({"pid": 3}),
+        },
+    )
+    response = await http.get("/ai/workers/health")
+    assert [worker["pid"] for worker in response.json()["workers"]] == [1]
+    assert await redis_client.client.hkeys(RAG_WORKERS_HEALTH_KEY) == [b"host:1"]
+
+
+def test_shutdown_drops_own_report():
+    client = get_sync_redis()
+    client.delete(RAG_WORKERS_HEALTH_KEY)
+    own = f"{socket.gethostname()}:{os.getpid()}"
+    client.hset(RAG_WORKERS_HEALTH_KEY, mapping={own: "{}", "other:1": "{}"})
+    drop_worker_health()
+    assert client.hkeys(RAG_WORKERS_HEALTH_KEY) == [b"other:1"]
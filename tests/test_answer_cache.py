@@ -0,0 +1,53 @@
+"""Answer cache hits, index version caching and the semantic index rebuild."""
+
+import base64
+import json
+
+import numpy as np
+import pytest
+
+from redis_cache.redis_client import get_sync_redis
+from services import answer_cache
+from services.answer_cache import AnswerCacheService, question_hash
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_cached_answer_carries_no_task_id(http, monkeypatch):
+    monkeypatch.setattr(AnswerCacheService, "index_version", staticmethod(lambda: "v1"))
+    key = AnswerCacheService._answer_key("v1", question_hash("What is RAG?"))
+    get_sync_redis().set(
+        key, json.dumps({"task_id": "gone", "question": "What is RAG?", "answer": "A"})
+    )
+
+    response = await http.post("/ai/ask-background", data={"question": "what is rag"})
+    assert response.json() == {
+        "task_id": None,
+        "status": "SUCCESS",
+        "answer": "A",
+        "cached": True,
+    }
+
+
+async def test_index_version_is_read_once_per_ttl(monkeypatch):
+    reads = []
+    monkeypatch.setattr(answer_cache, "_index_version", None)
+    monkeypatch.setattr(
+        answer_cache, "current_index_version", lambda: reads.append(1) or "v1"
+    )
+    assert [AnswerCacheService.index_version() for _ in range(3)] == ["v1"] * 3
+    assert len(reads) == 1
+
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_VERSION_TTL", 0)
+    AnswerCacheService.index_version()
+    assert len(reads) == 2
+
+
+async def test_semantic_index_loads_cached_vectors(http):
+    vector = np.array([0.6, 0.8], dtype=np.float32)
+    get_sync_redis().hset(
+        AnswerCacheService._vectors_key("v1"), "q1", base64.b64encode(vector.tobytes())
+    )
+    index = answer_cache._SemanticIndex()
+    await index.refresh("v1")
+    assert index.best_match(vector)[0] == "q1"
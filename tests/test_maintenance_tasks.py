@@ -0,0 +1,28 @@
+"""sweep_cache_task works in chunks and picks up where the last one stopped."""
+
+from redis_cache import maintenance_tasks
+from redis_cache.maintenance_tasks import sweep_cache_task
+from redis_cache.redis_client import get_sync_redis
+
+
+def test_sweep_continues_across_chunks(monkeypatch):
+    client = get_sync_redis()
+    client.flushall()
+    for i in range(300):
+        client.set(f"user_tasks_pages:{i}", 1)
+        client.set(f"user_tasks:{i}", 1)
+    # Current page keys share the legacy prefix and must survive
+    client.set("user_tasks:1:0123456789abcdef", 1)
+
+    runs = []
+    monkeypatch.setattr(maintenance_tasks, "CACHE_SWEEP_CHUNK_SECONDS", 0)
+    monkeypatch.setattr(
+        sweep_cache_task,
+        "apply_async",
+        lambda kwargs: runs.append(sweep_cache_task(**kwargs)),
+    )
+
+    first = sweep_cache_task(max_keys_per_second=None)
+    assert len(runs) > 1
+    assert first + sum(runs) == 600
+    assert client.keys("*") == [b"user_tasks:1:0123456789abcdef"]
@@ -0,0 +1,21 @@
+"""Statement timing keeps no state behind on a connection, even for failures."""
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+
+from services import metrics
+
+
+def test_failed_statements_leave_no_start_times(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY)"))
+        conn.execute(text("INSERT INTO t VALUES (1)"))
+        for _ in range(3):
+            with pytest.raises(IntegrityError):
+                conn.execute(text("INSERT INTO t VALUES (1)"))
+        conn.execute(text("SELECT id FROM t")).all()
+        assert "query_started" not in conn.info
@@ -0,0 +1,29 @@
+"""create_all builds the /tasks/search schema on Postgres, and only there."""
+
+from sqlalchemy import create_mock_engine
+
+from db.database import Base
+from db.models import Tasks
+
+
+def emitted_ddl(url):
+    statements = []
+
+    def record(sql, *args, **kwargs):
+        statements.append(str(sql.compile(dialect=engine.dialect)))
+
+    engine = create_mock_engine(url, record)
+    Base.metadata.create_all(engine, checkfirst=False)
+    return "\n".join(statements)
+
+
+def test_create_all_adds_search_schema_on_postgres():
+    ddl = emitted_ddl("postgresql://")
+    for name in Tasks.SEARCH_ONLY_SCHEMA:
+        assert name in ddl
+
+
+def test_create_all_skips_search_schema_elsewhere():
+    ddl = emitted_ddl("sqlite://")
+    for name in Tasks.SEARCH_ONLY_SCHEMA:
+        assert name not in ddl
@@ -0,0 +1,25 @@
+"""Cached principals are dropped when their user changes."""
+
+import pytest
+
+from auth import auth
+from schemas.user_schemas import Principal
+from services.principal_cache import PrincipalCacheService
+
+
+@pytest.mark.anyio
+async def test_password_rehash_drops_cached_principal(http, new_user, monkeypatch):
+    headers = await new_user()
+    me = (await http.get("/users/me", headers=headers)).json()
+    stale = Principal(id=me["id"], username="stale")
+    await PrincipalCacheService.cache_principal(stale)
+
+    async def verify_and_rehash(password, hashed_password):
+        return True, hashed_password
+
+    monkeypatch.setattr(auth, "verify_password_async", verify_and_rehash)
+    response = await http.post(
+        "/users/token", data={"username": me["username"], "password": "bench"}
+    )
+    assert response.status_code == 200
+    assert await PrincipalCacheService.get_principal(me["id"]) is None
@@ -0,0 +1,69 @@
+"""QuestionBatcher answers every caller, and never leaves one waiting."""
+
+import asyncio
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from rag.batching import QuestionBatcher
+
+
+class FakeCombine:
+    output_key = "output_text"
+
+    def __init__(self, answer=None, hang=False):
+        self.answer = answer
+        self.hang = hang
+
+    async def ainvoke(self, inputs, config=None):
+        if self.hang:
+            await asyncio.Event().wait()
+        if self.answer is None:
+            raise RuntimeError("LLM down")
+        return {self.output_key: f"{self.answer}: {inputs['question']}"}
+
+
+class FakeChain:
+    def __init__(self, combine):
+        self.combine_documents_chain = combine
+
+
+def batcher_for(chain, **kwargs):
+    batcher = QuestionBatcher(runtime=None, window_ms=5, **kwargs)
+    batcher.retrieve = lambda questions: (chain, [[] for _ in questions])
+    return batcher
+
+
+def test_each_caller_gets_its_own_answer():
+    batcher = batcher_for(FakeChain(FakeCombine("ok")))
+    assert batcher.ask("a") == "ok: a"
+    assert batcher.ask("b") == "ok: b"
+
+
+def test_llm_error_reaches_the_caller():
+    batcher = batcher_for(FakeChain(FakeCombine()))
+    with pytest.raises(RuntimeError, match="LLM down"):
+        batcher.ask("a")
+
+
+def test_broken_chain_reaches_the_caller():
+    batcher = batcher_for(object())
+    with pytest.raises(AttributeError):
+        batcher.ask("a")
+
+
+def test_retrieval_error_reaches_the_caller():
+    batcher = QuestionBatcher(runtime=None, window_ms=5)
+
+    def fail(questions):
+        raise ValueError("index gone")
+
+    batcher.retrieve = fail
+    with pytest.raises(ValueError, match="index gone"):
+        batcher.ask("a")
+
+
+def test_caller_gives_up_after_timeout():
+    batcher = batcher_for(FakeChain(FakeCombine("ok", hang=True)), timeout=0.2)
+    with pytest.raises(TimeoutError):
+        batcher.ask("a")
@@ -0,0 +1,291 @@
+"""Task cache consistency with the database, in both cache modes and with L1.
+
+Concurrent random writes, reads and listings run for a few users, then
+every listing and task read through the API is compared with the
+database.
+"""
+
+import asyncio
+import random
+
+import pytest
+from sqlalchemy import select
+
+from benchmarks import app_env
+from db.database import AsyncSessionLocal
+from db.models import Tasks
+from redis_cache.redis_client import redis_client
+from services import task_cache
+from services.task_cache import TaskCacheService
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(params=["write_through", "invalidate"])
+def cache_mode(request, monkeypatch):
+    monkeypatch.setattr(task_cache, "TASK_CACHE_MODE", request.param)
+    return request.param
+
+
+@pytest.fixture(params=[False, True], ids=["redis", "l1"])
+def l1_enabled(request, monkeypatch):
+    monkeypatch.setattr(task_cache, "TASK_L1_ENABLED", request.param)
+    return request.param
+
+
+async def random_writes(http, users, rng, ops):
+    for _ in range(ops):
+        headers = rng.choice(users)
+        listing = (await http.get("/tasks/?limit=20", headers=headers)).json()
+        ids = [task["id"] for task in listing]
+        op = rng.random()
+        if op < 0.3 or not ids:
+            await http.post(
+                "/tasks/",
+                json={"title": f"t{rng.randrange(10)}", "description": "new"},
+                headers=headers,
+            )
+        elif op < 0.55:
+            await http.put(
+                f"/tasks/{rng.choice(ids)}",
+                json={"title": f"t{rng.randrange(10)}", "description": "edited"},
+                headers=headers,
+            )
+        elif op < 0.7:
+            await http.delete(f"/tasks/{rng.choice(ids)}", headers=headers)
+        elif op < 0.8:
+            await http.post(
+                "/tasks/batch",
+                json={"tasks": [{"title": f"b{i}", "description": "batch"}
+                                for i in range(3)]},
+                headers=headers,
+            )
+        elif op < 0.9:
+            await http.request(
+                "DELETE", "/tasks/batch", json={"ids": ids[:2]}, headers=headers
+            )
+        else:
+            await http.get(f"/tasks/{rng.choice(ids)}", headers=headers)
+        await http.get("/tasks/?limit=7&title_prefix=t", headers=headers)
+
+
+async def walk(http, headers, query=""):
+    items, cursor = [], None
+    while True:
+        url = f"/tasks/?limit=7{query}" + (f"&cursor={cursor}" if cursor else "")
+        response = await http.get(url, headers=headers)
+        assert response.status_code == 200
+        items += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return items
+
+
+async def tasks_in_db(user_id):
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(Tasks.id, Tasks.title, Tasks.description)
+            .where(Tasks.user_id == user_id)
+            .order_by(Tasks.id)
+        )
+        return [dict(row) for row in result.mappings()]
+
+
+async def user_id(http, headers):
+    return (await http.get("/users/me", headers=headers)).json()["id"]
+
+
+async def test_cache_matches_database_after_concurrent_writes(
+    http, new_user, cache_mode, l1_enabled
+):
+    rng = random.Random(1)
+    users = [await new_user() for _ in range(3)]
+    await asyncio.gather(
+        *(random_writes(http, users, random.Random(rng.random()), 20) for _ in range(6))
+    )
+
+    for headers in users:
+        expected = await tasks_in_db(await user_id(http, headers))
+        assert await walk(http, headers) == expected
+        prefixed = [task for task in expected if task["title"].startswith("t")]
+        assert await walk(http, headers, "&title_prefix=t") == prefixed
+        for task in expected:
+            response = await http.get(f"/tasks/{task['id']}", headers=headers)
+            assert response.json() == task
+
+
+async def seed(http, headers, count=3):
+    response = await http.post(
+        "/tasks/batch",
+        json={"tasks": [{"title": f"s{i}", "description": "seed"} for i in range(count)]},
+        headers=headers,
+    )
+    return [item["id"] for item in response.json()]
+
+
+@pytest.mark.parametrize("evicted", [2, 3], ids=["ids", "rows"])
+async def test_partly_evicted_collection_is_reloaded(http, new_user, evicted):
+    headers = await new_user()
+    ids = await seed(http, headers)
+    keys = TaskCacheService._get_collection_keys(await user_id(http, headers))
+    await walk(http, headers)
+    assert await redis_client.client.exists(*keys[1:]) == 3
+
+    await redis_client.client.delete(keys[evicted])
+    response = await http.get(f"/tasks/{ids[1]}", headers=headers)
+    assert response.status_code == 200
+    assert [task["id"] for task in await walk(http, headers)] == ids
+
+
+async def test_patching_an_empty_collection_sets_ttls(http, new_user):
+    headers = await new_user()
+    keys = TaskCacheService._get_collection_keys(await user_id(http, headers))
+    assert await walk(http, headers) == []
+    assert await redis_client.client.get(keys[1]) == b"1:0"
+
+    await seed(http, headers, count=1)
+    assert await redis_client.client.get(keys[1]) == b"1:1"
+    for key in keys[1:]:
+        assert await redis_client.client.ttl(key) > 0
+
+
+async def test_collection_reads_are_served_from_l1(http, new_user, monkeypatch):
+    monkeypatch.setattr(task_cache, "TASK_L1_ENABLED", True)
+    headers = await new_user()
+    ids = await seed(http, headers)
+    stats = task_cache.cache_stats["collections"]
+    await walk(http, headers)
+    await http.get(f"/tasks/{ids[0]}", headers=headers)
+
+    l1_hits = stats["l1_hits"]
+    await walk(http, headers)
+    await http.get(f"/tasks/{ids[0]}", headers=headers)
+    assert stats["l1_hits"] == l1_hits + 2
+
+    # A write moves the user's marker, so the next read is not served stale
+    await http.put(
+        f"/tasks/{ids[0]}", json={"title": "renamed", "description": "x"}, headers=headers
+    )
+    response = await http.get(f"/tasks/{ids[0]}", headers=headers)
+    assert response.json()["title"] == "renamed"
+
+
+
+@pytest.fixture
+def redis_outage():
+    """Call it to take Redis down for the rest of the test"""
+
+    def down():
+        app_env.fake_server.connected = False
+
+    yield down
+    app_env.fake_server.connected = True
+
+
+async def test_listing_falls_back_to_the_database_without_redis(
+    http, new_user, redis_outage
+):
+    headers = await new_user()
+    created = await seed(http, headers)
+    redis_outage()
+
+    response = await http.get("/tasks/", headers=headers)
+    assert response.status_code == 200
+    assert [task["id"] for task in response.json()] == created
+
+
+async def test_writes_succeed_without_redis(http, new_user, redis_outage):
+    headers = await new_user()
+    ids = await seed(http, headers)
+    redis_outage()
+
+    created = await http.post(
+        "/tasks/", json={"title": "down", "description": "x"}, headers=headers
+    )
+    assert created.status_code == 200
+    updated = await http.put(
+        f"/tasks/{ids[0]}", json={"title": "down", "description": "y"}, headers=headers
+    )
+    assert updated.status_code == 200
+    assert (await http.delete(f"/tasks/{ids[1]}", headers=headers)).status_code == 200
+    ids_in_db = [task["id"] for task in await tasks_in_db(await user_id(http, headers))]
+    assert ids_in_db == [ids[0], ids[2], created.json()["id"]]
+
+
+async def test_failed_patch_drops_the_collection(http, new_user, monkeypatch):
+    headers = await new_user()
+    await seed(http, headers)
+    keys = TaskCacheService._get_collection_keys(await user_id(http, headers))
+    await walk(http, headers)
+    generation = int(await redis_client.client.get(keys[0]) or 0)
+
+    async def broken_patch(keys, args, client):
+        raise ConnectionError("lost Redis mid-batch")
+
+    monkeypatch.setattr(task_cache, "_patch_collection", broken_patch)
+    created = await http.post(
+        "/tasks/", json={"title": "new", "description": "x"}, headers=headers
+    )
+    assert created.status_code == 200
+    assert int(await redis_client.client.get(keys[0])) == generation + 1
+    assert await redis_client.client.exists(*keys[1:]) == 0
+    assert created.json()["id"] in [task["id"] for task in await walk(http, headers)]
+
+
+@pytest.mark.parametrize("max_tasks", [5000, 1], ids=["collection", "per_task"])
+async def test_task_read_falls_back_to_the_database_without_redis(
+    http, new_user, redis_outage, monkeypatch, max_tasks
+):
+    monkeypatch.setattr(task_cache, "TASK_COLLECTION_MAX_TASKS", max_tasks)
+    headers = await new_user()
+    ids = await seed(http, headers)
+    redis_outage()
+
+    response = await http.get(f"/tasks/{ids[1]}", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["id"] == ids[1]
+    assert (await http.get(f"/tasks/{ids[1] + 1000}", headers=headers)).status_code == 404
+
+
+@pytest.mark.parametrize("read", ["task", "page"])
+async def test_read_during_a_write_cannot_cache_the_old_value_locally(
+    http, new_user, monkeypatch, read
+):
+    monkeypatch.setattr(task_cache, "TASK_L1_ENABLED", True)
+    headers = await new_user()
+    ids = await seed(http, headers)
+    url = f"/tasks/{ids[0]}" if read == "task" else "/tasks/"
+    await http.get(url, headers=headers)
+
+    # Runs the read while the write's pipeline is about to hit Redis
+    pipeline = redis_client.client.pipeline
+    interleaved = []
+
+    def reading_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        async def execute_after_read(*args, **kwargs):
+            if not interleaved:
+                interleaved.append(await http.get(url, headers=headers))
+            return await execute(*args, **kwargs)
+
+        pipe.execute = execute_after_read
+        return pipe
+
+    monkeypatch.setattr(redis_client.client, "pipeline", reading_pipeline)
+    await http.put(
+        f"/tasks/{ids[0]}", json={"title": "renamed", "description": "x"}, headers=headers
+    )
+    assert interleaved
+    body = (await http.get(url, headers=headers)).json()
+    task = body if read == "task" else body[0]
+    assert task["title"] == "renamed"
+
+
+async def test_stats_report_refills(http, new_user):
+    headers = await new_user()
+    await seed(http, headers)
+    before = TaskCacheService.stats()["stampede"]["loads"]
+    await asyncio.gather(*(http.get("/tasks/", headers=headers) for _ in range(5)))
+    assert TaskCacheService.stats()["stampede"]["loads"] > before